@@ -6,7 +6,6 @@ class BoxesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'boxes'
 
-
-def ready(self):
-    """Import signals to register them."""
-    import boxes.signals  # noqa: F401
+    def ready(self):
+        """Import signals to register them."""
+        import boxes.signals  # noqa: F401
@@ -0,0 +1,247 @@
+"""
+archive.py
+
+Static pages for archived boxes: the past boxes list and one page per
+archived box.
+
+`render_archive` renders them to ``ArchivePage`` rows. Builds are
+incremental. Each row keeps a fingerprint of the content its page was
+rendered from: the boxes and products shown, plus the templates, image
+presets and static manifest. Only pages whose fingerprint changed are
+rendered again, and pages for boxes no longer archived are removed. The
+build runs in the release phase (``manage.py render_archive``). It also
+runs after every box or product change (`refresh_archive`), so edits,
+un-archiving and deletions reach the pages straight away.
+
+Each build that changes anything starts a new archive version in the hot
+cache. `hobbyhub.middleware` checks that version when a visitor without a
+session asks for an archive page. When it has moved on, the middleware
+calls `sync_archive_files`. That writes the changed rows to
+``ARCHIVE_ROOT/pages``, one ``index.html`` per page URL, and removes pages
+that are gone. WhiteNoise then serves the files with long cache headers.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+
+from .images import IMAGE_PRESETS
+from .models import ArchivePage, Box
+from .schedule import bump_version, get_version
+
+ARCHIVE_VERSION_KEY = "archive_version"
+# Fingerprints of the pages written on this machine
+MANIFEST_NAME = 'manifest.json'
+PAGES_DIR = 'pages'
+INDEX_FILE = 'index.html'
+
+# Templates whose changes require every page to be rendered again
+ARCHIVE_TEMPLATES = [
+    'base.html',
+    'boxes/past_boxes.html',
+    'boxes/box_detail.html',
+]
+STATIC_MANIFEST = 'staticfiles.json'
+
+
+def pages_root():
+    """The directory WhiteNoise serves archive pages from."""
+    return Path(settings.ARCHIVE_ROOT) / PAGES_DIR
+
+
+def fingerprint(value):
+    """A stable hash of a JSON-serialisable value."""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def build_fingerprint():
+    """
+    Fingerprint of everything shared by all pages: the templates, the
+    image presets and the static files manifest that sets asset URLs.
+    """
+    parts = [IMAGE_PRESETS]
+    for name in ARCHIVE_TEMPLATES:
+        with open(get_template(name).origin.name, 'rb') as fp:
+            parts.append(hashlib.sha256(fp.read()).hexdigest())
+    static_manifest = Path(settings.STATIC_ROOT or '') / STATIC_MANIFEST
+    if static_manifest.is_file():
+        parts.append(hashlib.sha256(static_manifest.read_bytes()).hexdigest())
+    return fingerprint(parts)
+
+
+def box_summary(box):
+    """The box fields shown on the past boxes list."""
+    return [
+        box.slug,
+        box.name,
+        box.description,
+        str(box.image or ''),
+        box.image_derived,
+        box.shipping_date.isoformat(),
+    ]
+
+
+def box_content(box):
+    """The box and product fields shown on a box's own page."""
+    return box_summary(box) + [
+        [
+            product.id,
+            product.name,
+            product.description,
+            product.quantity,
+            str(product.image or ''),
+            product.image_derived,
+        ]
+        for product in box.products.all()
+    ]
+
+
+def page_path(root, url):
+    """The file a page URL is written to under `root`."""
+    return Path(root) / url.strip('/') / INDEX_FILE
+
+
+def archive_pages(boxes, build):
+    """
+    Yield (url, fingerprint, template, context) for every archive page.
+    """
+    yield (
+        reverse('past_boxes'),
+        fingerprint([build, [box_summary(box) for box in boxes]]),
+        'boxes/past_boxes.html',
+        {'past_boxes': boxes},
+    )
+    for box in boxes:
+        yield (
+            reverse('box_detail', args=[box.slug]),
+            fingerprint([build, box_content(box)]),
+            'boxes/box_detail.html',
+            {'box': box},
+        )
+
+
+def load_manifest(root):
+    try:
+        with open(Path(root) / MANIFEST_NAME, encoding='utf-8') as fp:
+            return json.load(fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_file(path, content):
+    """
+    Write via a temporary file so readers never see a partial page; web
+    processes on one machine may write the same page at once.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(content, encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def remove_page(root, url):
+    """Delete a page and any directories it leaves empty."""
+    path = page_path(root, url)
+    path.unlink(missing_ok=True)
+    for directory in path.parents:
+        if directory == Path(root) or not directory.is_dir():
+            break
+        if any(directory.iterdir()):
+            break
+        directory.rmdir()
+
+
+def get_archive_version():
+    """A value that changes whenever a build changes the archive pages."""
+    return get_version(ARCHIVE_VERSION_KEY)
+
+
+def render_archive(force=False):
+    """
+    Render archived box pages whose content changed since the last build.
+
+    Pages are rendered as an anonymous visitor sees them.
+
+    Args:
+        force (bool): Render every page, ignoring stored fingerprints.
+
+    Returns:
+        dict: Lists of ``rendered`` and ``removed`` URLs, and the number
+        of ``unchanged`` pages.
+    """
+    previous = dict(ArchivePage.objects.values_list('url', 'fingerprint'))
+    boxes = list(
+        Box.objects
+        .filter(is_archived=True)
+        .prefetch_related('products')
+        .order_by('-shipping_date')
+    )
+
+    urls = set()
+    result = {'rendered': [], 'removed': [], 'unchanged': 0}
+    for url, page_fingerprint, template, context in archive_pages(
+        boxes, build_fingerprint()
+    ):
+        urls.add(url)
+        if not force and previous.get(url) == page_fingerprint:
+            result['unchanged'] += 1
+            continue
+        ArchivePage.objects.update_or_create(
+            url=url,
+            defaults={
+                'fingerprint': page_fingerprint,
+                'content': render_to_string(template, context),
+            }
+        )
+        result['rendered'].append(url)
+
+    result['removed'] = sorted(set(previous) - urls)
+    if result['removed']:
+        ArchivePage.objects.filter(url__in=result['removed']).delete()
+    if result['rendered'] or result['removed']:
+        bump_version(ARCHIVE_VERSION_KEY)
+    return result
+
+
+def refresh_archive():
+    """
+    Bring the archive pages up to date once the current transaction
+    commits. Called whenever boxes or their products change.
+    """
+    transaction.on_commit(render_archive)
+
+
+def sync_archive_files():
+    """
+    Write the archive pages to this machine's ``ARCHIVE_ROOT``.
+
+    Only pages whose fingerprint differs from the copy already on disk are
+    written, and pages no longer in the archive are deleted.
+
+    Returns:
+        dict: The file of each page, by URL.
+    """
+    root = pages_root()
+    manifest_path = Path(settings.ARCHIVE_ROOT) / MANIFEST_NAME
+    written = load_manifest(settings.ARCHIVE_ROOT)
+    pages = dict(ArchivePage.objects.values_list('url', 'fingerprint'))
+
+    changed = [
+        url for url, page_fingerprint in pages.items()
+        if written.get(url) != page_fingerprint
+        or not page_path(root, url).is_file()
+    ]
+    if changed:
+        for page in ArchivePage.objects.filter(url__in=changed):
+            write_file(page_path(root, page.url), page.content)
+    for url in set(written) - set(pages):
+        remove_page(root, url)
+
+    write_file(manifest_path, json.dumps(pages, indent=2))
+    return {url: page_path(root, url) for url in pages}
@@ -0,0 +1,224 @@
+"""
+images.py
+
+Responsive delivery of box and product images from Cloudinary.
+
+Uploads are kept as they are and never sent to browsers directly. Pages
+ask for one of the presets below instead. A preset crops the image to a
+fixed aspect ratio at a few widths, with automatic format and quality. The
+browser picks a width from ``srcset`` and ``sizes``. The ratio lets pages
+give the ``<img>`` its dimensions before it loads.
+
+Building URLs is pure string work, but a page of product cards builds
+several per image. The results are cached per image and preset for the
+life of the process.
+
+Cloudinary creates each derived image the first time it is requested,
+which makes the first visitor to a new box wait. Dashboard uploads go
+through `upload_image` instead. It asks Cloudinary to generate the model's
+presets in the background straight away, and returns their URLs for the
+model's ``image_derived`` field. ``manage.py generate_derived_images``
+does the same for images uploaded earlier. `responsive_image` serves
+those URLs while they still belong to the model's current image.
+Otherwise it falls back to URLs that are transformed on request.
+"""
+import functools
+
+import cloudinary
+import cloudinary.uploader
+
+# Widths are in CSS pixels at 1x and 2x for the places each preset is used.
+IMAGE_PRESETS = {
+    # Past box and product cards (object-fit: cover, 180-220px high)
+    'card': {
+        'aspect_ratio': (4, 3),
+        'widths': (320, 480, 640, 960),
+        'sizes': '(min-width: 993px) 33vw, (min-width: 601px) 50vw, 100vw',
+    },
+    # Box images shown on their own, up to 640px wide
+    'preview': {
+        'aspect_ratio': (4, 3),
+        'widths': (320, 640, 960, 1280),
+        'sizes': '(min-width: 700px) 640px, 100vw',
+    },
+    # Home page carousel items (200px square)
+    'thumb': {
+        'aspect_ratio': (1, 1),
+        'widths': (200, 400),
+        'sizes': '200px',
+    },
+}
+
+# Cloudinary can only choose a format per request (f_auto), so images
+# generated ahead of time use one that browsers widely support.
+DERIVED_FORMAT = 'webp'
+
+
+def image_transformation(preset, width):
+    """
+    The Cloudinary transformation for an image at one width of a preset,
+    without a format.
+
+    Args:
+        preset (str): A key of IMAGE_PRESETS.
+        width (int): One of the preset's widths.
+
+    Returns:
+        dict: Options for `cloudinary.utils.cloudinary_url`.
+    """
+    ratio_width, ratio_height = IMAGE_PRESETS[preset]['aspect_ratio']
+    return {
+        'width': width,
+        'height': width * ratio_height // ratio_width,
+        'crop': 'fill',
+        'gravity': 'auto',
+        'quality': 'auto',
+    }
+
+
+@functools.lru_cache(maxsize=2048)
+def image_urls(public_id, version, preset):
+    """
+    URLs for an image at each width of a preset.
+
+    Args:
+        public_id (str): The Cloudinary public ID.
+        version (str | None): The upload version, which keeps URLs
+            distinct when an image is replaced under the same ID.
+        preset (str): A key of IMAGE_PRESETS.
+
+    Returns:
+        tuple: (width, url) pairs, narrowest first.
+    """
+    return tuple(
+        (width, cloudinary.utils.cloudinary_url(
+            public_id,
+            version=version,
+            secure=True,
+            fetch_format='auto',
+            **image_transformation(preset, width)
+        )[0])
+        for width in IMAGE_PRESETS[preset]['widths']
+    )
+
+
+def eager_transformations(presets):
+    """
+    The transformations to generate at upload for every width of `presets`.
+    """
+    return [
+        dict(image_transformation(preset, width), format=DERIVED_FORMAT)
+        for preset in presets
+        for width in IMAGE_PRESETS[preset]['widths']
+    ]
+
+
+def derived_images(image, presets):
+    """
+    The URLs of the images `eager_transformations` generates.
+
+    Args:
+        image: The uploaded CloudinaryResource.
+        presets (tuple): Keys of IMAGE_PRESETS.
+
+    Returns:
+        dict: The ``public_id`` and ``version`` of the image, and
+        ``presets`` mapping each preset to its [width, url] pairs.
+    """
+    return {
+        'public_id': image.public_id,
+        'version': str(image.version),
+        'presets': {
+            preset: [
+                [width, cloudinary.utils.cloudinary_url(
+                    image.public_id,
+                    version=image.version,
+                    secure=True,
+                    format=DERIVED_FORMAT,
+                    **image_transformation(preset, width)
+                )[0]]
+                for width in IMAGE_PRESETS[preset]['widths']
+            ]
+            for preset in presets
+        },
+    }
+
+
+def upload_image(file, presets):
+    """
+    Upload an image and have Cloudinary generate `presets` in the
+    background.
+
+    Returns:
+        tuple: (CloudinaryResource, derived images for ``image_derived``).
+    """
+    image = cloudinary.uploader.upload_resource(
+        file,
+        type='upload',
+        resource_type='image',
+        eager=eager_transformations(presets),
+        eager_async=True,
+    )
+    return image, derived_images(image, presets)
+
+
+def generate_derived(image, presets):
+    """
+    Have Cloudinary generate `presets` for an image uploaded earlier.
+
+    Returns:
+        dict: Derived images for ``image_derived``.
+    """
+    cloudinary.uploader.explicit(
+        image.public_id,
+        type='upload',
+        resource_type='image',
+        eager=eager_transformations(presets),
+        eager_async=True,
+    )
+    return derived_images(image, presets)
+
+
+def stored_urls(image, preset, derived):
+    """
+    The derived image URLs recorded for `preset`, or None when there are
+    none or they were made for a different image.
+    """
+    if (
+        not derived
+        or derived.get('public_id') != image.public_id
+        or derived.get('version') != str(image.version)
+    ):
+        return None
+    urls = derived['presets'].get(preset)
+    return [tuple(pair) for pair in urls] if urls else None
+
+
+def responsive_image(image, preset, sizes=None, derived=None):
+    """
+    The ``<img>`` attributes for showing a CloudinaryField image.
+
+    Args:
+        image: A CloudinaryResource, as stored on Box and BoxProduct.
+        preset (str): A key of IMAGE_PRESETS.
+        sizes (str): Overrides the preset's ``sizes`` attribute.
+        derived (dict): The model's ``image_derived``, used when it was
+            generated for this image.
+
+    Returns:
+        dict: ``src``, ``srcset``, ``sizes``, ``width`` and ``height``.
+        ``src`` is the narrowest width, for browsers without srcset, and
+        the dimensions are those of the widest.
+    """
+    urls = (
+        stored_urls(image, preset, derived)
+        or image_urls(image.public_id, image.version, preset)
+    )
+    widest = image_transformation(preset, urls[-1][0])
+    return {
+        'src': urls[0][1],
+        'srcset': ', '.join(f"{url} {width}w" for width, url in urls),
+        'sizes': sizes or IMAGE_PRESETS[preset]['sizes'],
+        'width': widest['width'],
+        'height': widest['height'],
+    }
@@ -0,0 +1,49 @@
+"""
+Requests the derived image sizes for box and product images that do not
+have them yet, such as those uploaded before sizes were generated at
+upload. Use ``--all`` after changing the widths of a preset.
+
+Cloudinary generates them in the background; their URLs are recorded on
+each box and product straight away.
+
+Usage:
+    python manage.py generate_derived_images
+    python manage.py generate_derived_images --all
+"""
+from django.core.management.base import BaseCommand
+
+from boxes.images import generate_derived
+from boxes.models import Box, BoxProduct
+
+
+class Command(BaseCommand):
+    help = "Generate derived sizes for existing box and product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Regenerate every image, not only those missing sizes."
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in (Box, BoxProduct):
+            for obj in model.objects.exclude(image__isnull=True).exclude(
+                image=''
+            ):
+                derived = obj.image_derived
+                if not options['all'] and (
+                    derived.get('public_id') == obj.image.public_id
+                    and derived.get('version') == str(obj.image.version)
+                    and set(derived.get('presets', {}))
+                    == set(model.IMAGE_PRESETS)
+                ):
+                    continue
+                obj.image_derived = generate_derived(
+                    obj.image, model.IMAGE_PRESETS
+                )
+                obj.save(update_fields=['image_derived'])
+                generated += 1
+                self.stdout.write(f"  {model.__name__} {obj.pk}: {obj}")
+        self.stdout.write(f"Requested derived sizes for {generated} image(s).")
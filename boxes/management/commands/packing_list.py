@@ -0,0 +1,74 @@
+"""
+Prints the packing list for a box: units per product by destination
+country, for orders not yet shipped.
+
+Usage:
+    python manage.py packing_list 12
+    python manage.py packing_list 12 --csv > october-packing.csv
+    python manage.py packing_list 12 --refresh
+"""
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from boxes.models import Box
+from boxes.packing import get_packing_list, invalidate_packing_list
+
+
+class Command(BaseCommand):
+    help = "Print the packing list for a box."
+
+    def add_arguments(self, parser):
+        parser.add_argument('box_id', type=int, help="The box to pack.")
+        parser.add_argument(
+            '--csv',
+            action='store_true',
+            help="Write CSV instead of a table."
+        )
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help="Recalculate instead of using the cached list."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            box = Box.objects.get(pk=options['box_id'])
+        except Box.DoesNotExist:
+            raise CommandError(f"Box {options['box_id']} does not exist.")
+
+        if options['refresh']:
+            invalidate_packing_list(box.id)
+        packing = get_packing_list(box)
+
+        countries = list(packing['countries'])
+        header = (
+            ['product', 'per_box']
+            + [code or 'unknown' for code in countries]
+            + ['total']
+        )
+        rows = [
+            [product['name'], product['quantity']]
+            + [product['by_country'].get(code, 0) for code in countries]
+            + [product['total']]
+            for product in packing['products']
+        ]
+
+        if options['csv']:
+            writer = csv.writer(self.stdout)
+            writer.writerow(header)
+            writer.writerows(rows)
+            return
+
+        self.stdout.write(
+            f"{box.name}: {packing['orders']} order(s) to ship, "
+            f"{packing['units']} unit(s)"
+        )
+        widths = [
+            max(len(str(value)) for value in column)
+            for column in zip(header, *rows)
+        ]
+        for row in [header] + rows:
+            self.stdout.write('  '.join(
+                str(value).ljust(width) for value, width in zip(row, widths)
+            ))
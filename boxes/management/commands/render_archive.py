@@ -0,0 +1,39 @@
+"""
+Renders archived box pages to static HTML for WhiteNoise to serve.
+
+Only pages whose boxes, products or templates changed since the last
+build are rendered again. It runs in the release phase, so template
+changes reach the pages on deploy. Box and product changes re-render
+pages as they are saved, and web processes pick up new pages on their
+next archive request.
+
+Usage:
+    python manage.py render_archive
+    python manage.py render_archive --force
+"""
+from django.core.management.base import BaseCommand
+
+from boxes.archive import render_archive
+
+
+class Command(BaseCommand):
+    help = "Pre-render archived box pages to static HTML."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Render every page, not only those that changed."
+        )
+
+    def handle(self, *args, **options):
+        result = render_archive(force=options['force'])
+        for url in result['rendered']:
+            self.stdout.write(f"  rendered {url}")
+        for url in result['removed']:
+            self.stdout.write(f"  removed  {url}")
+        self.stdout.write(
+            f"Rendered {len(result['rendered'])} page(s), "
+            f"{result['unchanged']} unchanged, "
+            f"{len(result['removed'])} removed."
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(fields=['is_archived', 'shipping_date'], name='boxes_box_is_arch_bab525_idx'),
+        ),
+    ]
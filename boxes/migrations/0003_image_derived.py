@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0002_box_schedule_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='box',
+            name='image_derived',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the image generated at upload.'),
+        ),
+        migrations.AddField(
+            model_name='boxproduct',
+            name='image_derived',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the image generated at upload.'),
+        ),
+    ]
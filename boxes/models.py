@@ -19,10 +19,25 @@ class Box(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField()
     image = CloudinaryField('image', null=True, blank=True)
+    image_derived = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized copies of the image generated at upload."
+    )
     shipping_date = models.DateField()
     is_archived = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Image presets (boxes.images) this model's images are shown in
+    IMAGE_PRESETS = ('card', 'preview')
+
+    class Meta:
+        indexes = [
+            # Box schedule lookups: unarchived boxes by shipping date
+            models.Index(fields=['is_archived', 'shipping_date']),
+        ]
+
     def generate_slug(self):
         """Generate slug from name if missing."""
         if not self.slug:
@@ -66,6 +81,12 @@ class BoxProduct(models.Model):
         null=True,
         blank=True
     )
+    image_derived = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized copies of the image generated at upload."
+    )
     description = models.TextField(
         blank=True,
         help_text=(
@@ -77,5 +98,26 @@ class BoxProduct(models.Model):
         help_text="Quantity of this product included in the box."
     )
 
+    # Image presets (boxes.images) this model's images are shown in
+    IMAGE_PRESETS = ('card', 'thumb')
+
     def __str__(self):
         return f"{self.name} (x{self.quantity})"
+
+
+class ArchivePage(models.Model):
+    """
+    A pre-rendered page of the box archive (see boxes.archive).
+
+    Rows are the build itself: each page's HTML and a fingerprint of the
+    content it was rendered from. They survive deploys and restarts, so
+    only pages whose content changed are rendered again. Every web process
+    writes them out as static files for WhiteNoise.
+    """
+    url = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    content = models.TextField()
+    rendered_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.url
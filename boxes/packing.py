@@ -0,0 +1,108 @@
+"""
+packing.py
+
+Packing lists: total units of each product in a box, by destination
+country, for the orders still to ship.
+
+A list is computed with one aggregate query over the box's orders joined
+to its products, then cached. Signals in `boxes.signals` drop the cached
+list when an order, product or shipping address for the box changes.
+Code that changes them with `QuerySet.update()`, which sends no signals,
+calls `invalidate_packing_list()` itself.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from orders.models import Order
+
+# Orders that still need packing
+TO_SHIP_STATUSES = ['pending', 'processing']
+
+# Safety net only; changes invalidate the list straight away.
+PACKING_LIST_TIMEOUT = 24 * 3600
+
+UNKNOWN_COUNTRY = ''
+
+
+def packing_list_key(box_id):
+    return f"packing_list:{box_id}"
+
+
+def invalidate_packing_list(*box_ids):
+    """
+    Drop the cached packing lists for these boxes; None ids are ignored.
+    """
+    keys = [packing_list_key(box_id) for box_id in box_ids if box_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def compute_packing_list(box):
+    """
+    Aggregate units per product and country for a box in a single query.
+
+    Each order is joined to every product in its box, so summing the
+    product quantity per (product, country) group gives quantity times the
+    number of orders to ship there.
+
+    Returns:
+        dict: ``products`` (each with ``id``, ``name``, ``quantity``,
+        ``by_country`` and ``total``), ``countries`` with their order
+        counts, the overall ``orders`` and ``units``, and ``computed_at``.
+    """
+    rows = (
+        Order.objects
+        .filter(
+            box=box,
+            status__in=TO_SHIP_STATUSES,
+            box__products__isnull=False
+        )
+        .values(
+            'box__products__id',
+            'box__products__name',
+            'box__products__quantity',
+            'shipping_address__country',
+        )
+        .annotate(
+            orders=Count('id'),
+            units=Sum('box__products__quantity'),
+        )
+        .order_by('box__products__name', 'box__products__id')
+    )
+
+    products = {}
+    countries = {}
+    for row in rows:
+        country = row['shipping_address__country'] or UNKNOWN_COUNTRY
+        product = products.setdefault(row['box__products__id'], {
+            'id': row['box__products__id'],
+            'name': row['box__products__name'],
+            'quantity': row['box__products__quantity'],
+            'by_country': {},
+            'total': 0,
+        })
+        product['by_country'][country] = row['units']
+        product['total'] += row['units']
+        # Every product row counts the same orders for a country
+        countries[country] = row['orders']
+
+    return {
+        'products': list(products.values()),
+        'countries': dict(sorted(countries.items())),
+        'orders': sum(countries.values()),
+        'units': sum(product['total'] for product in products.values()),
+        'computed_at': timezone.now(),
+    }
+
+
+def get_packing_list(box):
+    """
+    The packing list for a box, from the cache when it is still valid.
+    """
+    key = packing_list_key(box.id)
+    packing_list = cache.get(key)
+    if packing_list is None:
+        packing_list = compute_packing_list(box)
+        cache.set(key, packing_list, PACKING_LIST_TIMEOUT)
+    return packing_list
@@ -0,0 +1,170 @@
+"""
+schedule.py
+
+The box schedule: which boxes are current, next and shippable today.
+
+- current: the latest unarchived box that has already shipped (home page).
+- next: the unarchived box shipping next calendar month (home page).
+- shippable: the unarchived box with the latest shipping date, which new
+  orders are assigned to (Stripe webhook handlers).
+
+All three are resolved together with shipping date range filters that the
+(is_archived, shipping_date) index can serve. The result is cached for the
+day under the current box version. Signals in `boxes.signals` move the
+version on whenever a box or box product is saved or deleted. Code that
+changes boxes with `QuerySet.update()` calls `invalidate_box_schedule()`
+itself.
+
+These keys live in the ``hot`` cache, which is Redis in production.
+Anything built from box data, such as the cached home page, is keyed on
+the box version too. Each process also memoizes these values in memory
+(`memoize_for_version`), so a request only reads the version key.
+"""
+import time
+from datetime import date
+
+from django.core.cache import caches
+
+from .models import Box
+
+CACHE_ALIAS = 'hot'
+BOX_SCHEDULE_KEY = "box_schedule"
+BOX_VERSION_KEY = "box_version"
+
+# Safety net only; box changes move the box version straight away.
+BOX_SCHEDULE_TIMEOUT = 3600
+
+# name: (key, value) for values memoized in this process
+_memo = {}
+
+
+def next_month_range(today):
+    """
+    The first day of next month and of the month after, for a half-open
+    ``shipping_date`` range.
+    """
+    start = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def compute_box_schedule(today):
+    """
+    Resolve the current, next and shippable boxes for `today`.
+
+    Returns:
+        dict: ``date`` plus the ``current``, ``next`` and ``shippable``
+        Box instances (each may be None).
+    """
+    active = Box.objects.filter(is_archived=False)
+    start, end = next_month_range(today)
+    return {
+        'date': today,
+        'current': (
+            active.filter(shipping_date__lte=today)
+            .order_by('-shipping_date')
+            .first()
+        ),
+        'next': (
+            active.filter(shipping_date__gte=start, shipping_date__lt=end)
+            .order_by('shipping_date')
+            .first()
+        ),
+        'shippable': active.order_by('-shipping_date').first(),
+    }
+
+
+def bump_version(key):
+    """Start a new version under `key` in the hot cache and return it."""
+    version = time.time_ns()
+    caches[CACHE_ALIAS].set(key, version, None)
+    return version
+
+
+def get_version(key):
+    """
+    The current version under `key`, started if there is none.
+
+    Timestamps rather than a counter, so a version lost from the cache is
+    never reissued and cannot bring back values cached under it.
+    """
+    version = caches[CACHE_ALIAS].get(key)
+    if version is None:
+        version = bump_version(key)
+    return version
+
+
+def bump_box_version():
+    """Start a new box version and return it."""
+    return bump_version(BOX_VERSION_KEY)
+
+
+def get_box_version():
+    """A value that changes whenever boxes or their products change."""
+    return get_version(BOX_VERSION_KEY)
+
+
+def invalidate_box_schedule():
+    """
+    Start a new box version after boxes or their products change, which
+    retires the cached schedule and everything else built from box data.
+    """
+    bump_box_version()
+
+
+def memoize_for_version(name, key, load):
+    """
+    The value `load()` returns, kept in this process until `key` changes.
+
+    `key` must include the box version, so that a change made in any
+    process is picked up on the next request here.
+    """
+    memo = _memo.get(name)
+    if memo is None or memo[0] != key:
+        memo = _memo[name] = (key, load())
+    return memo[1]
+
+
+def load_box_schedule(today, version):
+    """
+    The schedule for `today` from the hot cache, computed and stored there
+    on a miss or when the cached copy is from an earlier day.
+    """
+    key = f"{BOX_SCHEDULE_KEY}:{version}"
+    schedule = caches[CACHE_ALIAS].get(key)
+    if schedule is None or schedule['date'] != today:
+        schedule = compute_box_schedule(today)
+        caches[CACHE_ALIAS].set(key, schedule, BOX_SCHEDULE_TIMEOUT)
+    return schedule
+
+
+def get_box_schedule(today=None):
+    """
+    The box schedule for today.
+
+    It is memoized in this process for the current box version and date.
+    Other processes share it through the hot cache. It is recomputed on a
+    new day, since which box is current depends on the date.
+    """
+    today = today or date.today()
+    version = get_box_version()
+    return memoize_for_version(
+        'box_schedule',
+        (version, today),
+        lambda: load_box_schedule(today, version)
+    )
+
+
+def get_current_box():
+    """The latest unarchived box that has shipped, or None."""
+    return get_box_schedule()['current']
+
+
+def get_next_box():
+    """The unarchived box shipping next month, or None."""
+    return get_box_schedule()['next']
+
+
+def get_shippable_box():
+    """The unarchived box new orders go into, or None."""
+    return get_box_schedule()['shippable']
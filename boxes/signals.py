@@ -1,14 +1,31 @@
 """
-Signal handlers for cleaning up Cloudinary images when Box or BoxProduct
-instances are deleted.
+Signal handlers for:
+- cleaning up Cloudinary images when Box or BoxProduct instances are
+  deleted.
+- dropping cached packing lists when a box's orders, products or their
+  shipping addresses change.
+- dropping the cached box schedule, and with it the cached home page,
+  when a box or box product is saved or deleted.
+- re-rendering the archive pages after such changes.
 """
 import logging
 
 from cloudinary.uploader import destroy
-from django.db.models.signals import post_delete
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_save,
+)
 from django.dispatch import receiver
 
+from orders.models import Order
+from users.models import ShippingAddress
+
+from .archive import refresh_archive
 from .models import Box, BoxProduct
+from .packing import invalidate_packing_list
+from .schedule import invalidate_box_schedule
 
 logger = logging.getLogger(__name__)
 
@@ -46,3 +63,86 @@ def delete_box_image(sender, instance, **kwargs):
             f"Deleted Cloudinary image for {instance} "
             "(public_id={instance.image.public_id})"
         )
+
+
+@receiver(post_delete, sender=Box)
+def invalidate_deleted_box_packing_list(sender, instance, **kwargs):
+    """
+    Drop the packing list of a deleted box.
+    """
+    invalidate_packing_list(instance.id)
+
+
+@receiver(post_save, sender=Box)
+@receiver(post_delete, sender=Box)
+@receiver(post_save, sender=BoxProduct)
+@receiver(post_delete, sender=BoxProduct)
+def invalidate_schedule(sender, instance, **kwargs):
+    """
+    A box's date or archive flag may have changed the schedule, and any
+    box or product change alters pages showing them.
+    """
+    invalidate_box_schedule()
+
+
+@receiver(post_save, sender=Box)
+@receiver(post_delete, sender=Box)
+@receiver(post_save, sender=BoxProduct)
+@receiver(post_delete, sender=BoxProduct)
+def refresh_archive_pages(sender, instance, **kwargs):
+    """
+    Edits, un-archiving, deletions and product moves can all change the
+    archive pages; only those whose content changed are rendered again.
+    """
+    refresh_archive()
+
+
+@receiver(post_init, sender=Order)
+@receiver(post_init, sender=BoxProduct)
+def remember_loaded_box(sender, instance, **kwargs):
+    """
+    Remember the box an order or product was loaded with, so saving it can
+    tell whether it moved without querying. A deferred box_id is left
+    unread rather than fetched.
+    """
+    instance._loaded_box_id = instance.__dict__.get('box_id')
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=BoxProduct)
+def invalidate_previous_packing_list(sender, instance, **kwargs):
+    """
+    Drop the packing list of the box an order or product is moving from.
+
+    Bulk `update()` calls that move orders or products between boxes
+    invalidate both boxes' lists themselves.
+    """
+    previous_box_id = getattr(instance, '_loaded_box_id', None)
+    if instance.pk and previous_box_id != instance.box_id:
+        invalidate_packing_list(previous_box_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=BoxProduct)
+@receiver(post_delete, sender=BoxProduct)
+def invalidate_box_packing_list(sender, instance, **kwargs):
+    """
+    Drop the packing list of the box an order or product belongs to.
+    """
+    invalidate_packing_list(instance.box_id)
+    instance._loaded_box_id = instance.box_id
+
+
+@receiver(post_save, sender=ShippingAddress)
+def invalidate_address_packing_lists(sender, instance, created, **kwargs):
+    """
+    An address can change country, so drop the lists of boxes it ships.
+    """
+    if created:
+        return
+    invalidate_packing_list(*(
+        Order.objects.filter(shipping_address=instance)
+        .values_list('box_id', flat=True)
+        .distinct()
+    ))
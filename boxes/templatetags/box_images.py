@@ -0,0 +1,44 @@
+"""
+Template tags for box and product images.
+
+Includes:
+- image_attrs: the attributes of a responsive ``<img>`` for a
+  CloudinaryField image (see boxes.images).
+"""
+from django import template
+from django.utils.html import format_html
+
+from boxes.images import responsive_image
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_attrs(image, preset, sizes=None, loading='lazy', derived=None):
+    """
+    Renders ``src``, ``srcset``, ``sizes``, ``width``, ``height`` and
+    ``loading`` attributes for an image.
+
+    Usage:
+        <img {% image_attrs box.image 'card' derived=box.image_derived %}
+             alt="{{ box.name }}">
+
+    Args:
+        image: A CloudinaryField value.
+        preset (str): A key of boxes.images.IMAGE_PRESETS.
+        sizes (str): Overrides the preset's ``sizes`` attribute.
+        loading (str): ``'lazy'``, or ``'eager'`` for images shown at the
+            top of the page.
+        derived (dict): The model's ``image_derived``, so images generated
+            at upload are served.
+
+    Returns:
+        str: Safe HTML attributes.
+    """
+    attrs = responsive_image(image, preset, sizes, derived)
+    return format_html(
+        'src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'loading="{}" decoding="async"',
+        attrs['src'], attrs['srcset'], attrs['sizes'],
+        attrs['width'], attrs['height'], loading,
+    )
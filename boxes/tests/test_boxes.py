@@ -1,9 +1,25 @@
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+
+import cloudinary
+import cloudinary.uploader
 import pytest
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.utils import timezone
-from boxes.models import Box
+from boxes import archive, images, packing, schedule
+from boxes.models import ArchivePage, Box, BoxProduct
+from dashboard.views import ship_box_orders
+from hobbyhub.middleware import ArchiveWhiteNoiseMiddleware
+from orders.models import Order
+from users.models import ShippingAddress
 
 User = get_user_model()
 
@@ -104,3 +120,516 @@ class TestBoxDetailView:
             reverse('box_detail', args=['non-existent-slug'])
         )
         assert response.status_code == 404
+
+
+@pytest.mark.django_db
+class TestPackingList:
+
+    def setup_method(self):
+        """
+        A box with two products and orders to ship to two countries.
+        """
+        cache.clear()
+        self.user = User.objects.create(
+            username="packer",
+            email="packer@example.com"
+        )
+        self.box = Box.objects.create(
+            name="Packing Box",
+            description="Box to pack.",
+            shipping_date=timezone.now().date()
+        )
+        self.paints = BoxProduct.objects.create(
+            box=self.box, name="Paint Set", quantity=3
+        )
+        self.brush = BoxProduct.objects.create(
+            box=self.box, name="Brush", quantity=1
+        )
+        self.addresses = {
+            country: ShippingAddress.objects.create(
+                user=self.user,
+                recipient_f_name='Jo',
+                recipient_l_name='Bloggs',
+                address_line_1='1 High Street',
+                town_or_city='Town',
+                postcode='AB1 2CD',
+                country=country,
+                phone_number='0123456789'
+            )
+            for country in ('GB', 'IE')
+        }
+        for country, count in (('GB', 2), ('IE', 1)):
+            for _ in range(count):
+                Order.objects.create(
+                    user=self.user,
+                    box=self.box,
+                    shipping_address=self.addresses[country],
+                    status='processing'
+                )
+        Order.objects.create(
+            user=self.user,
+            box=self.box,
+            shipping_address=self.addresses['GB'],
+            status='shipped'
+        )
+
+    def test_units_per_product_and_country(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            result = packing.compute_packing_list(self.box)
+
+        assert result['orders'] == 3
+        assert result['countries'] == {'GB': 2, 'IE': 1}
+        assert result['units'] == 12
+        paints = result['products'][1]
+        assert paints['name'] == "Paint Set"
+        assert paints['by_country'] == {'GB': 6, 'IE': 3}
+        assert paints['total'] == 9
+
+    @patch(
+        'boxes.packing.compute_packing_list',
+        wraps=packing.compute_packing_list
+    )
+    def test_list_is_cached_until_box_changes(self, mock_compute):
+        packing.get_packing_list(self.box)
+        packing.get_packing_list(self.box)
+        assert mock_compute.call_count == 1
+
+        Order.objects.create(
+            user=self.user,
+            box=self.box,
+            shipping_address=self.addresses['IE'],
+            status='processing'
+        )
+        assert packing.get_packing_list(self.box)['countries']['IE'] == 2
+
+        self.brush.quantity = 2
+        self.brush.save()
+        assert packing.get_packing_list(self.box)['units'] == 20
+        assert mock_compute.call_count == 3
+
+    def test_address_country_change_refreshes_list(self):
+        packing.get_packing_list(self.box)
+
+        self.addresses['IE'].country = 'FR'
+        self.addresses['IE'].save()
+
+        assert packing.get_packing_list(self.box)['countries'] == {
+            'FR': 1, 'GB': 2
+        }
+
+    def test_product_moved_to_another_box_refreshes_both(self):
+        other_box = Box.objects.create(
+            name="Other Box",
+            description="Another box.",
+            shipping_date=timezone.now().date()
+        )
+        packing.get_packing_list(self.box)
+        packing.get_packing_list(other_box)
+
+        self.brush.box = other_box
+        self.brush.save()
+
+        assert packing.get_packing_list(self.box)['units'] == 9
+        assert packing.get_packing_list(other_box)['products'] == []
+
+    def test_order_moved_to_another_box_refreshes_both(self):
+        other_box = Box.objects.create(
+            name="Other Box",
+            description="Another box.",
+            shipping_date=timezone.now().date()
+        )
+        BoxProduct.objects.create(box=other_box, name="Glue", quantity=1)
+        packing.get_packing_list(self.box)
+        packing.get_packing_list(other_box)
+
+        order = Order.objects.filter(status='processing').first()
+        order.box = other_box
+        order.save()
+
+        assert packing.get_packing_list(self.box)['orders'] == 2
+        assert packing.get_packing_list(other_box)['orders'] == 1
+
+    def test_saving_an_order_does_not_look_up_its_box(
+        self, django_assert_num_queries
+    ):
+        order = Order.objects.filter(status='processing').first()
+        order.status = 'shipped'
+
+        # The UPDATE and one cache delete, with no SELECT of the old box
+        with django_assert_num_queries(2):
+            order.save()
+
+    def test_shipping_the_box_empties_list(self):
+        packing.get_packing_list(self.box)
+
+        ship_box_orders(self.box)
+
+        assert packing.get_packing_list(self.box)['orders'] == 0
+
+    def test_packing_list_view(self):
+        admin = User.objects.create(username="staff", is_staff=True)
+        client = Client()
+        client.force_login(admin)
+
+        response = client.get(reverse('packing_list', args=[self.box.id]))
+
+        assert response.status_code == 200
+        assert response.context['countries'][0] == ('GB', 'United Kingdom', 2)
+        assert ('Paint Set', [6, 3]) in [
+            (product['name'], units)
+            for product, units in response.context['rows']
+        ]
+
+    def test_packing_list_command_csv(self):
+        out = StringIO()
+
+        call_command('packing_list', str(self.box.id), '--csv', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        assert lines[0] == 'product,per_box,GB,IE,total'
+        assert 'Paint Set,3,6,3,9' in lines
+
+
+@pytest.mark.django_db
+class TestBoxSchedule:
+
+    def setup_method(self):
+        """
+        Boxes shipped last month, shipping this month and next month, plus
+        an archived box in the future.
+        """
+        cache.clear()
+        self.today = date(2025, 12, 10)
+        self.shipped = Box.objects.create(
+            name="November Box", slug="november-box",
+            shipping_date=date(2025, 11, 28)
+        )
+        self.upcoming = Box.objects.create(
+            name="December Box", slug="december-box",
+            shipping_date=date(2025, 12, 20)
+        )
+        self.next_month = Box.objects.create(
+            name="January Box", slug="january-box",
+            shipping_date=date(2026, 1, 15)
+        )
+        Box.objects.create(
+            name="Archived Box", slug="archived-box",
+            shipping_date=date(2026, 2, 1), is_archived=True
+        )
+
+    def test_next_month_range_rolls_over_the_year(self):
+        assert schedule.next_month_range(date(2025, 12, 31)) == (
+            date(2026, 1, 1), date(2026, 2, 1)
+        )
+        assert schedule.next_month_range(date(2025, 11, 1)) == (
+            date(2025, 12, 1), date(2026, 1, 1)
+        )
+
+    def test_resolves_current_next_and_shippable(self):
+        result = schedule.compute_box_schedule(self.today)
+
+        assert result['current'] == self.shipped
+        assert result['next'] == self.next_month
+        assert result['shippable'] == self.next_month
+
+    def test_schedule_is_cached_until_a_box_changes(
+        self, django_assert_num_queries
+    ):
+        schedule.get_box_schedule(self.today)
+        # One read of the box version, no box queries
+        with django_assert_num_queries(1):
+            cached = schedule.get_box_schedule(self.today)
+        assert cached['next'] == self.next_month
+
+        # Another process reads the version and the shared schedule
+        schedule._memo.clear()
+        with django_assert_num_queries(2):
+            shared = schedule.get_box_schedule(self.today)
+        assert shared['next'] == self.next_month
+
+        self.next_month.is_archived = True
+        self.next_month.save()
+        result = schedule.get_box_schedule(self.today)
+        assert result['next'] is None
+        assert result['shippable'] == self.upcoming
+
+        self.upcoming.delete()
+        assert schedule.get_box_schedule(self.today)['shippable'] == (
+            self.shipped
+        )
+
+    def test_schedule_is_recomputed_on_a_new_day(self):
+        schedule.get_box_schedule(self.today)
+
+        later = schedule.get_box_schedule(date(2025, 12, 21))
+
+        assert later['date'] == date(2025, 12, 21)
+        assert later['current'] == self.upcoming
+
+
+@pytest.mark.django_db
+class TestArchive:
+
+    @pytest.fixture(autouse=True)
+    def archive_root(self, tmp_path):
+        """
+        Two archived boxes, one with a product, and an active box, with
+        page files written to a temporary ARCHIVE_ROOT.
+        """
+        self.root = tmp_path
+        self.older = Box.objects.create(
+            name="Autumn Box", slug="autumn-box",
+            shipping_date=date(2025, 10, 1), is_archived=True
+        )
+        self.newer = Box.objects.create(
+            name="Winter Box", slug="winter-box",
+            shipping_date=date(2025, 11, 1), is_archived=True
+        )
+        self.product = BoxProduct.objects.create(
+            box=self.newer, name="Brush Set", quantity=2
+        )
+        Box.objects.create(
+            name="Active Box", slug="active-box",
+            shipping_date=date(2025, 12, 1)
+        )
+        self.index = reverse('past_boxes')
+        self.autumn = reverse('box_detail', args=['autumn-box'])
+        self.winter = reverse('box_detail', args=['winter-box'])
+        with override_settings(ARCHIVE_ROOT=tmp_path):
+            yield
+
+    def page(self, url):
+        return ArchivePage.objects.get(url=url).content
+
+    def page_file(self, url):
+        return archive.page_path(archive.pages_root(), url)
+
+    def test_first_build_renders_every_page(self):
+        result = archive.render_archive()
+
+        assert sorted(result['rendered']) == sorted([
+            self.index, self.autumn, self.winter
+        ])
+        assert result['unchanged'] == 0
+        assert "Winter Box" in self.page(self.index)
+        assert "Active Box" not in self.page(self.index)
+        assert "Brush Set" in self.page(self.winter)
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        archive.render_archive()
+        version = archive.get_archive_version()
+
+        result = archive.render_archive()
+
+        assert result['rendered'] == []
+        assert result['unchanged'] == 3
+        assert archive.get_archive_version() == version
+
+    def test_product_change_renders_only_its_box(self):
+        archive.render_archive()
+        self.product.name = "Palette Knife"
+        self.product.save()
+
+        result = archive.render_archive()
+
+        assert result['rendered'] == [self.winter]
+        assert "Palette Knife" in self.page(self.winter)
+
+    def test_unarchived_box_page_is_removed(self):
+        archive.render_archive()
+        self.older.is_archived = False
+        self.older.save()
+
+        result = archive.render_archive()
+
+        assert result['removed'] == [self.autumn]
+        assert result['rendered'] == [self.index]
+        assert not ArchivePage.objects.filter(url=self.autumn).exists()
+
+    def test_force_renders_every_page(self):
+        archive.render_archive()
+
+        result = archive.render_archive(force=True)
+
+        assert len(result['rendered']) == 3
+
+    def test_box_changes_rebuild_pages_on_commit(
+        self, django_capture_on_commit_callbacks
+    ):
+        archive.render_archive()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.product.name = "Palette Knife"
+            self.product.save()
+        assert "Palette Knife" in self.page(self.winter)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.older.delete()
+        assert not ArchivePage.objects.filter(url=self.autumn).exists()
+        assert "Autumn Box" not in self.page(self.index)
+
+    def test_bulk_product_moves_rebuild_pages(
+        self, admin_user, django_capture_on_commit_callbacks
+    ):
+        archive.render_archive()
+        glue = BoxProduct.objects.create(name="Glue", quantity=1)
+        client = Client()
+        client.force_login(admin_user)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(
+                reverse('assign_orphaned_to_box', args=[self.older.id]),
+                {'product_ids': [glue.id]}
+            )
+
+        assert "Glue" in self.page(self.autumn)
+
+    def test_sync_writes_only_changed_pages(self):
+        archive.render_archive()
+        files = archive.sync_archive_files()
+        assert files[self.winter] == self.page_file(self.winter)
+        assert "Brush Set" in self.page_file(self.winter).read_text()
+
+        self.product.name = "Palette Knife"
+        self.product.save()
+        self.older.is_archived = False
+        self.older.save()
+        archive.render_archive()
+        with patch('boxes.archive.write_file',
+                   wraps=archive.write_file) as write_file:
+            archive.sync_archive_files()
+
+        written = {call.args[0] for call in write_file.call_args_list}
+        # The index, the changed box page and the local manifest
+        assert written == {
+            self.page_file(self.index),
+            self.page_file(self.winter),
+            self.root / archive.MANIFEST_NAME,
+        }
+        assert "Palette Knife" in self.page_file(self.winter).read_text()
+        assert not self.page_file(self.autumn).exists()
+
+    def test_middleware_serves_pages_to_anonymous_visitors(self):
+        archive.render_archive()
+        middleware = ArchiveWhiteNoiseMiddleware(
+            lambda request: HttpResponse("from the view")
+        )
+        factory = RequestFactory()
+
+        response = middleware(factory.get(self.winter))
+        assert b"Brush Set" in b''.join(response.streaming_content)
+        assert response["Cache-Control"] == (
+            f"max-age={settings.ARCHIVE_MAX_AGE}, public"
+        )
+        assert response["Vary"] == "Cookie"
+
+        request = factory.get(self.winter, HTTP_COOKIE="sessionid=abc")
+        assert middleware(request).content == b"from the view"
+        request = factory.post(self.winter)
+        assert middleware(request).content == b"from the view"
+
+    def test_middleware_picks_up_new_builds_without_restart(self):
+        archive.render_archive()
+        middleware = ArchiveWhiteNoiseMiddleware(
+            lambda request: HttpResponse("from the view")
+        )
+        factory = RequestFactory()
+        middleware(factory.get(self.winter))
+
+        self.product.name = "Palette Knife"
+        self.product.save()
+        self.older.is_archived = False
+        self.older.save()
+        archive.render_archive()
+
+        response = middleware(factory.get(self.winter))
+        assert b"Palette Knife" in b''.join(response.streaming_content)
+        response = middleware(factory.get(self.autumn))
+        assert response.content == b"from the view"
+
+
+@pytest.mark.django_db
+class TestResponsiveImages:
+
+    @pytest.fixture(autouse=True)
+    def cloudinary_config(self):
+        """
+        An archived box with an image, a configured cloud name and no URLs
+        left over from other tests.
+        """
+        images.image_urls.cache_clear()
+        self.box = Box.objects.create(
+            name="Paint Box", slug="paint-box",
+            shipping_date=date(2025, 10, 1), is_archived=True,
+            image="image/upload/v1700000000/boxes/paint.jpg"
+        )
+        self.box.refresh_from_db()
+        with patch.object(cloudinary.config(), 'cloud_name', 'hobbyhub'):
+            yield
+
+    def test_image_attrs_renders_a_responsive_image(self):
+        html = Template(
+            "{% load box_images %}<img {% image_attrs image 'card' %}>"
+        ).render(Context({'image': self.box.image}))
+
+        for width in images.IMAGE_PRESETS['card']['widths']:
+            assert (
+                f"c_fill,f_auto,g_auto,h_{width * 3 // 4},q_auto,w_{width}"
+                f"/v1700000000/boxes/paint {width}w"
+            ) in html
+        assert 'sizes="(min-width: 993px) 33vw' in html
+        assert 'width="960" height="720"' in html
+        assert 'loading="lazy"' in html
+
+    def test_urls_are_built_once_per_image(self):
+        template = Template(
+            "{% load box_images %}{% for image in images %}"
+            "<img {% image_attrs image 'card' loading='eager' %}>"
+            "{% endfor %}"
+        )
+        with patch.object(
+            cloudinary.utils, 'cloudinary_url',
+            wraps=cloudinary.utils.cloudinary_url
+        ) as cloudinary_url:
+            html = template.render(Context({'images': [self.box.image] * 100}))
+
+        assert html.count('loading="eager"') == 100
+        assert cloudinary_url.call_count == len(
+            images.IMAGE_PRESETS['card']['widths']
+        )
+
+    def test_derived_images_are_used_while_current(self):
+        template = Template(
+            "{% load box_images %}<img {% image_attrs box.image 'card' "
+            "derived=box.image_derived %}>"
+        )
+        self.box.image_derived = images.derived_images(
+            self.box.image, Box.IMAGE_PRESETS
+        )
+        html = template.render(Context({'box': self.box}))
+        assert "h_720,q_auto,w_960/v1700000000/boxes/paint.webp 960w" in html
+        assert "f_auto" not in html
+
+        # Recorded for an earlier upload of the image
+        self.box.image_derived['version'] = '1600000000'
+        html = template.render(Context({'box': self.box}))
+        assert ".webp" not in html
+        assert "f_auto" in html
+
+    def test_generate_derived_images_command(self):
+        with patch.object(cloudinary.uploader, 'explicit') as explicit:
+            call_command('generate_derived_images', stdout=StringIO())
+            call_command('generate_derived_images', stdout=StringIO())
+
+        explicit.assert_called_once()
+        assert explicit.call_args.args == ('boxes/paint',)
+        assert explicit.call_args.kwargs['eager_async'] is True
+        self.box.refresh_from_db()
+        assert set(self.box.image_derived['presets']) == {'card', 'preview'}
+
+    def test_past_boxes_page_uses_responsive_images(self):
+        response = Client().get(reverse('past_boxes'))
+
+        content = response.content.decode()
+        assert 'srcset="https://res.cloudinary.com/hobbyhub/' in content
+        assert "/v1700000000/boxes/paint.jpg" not in content
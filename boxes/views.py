@@ -17,24 +17,29 @@ def past_boxes(request):
     """
     View to display a list of all archived boxes, ordered by most recent
     shipping date.
+
+    Anonymous visitors are normally served the copy pre-rendered by
+    ``manage.py render_archive`` instead.
     """
     past_boxes = (
         Box.objects
         .filter(is_archived=True)
         .order_by('-shipping_date')
     )
-    logger.info(
-        f"{request.user} viewed archived boxes page — "
-        f"{past_boxes.count()} boxes found"
-    )
+    logger.info(f"{request.user} viewed archived boxes page")
     return render(request, 'boxes/past_boxes.html', {'past_boxes': past_boxes})
 
 
 def box_detail(request, slug):
     """
     View to display details of a single box based on its slug.
+
+    Archived boxes are normally served to anonymous visitors from pages
+    pre-rendered by ``manage.py render_archive``.
     """
-    box = get_object_or_404(Box, slug=slug)
+    box = get_object_or_404(
+        Box.objects.prefetch_related('products'), slug=slug
+    )
     logger.info(
         f"{request.user} viewed box detail page for: {box.name} (slug: {slug})"
     )
@@ -9,11 +9,15 @@ users.
 - UserEditForm: allows admin users to update username, email, and staff status
 
 All forms use MaterializeCSS-friendly widgets for consistent styling.
+Box and product images are uploaded with their derived sizes requested
+up front (see DerivedImagesMixin).
 """
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
 from datetime import timedelta, date
 from django.core.exceptions import ValidationError
+from boxes.images import upload_image
 from boxes.models import Box, BoxProduct
 
 User = get_user_model()
@@ -25,7 +29,30 @@ def last_day_of_month(any_day):
     return next_month - timedelta(days=next_month.day)
 
 
-class BoxForm(forms.ModelForm):
+class DerivedImagesMixin:
+    """
+    Uploads a new ``image`` when the form is saved, asking Cloudinary to
+    generate the model's IMAGE_PRESETS in the background, and records
+    their URLs in ``image_derived`` so pages never wait for a transform.
+    """
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            instance.image, instance.image_derived = upload_image(
+                image, instance.IMAGE_PRESETS
+            )
+        elif not instance.image:
+            instance.image_derived = {}
+
+        if commit:
+            instance.save()
+            self._save_m2m()
+        return instance
+
+
+class BoxForm(DerivedImagesMixin, forms.ModelForm):
     """
     Form for creating and editing Box instances in the admin dashboard.
     Includes custom input formats for the shipping date field to support both
@@ -129,7 +156,7 @@ class BoxForm(forms.ModelForm):
         }
 
 
-class ProductForm(forms.ModelForm):
+class ProductForm(DerivedImagesMixin, forms.ModelForm):
     """
     Form for creating and editing BoxProduct instances.
     Supports linking products to a box.
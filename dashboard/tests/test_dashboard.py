@@ -4,25 +4,42 @@ Tests for Dashboard Forms and Views:
 - Automatic archival of past-dated Boxes
 - File upload validation for image files
 - Integration tests for Create, Edit, and Image Handling in the dashboard
+- Paging, searching and filtering the user admin
+- Fixed query count for a user's order history
+- Shipping every processing order for a box in one action
+- Streaming fulfilment exports of orders with addresses
+- Failed webhook (dead letter) listing and bulk replay
 """
 
+import csv
 import json
 from datetime import timedelta
 from io import BytesIO
 from unittest.mock import patch
 
+import cloudinary
 import pytest
+from cloudinary import CloudinaryResource
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.timezone import now
 from PIL import Image
 
-from boxes.models import Box
+from boxes.models import Box, BoxProduct
 from dashboard.forms import BoxForm
-from orders.models import Order, StripeSubscriptionMeta
-from users.models import ShippingAddress
+from dashboard.views import ship_box_orders
+from orders.models import (
+    DeadLetterEvent,
+    Order,
+    Payment,
+    StripeSubscriptionMeta,
+    WebhookEvent
+)
+from users.models import OutboundEmail, ShippingAddress
 
 User = get_user_model()
 
@@ -243,6 +260,95 @@ def test_edit_box_date_forward(client, admin_user):
     assert not box.is_archived
     assert box.shipping_date == new_date
 
+
+@pytest.mark.django_db
+def test_delete_box_destroys_image_once(client, admin_user):
+    """
+    Test deleting a box removes its Cloudinary image exactly once.
+    """
+    client.force_login(admin_user)
+    box = Box.objects.create(
+        name="Old Box", shipping_date=now().date(),
+        image="image/upload/v1/boxes/old.jpg"
+    )
+
+    with patch('boxes.signals.destroy') as destroy:
+        response = client.post(
+            reverse('delete_box', args=[box.id]),
+            {'password': 'password'}
+        )
+
+    assert response.status_code == 200
+    assert not Box.objects.filter(pk=box.pk).exists()
+    destroy.assert_called_once_with('boxes/old')
+
+
+@pytest.mark.django_db
+def test_add_product_requests_derived_images(client, admin_user):
+    """
+    Test a product image upload asks for the derived sizes in the
+    background and records their URLs on the product.
+    """
+    client.force_login(admin_user)
+    uploaded = CloudinaryResource(
+        'products/brush', version='1700000000', format='jpg',
+        type='upload', resource_type='image'
+    )
+
+    with patch.object(cloudinary.config(), 'cloud_name', 'hobbyhub'), \
+            patch('cloudinary.uploader.upload_resource',
+                  return_value=uploaded) as upload:
+        response = client.post(reverse('add_products'), {
+            "name": "Brush",
+            "quantity": "1",
+            "image": generate_test_image(),
+        })
+
+    assert response.status_code == 302
+    options = upload.call_args.kwargs
+    assert options['eager_async'] is True
+    # Four card widths and two thumbnail widths
+    assert len(options['eager']) == 6
+    assert options['eager'][0] == {
+        'width': 320, 'height': 240, 'crop': 'fill', 'gravity': 'auto',
+        'quality': 'auto', 'format': 'webp',
+    }
+
+    product = BoxProduct.objects.get(name="Brush")
+    assert product.image.public_id == 'products/brush'
+    derived = product.image_derived
+    assert derived['version'] == '1700000000'
+    assert derived['presets']['thumb'][0] == [
+        200,
+        'https://res.cloudinary.com/hobbyhub/image/upload/'
+        'c_fill,g_auto,h_200,q_auto,w_200/v1700000000/products/brush.webp'
+    ]
+
+
+@pytest.mark.django_db
+def test_edit_product_keeps_derived_images(client, admin_user):
+    """
+    Test editing a product without a new image keeps its derived sizes.
+    """
+    client.force_login(admin_user)
+    derived = {'public_id': 'products/brush', 'version': '1', 'presets': {}}
+    product = BoxProduct.objects.create(
+        name="Brush", image="image/upload/v1/products/brush.jpg",
+        image_derived=derived
+    )
+
+    with patch('cloudinary.uploader.upload_resource') as upload:
+        response = client.post(reverse('edit_product', args=[product.id]), {
+            "name": "Fine Brush",
+            "quantity": "2",
+        })
+
+    assert response.status_code == 302
+    upload.assert_not_called()
+    product.refresh_from_db()
+    assert product.name == "Fine Brush"
+    assert product.image_derived == derived
+
 # ============================
 # USER ADMIN TEST CASES
 # ============================
@@ -317,6 +423,104 @@ def test_admin_password_reset(mock_send_email, client, admin_user):
     mock_send_email.assert_called_once_with(user, domain='testserver')
 
 
+@pytest.fixture
+def many_users(django_user_model):
+    """
+    Five members, two of them subscribed (one subscription cancelled).
+    """
+    users = [
+        django_user_model.objects.create_user(
+            username=f"member{i}",
+            email=f"m{i}@example.com",
+            password="pass"
+        )
+        for i in range(5)
+    ]
+    StripeSubscriptionMeta.objects.create(
+        user=users[0], stripe_subscription_id="sub_live",
+        stripe_price_id="price_x"
+    )
+    StripeSubscriptionMeta.objects.create(
+        user=users[1], stripe_subscription_id="sub_gone",
+        stripe_price_id="price_x", cancelled_at=now()
+    )
+    return users
+
+
+def listed_usernames(response):
+    return [user.username for user in response.context["users"]]
+
+
+@pytest.mark.django_db
+@patch("dashboard.views.USER_ADMIN_PAGE_SIZE", 2)
+def test_user_admin_keyset_pages(client, admin_user, many_users):
+    """
+    Pages follow username order and link forwards and back with cursors.
+    """
+    client.force_login(admin_user)
+    url = reverse('user_admin')
+
+    first = client.get(url, {"q": "member"})
+    assert listed_usernames(first) == ["member0", "member1"]
+    assert first.context["prev_url"] is None
+
+    second = client.get(url + first.context["next_url"])
+    assert listed_usernames(second) == ["member2", "member3"]
+    assert "q=member" in second.context["next_url"]
+
+    last = client.get(url + second.context["next_url"])
+    assert listed_usernames(last) == ["member4"]
+    assert last.context["next_url"] is None
+
+    back = client.get(url + last.context["prev_url"])
+    assert listed_usernames(back) == ["member2", "member3"]
+
+
+@pytest.mark.django_db
+def test_user_admin_search_and_filters(client, admin_user, many_users):
+    """
+    Prefix search covers username and email; flags narrow the list.
+    """
+    client.force_login(admin_user)
+    url = reverse('user_admin')
+
+    assert listed_usernames(client.get(url, {"q": "M3@"})) == ["member3"]
+    assert listed_usernames(client.get(url, {"q": "ember"})) == []
+    assert listed_usernames(
+        client.get(url, {"subscription": "yes"})
+    ) == ["member0"]
+    assert "member1" in listed_usernames(
+        client.get(url, {"subscription": "no"})
+    )
+    assert listed_usernames(client.get(url, {"staff": "yes"})) == [
+        admin_user.username
+    ]
+    assert client.get(url, {"active": "maybe"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_user_admin_queries_do_not_grow_with_users(
+    client, admin_user, django_user_model
+):
+    """
+    Profiles are joined in, so a page costs the same number of queries
+    whether it lists one user or many.
+    """
+    client.force_login(admin_user)
+    url = reverse('user_admin')
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as few:
+        client.get(url)
+    for i in range(12):
+        django_user_model.objects.create_user(username=f"bulk{i}")
+    with CaptureQueriesContext(connection) as many:
+        response = client.get(url)
+
+    assert len(response.context["users"]) == 13
+    assert len(many) == len(few)
+
+
 # ============================
 # ORDER MANAGEMENT TEST CASES
 # ============================
@@ -428,3 +632,471 @@ def test_admin_cancel_subscription(mock_modify, client, admin_user):
     # Check that the subscription is marked as cancelled
     subscription.refresh_from_db()
     assert subscription.cancelled_at is not None
+
+
+def add_paid_orders(user, count, start=0):
+    """
+    Orders for `user`, each with its own box, address and payment.
+    """
+    for i in range(start, start + count):
+        box = Box.objects.create(
+            name=f"Box {i}",
+            slug=f"box-{i}",
+            shipping_date=now().date()
+        )
+        address = ShippingAddress.objects.create(
+            user=user,
+            recipient_f_name='Jo',
+            recipient_l_name='Bloggs',
+            address_line_1=f'{i} High Street',
+            town_or_city='Town',
+            postcode='AB1 2CD',
+            country='GB',
+            phone_number='0123456789'
+        )
+        order = Order.objects.create(
+            user=user, box=box, shipping_address=address
+        )
+        Payment.objects.create(
+            user=user, order=order, amount='25.00', status='paid',
+            payment_method='card', payment_intent_id=f"pi_{i}"
+        )
+
+
+@pytest.mark.django_db
+def test_user_orders_query_count_is_fixed(
+    client, admin_user, django_user_model
+):
+    """
+    The order history takes the same number of queries for one order as
+    for many, and still shows each order's box, address and payment.
+    """
+    customer = django_user_model.objects.create(username="history")
+    StripeSubscriptionMeta.objects.create(
+        user=customer, stripe_subscription_id="sub_1",
+        stripe_price_id="price_x"
+    )
+    client.force_login(admin_user)
+    url = reverse('user_orders', args=[customer.id])
+
+    add_paid_orders(customer, 1)
+    with CaptureQueriesContext(connection) as one:
+        client.get(url)
+    add_paid_orders(customer, 9, start=1)
+    with CaptureQueriesContext(connection) as ten:
+        response = client.get(url)
+
+    assert len(ten) == len(one)
+    assert len(response.context["orders"]) == 10
+    assert len(response.context["payments_by_order"]) == 10
+    assert response.context["active_sub"].stripe_subscription_id == "sub_1"
+    content = response.content.decode()
+    assert "Box 9" in content
+    assert "9 High Street" in content
+
+
+@pytest.mark.django_db
+def test_user_orders_shows_first_payment(client, admin_user,
+                                         django_user_model):
+    """
+    An order with several payments is shown with its first, as before the
+    payments were prefetched.
+    """
+    customer = django_user_model.objects.create(username="retried")
+    add_paid_orders(customer, 1)
+    order = Order.objects.get(user=customer)
+    Payment.objects.create(
+        user=customer, order=order, amount='25.00', status='paid',
+        payment_method='card', payment_intent_id="pi_retry"
+    )
+    client.force_login(admin_user)
+
+    response = client.get(reverse('user_orders', args=[customer.id]))
+
+    shown = response.context["orders"][0]
+    assert shown.payment.payment_intent_id == "pi_0"
+
+
+# ============================
+# BULK SHIPPING TEST CASES
+# ============================
+
+@pytest.fixture
+def box_orders(django_user_model):
+    """
+    A box with processing orders from several subscribers, plus orders
+    that must not be shipped.
+    """
+    box = Box.objects.create(
+        name="October Box",
+        slug="october-box",
+        shipping_date=now().date()
+    )
+    other_box = Box.objects.create(
+        name="November Box",
+        slug="november-box",
+        shipping_date=now().date() + timedelta(days=30)
+    )
+    for i in range(20):
+        user = django_user_model.objects.create(
+            username=f"subscriber{i}",
+            email=f"subscriber{i}@example.com"
+        )
+        Order.objects.create(user=user, box=box, status='processing')
+    Order.objects.create(user=user, box=box, status='pending')
+    Order.objects.create(user=user, box=other_box, status='processing')
+    return box
+
+
+@pytest.mark.django_db
+def test_ship_box_orders_is_set_based(box_orders, django_assert_num_queries):
+    """
+    Shipping a box costs the same handful of queries however many orders
+    it has: one read, one UPDATE, one email INSERT and dropping the cached
+    packing list.
+    """
+    with django_assert_num_queries(6):
+        assert ship_box_orders(box_orders) == 20
+
+    assert Order.objects.filter(box=box_orders, status='shipped').count() == 20
+    assert Order.objects.filter(status='processing').count() == 1
+    assert Order.objects.filter(status='pending').count() == 1
+
+    emails = OutboundEmail.objects.filter(
+        subject="Your Hobby Hub box has shipped!"
+    )
+    assert emails.count() == 20
+    email = emails.get(recipient='subscriber3@example.com')
+    assert 'Hi subscriber3' in email.body
+    assert 'October Box' in email.html_body
+
+
+@pytest.mark.django_db
+def test_ship_box_view_ships_and_summarises(client, admin_user, box_orders):
+    """
+    Staff ship a box with one POST and land on its summary.
+    """
+    client.force_login(admin_user)
+    url = reverse('ship_box', args=[box_orders.id])
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.context['processing'] == 20
+
+    response = client.post(url, follow=True)
+
+    assert response.redirect_chain[-1][0] == url
+    assert response.context['processing'] == 0
+    assert ('Shipped', 20) in response.context['status_counts']
+    assert response.context['emails_waiting'] == 20
+
+
+@pytest.mark.django_db
+def test_ship_box_twice_ships_nothing_new(client, admin_user, box_orders):
+    """
+    A repeated POST does not re-send shipping emails.
+    """
+    client.force_login(admin_user)
+    url = reverse('ship_box', args=[box_orders.id])
+
+    client.post(url)
+    client.post(url)
+
+    assert OutboundEmail.objects.count() == 20
+
+
+# ============================
+# FULFILMENT EXPORT TEST CASES
+# ============================
+
+@pytest.fixture
+def export_orders(django_user_model):
+    """
+    Orders for one box shipping to different countries, one a gift.
+    """
+    box = Box.objects.create(
+        name="October Box",
+        slug="october-box",
+        shipping_date=now().date()
+    )
+    user = django_user_model.objects.create(
+        username="fulfil",
+        email="fulfil@example.com"
+    )
+    for country, is_gift in (('GB', False), ('GB', True), ('IE', False)):
+        address = ShippingAddress.objects.create(
+            user=user,
+            recipient_f_name='Jo',
+            recipient_l_name='Bloggs',
+            address_line_1='1 High Street',
+            town_or_city='Town',
+            postcode='AB1 2CD',
+            country=country,
+            phone_number='0123456789'
+        )
+        Order.objects.create(
+            user=user,
+            box=box,
+            shipping_address=address,
+            status='processing',
+            is_gift=is_gift
+        )
+    Order.objects.create(user=user, status='processing')
+    return box
+
+
+def read_csv_export(response):
+    """
+    Joins a streamed CSV response and parses it into dicts.
+    """
+    content = b''.join(response.streaming_content).decode()
+    return list(csv.DictReader(content.splitlines()))
+
+
+@pytest.mark.django_db
+def test_export_orders_streams_csv_for_box(
+    client, admin_user, export_orders
+):
+    """
+    The export streams one row per order for the box, with its address.
+    """
+    client.force_login(admin_user)
+
+    response = client.get(
+        reverse('export_orders'),
+        {'box': export_orders.id}
+    )
+
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv'
+    assert 'attachment;' in response['Content-Disposition']
+    rows = read_csv_export(response)
+    assert len(rows) == 3
+    assert rows[0]['box'] == 'October Box'
+    assert rows[0]['postcode'] == 'AB1 2CD'
+    assert rows[0]['email'] == 'fulfil@example.com'
+
+
+@pytest.mark.django_db
+def test_export_orders_filters_country_and_gift(
+    client, admin_user, export_orders
+):
+    """
+    Country and gift filters narrow the export.
+    """
+    client.force_login(admin_user)
+
+    response = client.get(reverse('export_orders'), {
+        'box': export_orders.id,
+        'country': 'gb',
+        'gift': 'no',
+    })
+
+    rows = read_csv_export(response)
+    assert len(rows) == 1
+    assert rows[0]['country'] == 'GB'
+    assert rows[0]['is_gift'] == 'False'
+
+
+@pytest.mark.django_db
+def test_export_orders_as_jsonl(client, admin_user, export_orders):
+    """
+    JSONL exports one object per line.
+    """
+    client.force_login(admin_user)
+
+    response = client.get(reverse('export_orders'), {
+        'box': export_orders.id,
+        'gift': 'yes',
+        'format': 'jsonl',
+    })
+
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert len(lines) == 1
+    assert json.loads(lines[0])['is_gift'] is True
+
+
+@pytest.mark.django_db
+def test_export_orders_rejects_bad_filters(client, admin_user):
+    """
+    Unknown formats and gift values are a bad request.
+    """
+    client.force_login(admin_user)
+    url = reverse('export_orders')
+
+    assert client.get(url, {'format': 'xlsx'}).status_code == 400
+    assert client.get(url, {'gift': 'maybe'}).status_code == 400
+    assert client.get(url, {'box': 'october'}).status_code == 400
+
+
+# ============================
+# FAILED WEBHOOK TEST CASES
+# ============================
+
+def make_dead_letter(event_id, event_type='invoice.payment_failed',
+                     error='Stripe is down'):
+    """
+    Creates a failed inbox event and its dead letter.
+    """
+    webhook_event = WebhookEvent.objects.create(
+        stripe_event_id=event_id,
+        event_type=event_type,
+        payload={'id': event_id, 'type': event_type},
+        status='failed',
+        attempts=5,
+        last_error=error
+    )
+    return DeadLetterEvent.objects.create(
+        webhook_event=webhook_event,
+        event_type=event_type,
+        error=error,
+        attempts=5
+    )
+
+
+@pytest.mark.django_db
+def test_dead_letters_requires_staff(client, django_user_model):
+    """
+    Non-staff users cannot see failed webhook events.
+    """
+    user = django_user_model.objects.create_user(
+        username='customer',
+        password='password'
+    )
+    client.force_login(user)
+    response = client.get(reverse('dead_letters'))
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_dead_letters_filters_by_error(client, admin_user):
+    """
+    The list shows open dead letters matching the error filter.
+    """
+    make_dead_letter('evt_1', error='Stripe is down')
+    make_dead_letter('evt_2', error='No address found')
+
+    client.force_login(admin_user)
+    response = client.get(reverse('dead_letters'), {'q': 'stripe'})
+
+    assert response.status_code == 200
+    assert [
+        d.webhook_event.stripe_event_id
+        for d in response.context['dead_letters']
+    ] == ['evt_1']
+
+
+@pytest.mark.django_db
+def test_replay_selected_dead_letters(client, admin_user):
+    """
+    Replaying queues only the selected events back into the inbox.
+    """
+    selected = make_dead_letter('evt_1')
+    make_dead_letter('evt_2')
+
+    client.force_login(admin_user)
+    response = client.post(reverse('dead_letters'), {
+        'replay': 'selected',
+        'status': 'open',
+        'dead_letter_ids': [selected.id],
+    })
+
+    selected.refresh_from_db()
+    assert response.status_code == 302
+    assert response.url == reverse(
+        'dead_letter_replay',
+        args=[selected.replay_id]
+    )
+    assert selected.status == 'replaying'
+    assert WebhookEvent.objects.get(stripe_event_id='evt_1').status == (
+        'pending'
+    )
+    assert WebhookEvent.objects.get(stripe_event_id='evt_2').status == (
+        'failed'
+    )
+
+
+@pytest.mark.django_db
+def test_replay_rejects_invalid_dead_letter_ids(client, admin_user):
+    """
+    A tampered, non-numeric selection is a bad request, not a server error.
+    """
+    dead_letter = make_dead_letter('evt_1')
+
+    client.force_login(admin_user)
+    response = client.post(reverse('dead_letters'), {
+        'replay': 'selected',
+        'status': 'open',
+        'dead_letter_ids': [dead_letter.id, 'abc'],
+    })
+
+    assert response.status_code == 400
+    dead_letter.refresh_from_db()
+    assert dead_letter.status == 'open'
+
+
+@pytest.mark.django_db
+def test_empty_replay_keeps_only_filters_in_redirect(client, admin_user):
+    """
+    An empty selection returns to the filtered list without putting the
+    CSRF token or the submitted ids in the URL.
+    """
+    dead_letter = make_dead_letter('evt_1')
+    dead_letter.status = 'resolved'
+    dead_letter.save()
+
+    client.force_login(admin_user)
+    response = client.post(reverse('dead_letters'), {
+        'replay': 'selected',
+        'status': 'open',
+        'q': 'boom',
+        'csrfmiddlewaretoken': 'token',
+        'dead_letter_ids': [dead_letter.id],
+    })
+
+    assert response.status_code == 302
+    assert response.url == (
+        f"{reverse('dead_letters')}?status=open&q=boom"
+    )
+
+
+@pytest.mark.django_db
+def test_replay_all_matching_dead_letters(client, admin_user):
+    """
+    "Replay all" queues every open event matching the filters.
+    """
+    make_dead_letter('evt_1')
+    make_dead_letter('evt_2')
+    make_dead_letter('evt_3', event_type='invoice.upcoming')
+
+    client.force_login(admin_user)
+    client.post(reverse('dead_letters'), {
+        'replay': 'all',
+        'status': 'open',
+        'event_type': 'invoice.payment_failed',
+    })
+
+    assert DeadLetterEvent.objects.filter(status='replaying').count() == 2
+    assert DeadLetterEvent.objects.get(
+        event_type='invoice.upcoming'
+    ).status == 'open'
+
+
+@pytest.mark.django_db
+def test_dead_letter_replay_page_reports_outcome(client, admin_user):
+    """
+    The replay page shows per-event outcomes and the overall stats.
+    """
+    make_dead_letter('evt_1')
+    client.force_login(admin_user)
+    response = client.post(reverse('dead_letters'), {
+        'replay': 'all',
+        'status': 'open',
+    })
+
+    response = client.get(response.url)
+
+    assert response.status_code == 200
+    assert response.context['stats']['waiting'] == 1
+    assert len(response.context['events']) == 1
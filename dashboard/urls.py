@@ -2,7 +2,8 @@
 dashboard/urls.py
 
 Defines URL patterns for custom admin dashboard views.
-Includes management routes for boxes, products, and users.
+Includes management routes for boxes, products, users and failed
+webhook events.
 """
 # Django Imports
 from django.urls import path
@@ -28,6 +29,12 @@ urlpatterns = [
         'box_admin/<int:box_id>/products/add/',
         views.add_product_to_box, name='add_product_to_box'
     ),
+    path('box_admin/<int:box_id>/ship/', views.ship_box, name='ship_box'),
+    path(
+        'box_admin/<int:box_id>/packing/',
+        views.packing_list,
+        name='packing_list'
+    ),
     path(
         'dashboard/box/<int:box_id>/assign_orphaned/',
         views.assign_orphaned_to_box,
@@ -82,6 +89,7 @@ urlpatterns = [
         views.user_orders,
         name='user_orders'
     ),
+    path('orders/export/', views.export_orders, name='export_orders'),
     path(
         'order/<int:order_id>/update_status/',
         views.update_order_status,
@@ -92,4 +100,13 @@ urlpatterns = [
         views.admin_cancel_subscription,
         name='admin_cancel_subscription'
     ),
+
+
+    # Webhook admin
+    path('webhooks/failed/', views.dead_letters, name='dead_letters'),
+    path(
+        'webhooks/replays/<int:replay_id>/',
+        views.dead_letter_replay,
+        name='dead_letter_replay'
+    ),
 ]
@@ -5,7 +5,9 @@ Custom admin dashboard views for managing:
 - Subscription boxes (create, edit, delete, assign products).
 - Products (CRUD, orphan management).
 - Users (admin-only edit/deactivation).
-- Orders and subscriptions (view history per user).
+- Orders and subscriptions (view history per user, ship a whole box,
+  stream fulfilment exports).
+- Failed Stripe webhook events (dead letters and bulk replay).
 All views are protected with @staff_member_required.
 Uses MaterializeCSS-compatible forms and a custom `alert()` utility for
 messaging.
@@ -13,18 +15,31 @@ messaging.
 
 import json
 import logging
+import time
 
 import stripe
-from cloudinary.uploader import destroy
 from django.urls import reverse
 from django.contrib.auth import authenticate, get_user_model
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from django.http import (
+    HttpResponseBadRequest,
+    QueryDict,
+    JsonResponse,
+    StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.http import urlencode
 from django.views.decorators.http import require_POST
+from django_countries import countries as countries_registry
+from boxes.archive import refresh_archive
 from boxes.models import Box, BoxProduct
+from boxes.packing import get_packing_list, invalidate_packing_list
+from boxes.schedule import invalidate_box_schedule
 from hobbyhub.mail import (
     send_auto_archive_notification,
+    send_bulk_shipping_confirmation_emails,
     send_order_status_update_email,
     send_password_reset_email,
     send_shipping_confirmation_email
@@ -32,9 +47,19 @@ from hobbyhub.mail import (
 from hobbyhub.utils import (
     alert,
     get_subscription_duration_display,
-    get_subscription_status
+    get_subscription_status,
+    parse_yes_no
+)
+from hobbyhub.webhooks import replay_dead_letters
+from orders.exports import EXPORT_FORMATS, filter_orders
+from orders.models import (
+    DeadLetterEvent,
+    DeadLetterReplay,
+    Order,
+    Payment,
+    StripeSubscriptionMeta
 )
-from orders.models import Order, Payment, StripeSubscriptionMeta
+from users.models import OutboundEmail
 
 from .decorators import custom_staff_required
 from .forms import BoxForm, ProductForm, UserEditForm
@@ -43,6 +68,8 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+USER_ADMIN_PAGE_SIZE = 30
+
 
 @custom_staff_required
 def box_admin(request):
@@ -210,13 +237,7 @@ def delete_box(request, box_id):
         box = get_object_or_404(Box, pk=box_id)
 
         try:
-            if box.image:
-                result = destroy(box.image.public_id)
-                if result.get('result') == 'ok':
-                    logger.info(
-                        f"Cloudinary image deleted for box: {box.name}"
-                    )
-
+            # The post_delete signal removes the box's Cloudinary image
             box.delete()
             alert(
                 request,
@@ -254,6 +275,9 @@ def edit_box_products(request, box_id):
         if selected_products:
             # Update the selected orphaned products to this box
             BoxProduct.objects.filter(id__in=selected_products).update(box=box)
+            invalidate_packing_list(box.id)
+            invalidate_box_schedule()
+            refresh_archive()
             alert(
                 request,
                 "success",
@@ -293,6 +317,9 @@ def assign_orphaned_to_box(request, box_id):
                 id__in=product_ids, box__isnull=True
             )
             products.update(box=box)
+            invalidate_packing_list(box.id)
+            invalidate_box_schedule()
+            refresh_archive()
             alert(
                 request,
                 "success",
@@ -663,7 +690,11 @@ def reassign_orphaned_products(request, product_ids):
     if request.method == 'POST':
         box_id = request.POST.get('box_id')
         box = get_object_or_404(Box, pk=box_id)
+        previous_box_ids = set(products.values_list('box_id', flat=True))
         products.update(box=box)
+        invalidate_packing_list(box.id, *previous_box_ids)
+        invalidate_box_schedule()
+        refresh_archive()
         alert(
             request,
             "success",
@@ -678,20 +709,123 @@ def reassign_orphaned_products(request, product_ids):
     })
 
 
+def filter_users(q=None, staff=None, active=None, subscription=None):
+    """
+    Users matching the user admin search and filters, ordered by username.
+
+    The search is a case-insensitive prefix match on username or email,
+    which the ``users`` search indexes serve on Postgres. ``subscription``
+    means the user has at least one subscription that is not cancelled.
+    Profiles are joined in so the page renders without a query per user.
+    """
+    users = User.objects.select_related('profile')
+    q = (q or '').strip()
+    if q:
+        users = users.filter(
+            Q(username__istartswith=q) | Q(email__istartswith=q)
+        )
+    for field, value in (('is_staff', staff), ('is_active', active)):
+        if value is not None:
+            users = users.filter(**{field: value})
+    if subscription is not None:
+        has_subscription = Exists(
+            StripeSubscriptionMeta.objects.filter(
+                user=OuterRef('pk'),
+                cancelled_at__isnull=True
+            )
+        )
+        users = users.filter(
+            has_subscription if subscription else ~has_subscription
+        )
+    return users.order_by('username')
+
+
+def paginate_users(users, after=None, before=None,
+                   page_size=USER_ADMIN_PAGE_SIZE):
+    """
+    One page of users, located by username rather than OFFSET.
+
+    ``after`` is the last username of the previous page and ``before`` the
+    first username of the next one, so every page is an index range of
+    ``page_size`` rows however deep it is.
+
+    Returns:
+        tuple: (page QuerySet, username to continue after or None,
+        username to go back before or None).
+    """
+    if before:
+        # The first username of the previous page, counting back from here
+        start = list(
+            users.filter(username__lt=before)
+            .order_by('-username')
+            .values_list('username', flat=True)[page_size - 1:page_size]
+        )
+        page = users.filter(username__gte=start[0]) if start else users
+    elif after:
+        page = users.filter(username__gt=after)
+    else:
+        page = users
+    page = page[:page_size]
+
+    usernames = [user.username for user in page]
+    if not usernames:
+        return page, None, None
+    next_after = (
+        usernames[-1]
+        if users.filter(username__gt=usernames[-1]).exists() else None
+    )
+    prev_before = (
+        usernames[0]
+        if users.filter(username__lt=usernames[0]).exists() else None
+    )
+    return page, next_after, prev_before
+
+
 @custom_staff_required
 def user_admin(request):
     """
-    Admin overview of all users.
+    Admin overview of users, a page at a time.
 
-    - Displays a list of users ordered by username.
+    - Searches by username or email prefix (``q``).
+    - Filters on ``staff``, ``active`` and ``subscription`` (yes/no).
+    - Pages with ``after``/``before`` usernames; see `paginate_users`.
     - Provides links to edit, deactivate, or view order history.
     """
-    users = User.objects.all().order_by('username')
+    filters = {'q': request.GET.get('q', '').strip()}
+    try:
+        for key in ('staff', 'active', 'subscription'):
+            filters[key] = parse_yes_no(request.GET.get(key), key)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    users, next_after, prev_before = paginate_users(
+        filter_users(**filters),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=USER_ADMIN_PAGE_SIZE,
+    )
+
+    # Keep the search and filters on the page links
+    params = QueryDict(mutable=True)
+    for key in ('q', 'staff', 'active', 'subscription'):
+        if request.GET.get(key):
+            params[key] = request.GET[key]
+
+    def page_url(**cursor):
+        page_params = params.copy()
+        page_params.update(cursor)
+        return f"?{page_params.urlencode()}"
+
     return render(
         request,
         'dashboard/user_admin.html',
         {
             'users': users,
+            'filters': request.GET,
+            'next_url': page_url(after=next_after) if next_after else None,
+            'prev_url': (
+                page_url(before=prev_before) if prev_before else None
+            ),
         }
     )
 
@@ -892,16 +1026,30 @@ def user_orders(request, user_id):
 
     - Shows active and cancelled subscriptions.
     - Annotates each order with its payment info.
+
+    Boxes and addresses are joined and payments prefetched, so the page
+    takes the same handful of queries however many orders the user has.
     """
     user = get_object_or_404(User, pk=user_id)
-    orders = Order.objects.filter(user=user).order_by('-order_date')
-    subs = (
+    orders = list(
+        Order.objects
+        .filter(user=user)
+        .select_related('box', 'shipping_address')
+        .prefetch_related(Prefetch(
+            'payment_set',
+            queryset=Payment.objects.order_by('id'),
+            to_attr='payments'
+        ))
+        .order_by('-order_date')
+    )
+    subs = list(
         StripeSubscriptionMeta.objects
         .filter(user=user)
+        .select_related('user')
         .order_by('-created_at')
     )
-    active_sub = subs.filter(cancelled_at__isnull=True).first()
-    cancelled_subs = subs.filter(cancelled_at__isnull=False)
+    active_sub = next((sub for sub in subs if not sub.cancelled_at), None)
+    cancelled_subs = [sub for sub in subs if sub.cancelled_at]
 
     sub_map = {
         sub.stripe_subscription_id: {
@@ -911,12 +1059,13 @@ def user_orders(request, user_id):
         } for sub in subs
     }
 
+    # An order's first payment stands for it, while payments_by_order
+    # keeps the last, as the per-order and bulk lookups did before
+    payments_by_order = {}
     for order in orders:
-        order.payment = Payment.objects.filter(order=order).first()
-
-    payments_by_order = {
-        p.order_id: p for p in Payment.objects.filter(order__in=orders)
-    }
+        order.payment = order.payments[0] if order.payments else None
+        if order.payments:
+            payments_by_order[order.id] = order.payments[-1]
 
     return render(
         request,
@@ -1033,6 +1182,170 @@ def update_order_status(request, order_id):
     return redirect('user_orders', user_id=order.user.id)
 
 
+def ship_box_orders(box):
+    """
+    Marks every processing order for `box` as shipped and queues the
+    shipping confirmation emails, in one transaction.
+
+    The orders are flipped with a single UPDATE. It only touches the
+    orders locked and read for the emails, so an order created meanwhile
+    waits for the next run rather than shipping without an email.
+
+    Returns:
+        int: The number of orders shipped.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(of=('self',))
+            .filter(box=box, status='processing')
+            .select_related('user')
+            .only('id', 'user__username', 'user__email')
+            .order_by('id')
+        )
+        if not orders:
+            return 0
+
+        shipped = Order.objects.filter(
+            box=box,
+            status='processing',
+            id__lte=orders[-1].id
+        ).update(status='shipped')
+        send_bulk_shipping_confirmation_emails(
+            [order.user for order in orders],
+            box
+        )
+    invalidate_packing_list(box.id)
+    return shipped
+
+
+@custom_staff_required
+def ship_box(request, box_id):
+    """
+    Ships a box to every subscriber in one action.
+
+    - On GET: summarises the box's orders by status and how many emails
+      are still waiting in the outbox.
+    - On POST: marks all processing orders for the box as shipped and
+      queues their shipping confirmation emails.
+    """
+    box = get_object_or_404(Box, pk=box_id)
+
+    if request.method == 'POST':
+        started = time.monotonic()
+        shipped = ship_box_orders(box)
+        elapsed = time.monotonic() - started
+
+        if not shipped:
+            alert(request, "error", f"No processing orders for '{box.name}'.")
+        else:
+            logger.info(
+                f"Admin {request.user} shipped {shipped} order(s) for box "
+                f"'{box.name}' (ID: {box.id}) in {elapsed:.2f}s"
+            )
+            alert(
+                request,
+                "success",
+                f"Shipped {shipped} order(s) for '{box.name}' in "
+                f"{elapsed:.1f}s and queued their shipping emails."
+            )
+        return redirect('ship_box', box_id=box.id)
+
+    status_counts = dict(
+        Order.objects.filter(box=box)
+        .values_list('status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    return render(
+        request,
+        'dashboard/ship_box.html',
+        {
+            'box': box,
+            'status_counts': [
+                (label, status_counts.get(value, 0))
+                for value, label in Order.STATUS_CHOICES
+            ],
+            'processing': status_counts.get('processing', 0),
+            'status_choices': Order.STATUS_CHOICES,
+            'emails_waiting': OutboundEmail.objects.filter(
+                status__in=['pending', 'sending']
+            ).count(),
+        }
+    )
+
+
+@custom_staff_required
+def packing_list(request, box_id):
+    """
+    Shows how many units of each product to pack for a box, by destination
+    country, for orders that have not shipped yet.
+
+    The totals come from one aggregate query and are cached until the
+    box's orders or products change.
+    """
+    box = get_object_or_404(Box, pk=box_id)
+    packing = get_packing_list(box)
+    countries = [
+        (code, countries_registry.name(code) if code else "Unknown", orders)
+        for code, orders in packing['countries'].items()
+    ]
+    rows = [
+        (
+            product,
+            [product['by_country'].get(code, 0) for code, _, _ in countries]
+        )
+        for product in packing['products']
+    ]
+    return render(
+        request,
+        'dashboard/packing_list.html',
+        {
+            'box': box,
+            'packing': packing,
+            'countries': countries,
+            'rows': rows,
+        }
+    )
+
+
+@custom_staff_required
+def export_orders(request):
+    """
+    Streams a fulfilment file of orders with their shipping addresses.
+
+    Filters come from the query string: ``box`` (id), ``status``,
+    ``country`` (code) and ``gift`` (yes/no). ``format`` is ``csv``
+    (default) or ``jsonl``. Rows are read and sent in chunks, so large
+    exports do not build up in memory.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unknown export format.")
+
+    try:
+        orders = filter_orders(
+            box=request.GET.get('box'),
+            status=request.GET.get('status'),
+            country=request.GET.get('country'),
+            gift=parse_yes_no(request.GET.get('gift'), 'gift'),
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    content_type, extension, writer = EXPORT_FORMATS[export_format]
+    filename = f"orders-{timezone.now():%Y%m%d-%H%M}.{extension}"
+    logger.info(
+        f"Admin {request.user} exported orders as {export_format} "
+        f"({request.GET.urlencode()})"
+    )
+    response = StreamingHttpResponse(
+        writer(orders),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @custom_staff_required
 @require_POST
 def admin_cancel_subscription(request, user_id):
@@ -1063,6 +1376,7 @@ def admin_cancel_subscription(request, user_id):
             )
 
             sub.cancelled_at = timezone.now()
+            sub.cancel_at_period_end = True
             sub.save()
 
             # Log and alert
@@ -1088,3 +1402,117 @@ def admin_cancel_subscription(request, user_id):
 
     else:
         return JsonResponse({'success': False, 'error': 'Incorrect password'})
+
+
+# Most recent dead letters shown at once on the dashboard
+DEAD_LETTER_LIST_LIMIT = 100
+
+# Query parameters the dead-letter list is filtered by
+DEAD_LETTER_FILTERS = ('status', 'event_type', 'q')
+
+
+def filter_dead_letters(params):
+    """
+    Applies the dashboard filters (status, event type, error text) to the
+    dead-letter table.
+    """
+    dead_letters = DeadLetterEvent.objects.select_related('webhook_event')
+
+    status = params.get('status', 'open')
+    if status:
+        dead_letters = dead_letters.filter(status=status)
+    if params.get('event_type'):
+        dead_letters = dead_letters.filter(event_type=params['event_type'])
+    if params.get('q'):
+        dead_letters = dead_letters.filter(error__icontains=params['q'])
+    return dead_letters
+
+
+@custom_staff_required
+def dead_letters(request):
+    """
+    Lists Stripe webhook events that failed after all retries.
+
+    - Filters by status, event type and error text.
+    - On POST: replays the selected events, or every open event matching
+      the filters, through the background webhook worker.
+    """
+    if request.method == 'POST':
+        selected = filter_dead_letters(request.POST)
+        if request.POST.get('replay') != 'all':
+            try:
+                ids = [int(i) for i in request.POST.getlist('dead_letter_ids')]
+            except ValueError:
+                return HttpResponseBadRequest("Invalid event selection.")
+            selected = selected.filter(id__in=ids)
+
+        replay = replay_dead_letters(selected, requested_by=request.user)
+        if not replay:
+            alert(request, "error", "No open events were selected.")
+            # Only the filters, so the CSRF token and ids stay out of the URL
+            filters = {
+                key: request.POST[key]
+                for key in DEAD_LETTER_FILTERS if key in request.POST
+            }
+            return redirect(
+                f"{reverse('dead_letters')}?{urlencode(filters)}"
+            )
+
+        logger.info(
+            f"Admin {request.user} queued {replay.total} dead-lettered "
+            "webhook event(s) for replay"
+        )
+        alert(
+            request,
+            "success",
+            f"Queued {replay.total} event(s) for replay."
+        )
+        return redirect('dead_letter_replay', replay_id=replay.id)
+
+    matching = filter_dead_letters(request.GET)
+    event_types = (
+        DeadLetterEvent.objects
+        .order_by('event_type')
+        .values_list('event_type', flat=True)
+        .distinct()
+    )
+    return render(
+        request,
+        'dashboard/dead_letters.html',
+        {
+            'dead_letters': matching[:DEAD_LETTER_LIST_LIMIT],
+            'total': matching.count(),
+            'limit': DEAD_LETTER_LIST_LIMIT,
+            'event_types': event_types,
+            'filters': {
+                'status': request.GET.get('status', 'open'),
+                'event_type': request.GET.get('event_type', ''),
+                'q': request.GET.get('q', ''),
+            },
+            'status_choices': DeadLetterEvent.STATUS_CHOICES,
+            'replays': DeadLetterReplay.objects.all()[:5],
+        }
+    )
+
+
+@custom_staff_required
+def dead_letter_replay(request, replay_id):
+    """
+    Shows the progress of a dead-letter replay.
+
+    - Per-event outcome (resolved, failed again or still waiting).
+    - Overall throughput once events have finished.
+    """
+    replay = get_object_or_404(DeadLetterReplay, pk=replay_id)
+    events = replay.events.select_related('webhook_event').order_by(
+        'webhook_event__received_at'
+    )
+    return render(
+        request,
+        'dashboard/dead_letter_replay.html',
+        {
+            'replay': replay,
+            'events': events,
+            'stats': replay.stats(),
+        }
+    )
@@ -0,0 +1,182 @@
+"""
+email_templates.py
+
+Renders transactional emails from templates in ``templates/emails/``.
+
+Every email has a plain text template (``<name>.txt``) and may have an HTML
+one (``<name>.html``). Emails without their own HTML template are wrapped
+in ``layout.html``, which shows the text body as paragraphs.
+
+Templates are loaded through a dedicated engine whose loader inlines
+``email.css`` into the HTML source when a template is first read, and
+whose cached loader keeps the compiled result. A process therefore parses
+each template and applies the stylesheet once. A send only renders the
+compiled templates with that recipient's context, which keeps bulk sends
+cheap.
+"""
+import functools
+import os
+import re
+
+from django.conf import settings
+from django.template import Context, Engine, TemplateDoesNotExist
+from django.template.loaders.filesystem import Loader as FilesystemLoader
+
+STYLESHEET = 'email.css'
+LAYOUT = 'layout.html'
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+CSS_SELECTOR = re.compile(r'^([a-zA-Z][a-zA-Z0-9]*)?(?:\.([\w-]+))?$')
+OPEN_TAG = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>')
+CLASS_ATTR = re.compile(r'\sclass="([^"]*)"')
+STYLE_ATTR = re.compile(r'\sstyle="([^"]*)"')
+
+
+def parse_css(css):
+    """
+    Parse a stylesheet into rules that can be inlined.
+
+    Only tag (``p``), class (``.button``) and tag-with-class (``a.button``)
+    selectors are supported, which is all email markup needs.
+
+    Returns:
+        list[tuple]: (tag, class, declarations) in cascade order, least
+        specific first.
+    """
+    rules = []
+    for selectors, body in CSS_RULE.findall(CSS_COMMENT.sub('', css)):
+        declarations = '; '.join(
+            declaration.strip()
+            for declaration in body.split(';')
+            if declaration.strip()
+        )
+        for selector in selectors.split(','):
+            match = CSS_SELECTOR.match(selector.strip())
+            if not match or not any(match.groups()):
+                raise ValueError(
+                    f"Unsupported selector in email stylesheet: {selector!r}"
+                )
+            tag, css_class = match.groups()
+            specificity = (10 if css_class else 0) + (1 if tag else 0)
+            rules.append((specificity, tag, css_class, declarations))
+
+    # sort is stable, so equally specific rules keep their file order
+    rules.sort(key=lambda rule: rule[0])
+    return [rule[1:] for rule in rules]
+
+
+def inline_css(html, css):
+    """
+    Copy matching stylesheet rules into each tag's ``style`` attribute.
+
+    Styles already on a tag win over the stylesheet.
+    """
+    rules = parse_css(css)
+
+    def apply(match):
+        tag, attrs, self_closing = match.groups()
+        attrs = attrs or ''
+        class_attr = CLASS_ATTR.search(attrs)
+        classes = class_attr.group(1).split() if class_attr else []
+        styles = [
+            declarations
+            for rule_tag, rule_class, declarations in rules
+            if (not rule_tag or rule_tag == tag.lower())
+            and (not rule_class or rule_class in classes)
+        ]
+        if not styles:
+            return match.group(0)
+
+        style_attr = STYLE_ATTR.search(attrs)
+        if style_attr:
+            styles.append(style_attr.group(1).strip().rstrip(';'))
+            attrs = STYLE_ATTR.sub('', attrs, count=1)
+        return f'<{tag}{attrs} style="{"; ".join(styles)}"{self_closing}>'
+
+    return OPEN_TAG.sub(apply, html)
+
+
+class InlineCSSLoader(FilesystemLoader):
+    """
+    Filesystem loader that inlines ``email.css`` into HTML templates.
+
+    Runs when a template is read, before it is compiled, so the cached
+    loader in front of it stores templates with their styles applied.
+    """
+
+    def __init__(self, engine, dirs=None):
+        super().__init__(engine, dirs)
+        self._stylesheet = None
+
+    def stylesheet(self):
+        if self._stylesheet is None:
+            for template_dir in self.get_dirs():
+                try:
+                    path = os.path.join(template_dir, STYLESHEET)
+                    with open(path, encoding=self.engine.file_charset) as fp:
+                        self._stylesheet = fp.read()
+                        break
+                except FileNotFoundError:
+                    continue
+            else:
+                self._stylesheet = ''
+        return self._stylesheet
+
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+        if origin.name.endswith('.html'):
+            contents = inline_css(contents, self.stylesheet())
+        return contents
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine():
+    """
+    The template engine used for emails, created once per process.
+    """
+    return Engine(
+        dirs=[settings.BASE_DIR / 'templates' / 'emails'],
+        loaders=[(
+            'django.template.loaders.cached.Loader',
+            ['hobbyhub.email_templates.InlineCSSLoader'],
+        )],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_email_templates(name):
+    """
+    The compiled text and HTML templates for an email.
+
+    Returns:
+        tuple: (text Template, HTML Template); the HTML template is the
+        shared layout when the email has none of its own.
+    """
+    engine = get_engine()
+    text_template = engine.get_template(f'{name}.txt')
+    try:
+        html_template = engine.get_template(f'{name}.html')
+    except TemplateDoesNotExist:
+        html_template = engine.get_template(LAYOUT)
+    return text_template, html_template
+
+
+def render_email(name, context, subject=''):
+    """
+    Render the text and HTML versions of an email.
+
+    Args:
+        name (str): The template name, e.g. ``'order_confirmation'``.
+        context (dict): Values for this recipient.
+        subject (str): Shown as the HTML document title.
+
+    Returns:
+        tuple[str, str]: (text body, HTML body).
+    """
+    text_template, html_template = get_email_templates(name)
+    context = {'site_url': settings.SITE_URL, 'subject': subject, **context}
+
+    text = text_template.render(Context(context, autoescape=False)).strip()
+    html = html_template.render(Context({**context, 'body': text}))
+    return text, html
@@ -1,34 +1,103 @@
 """
-Handles plain text emailing for sending to users.
+Handles transactional emailing to users.
+
+Each email is rendered from a text and an HTML template in
+``templates/emails/`` (see `hobbyhub.email_templates`), queued in the
+outbox (see `hobbyhub.outbox`) and sent by the `send_queued_emails`
+command, so no caller waits on SMTP.
+
+Emails triggered by Stripe webhooks take an optional `business_key` (the
+order, subscription or invoice they are about). Webhooks can be delivered
+more than once, so the outbox drops a repeat of the same email for the
+same key.
 """
 
 from urllib.parse import urlencode
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
-from django.core.mail import send_mail
 from django.core.signing import Signer
 from django.urls import reverse
 
+from .email_templates import render_email
+from .outbox import queue_email, queue_emails
 from .utils import PLAN_MAP
 
 signer = Signer()
 
 
-def send_user_email(subject, message, recipient_email):
+def send_user_email(
+    subject,
+    message,
+    recipient_email,
+    template=None,
+    business_key=None,
+    html_message=None
+):
+    """
+    Queues an email in the outbox, with an optional HTML alternative.
+    It is written in the caller's transaction and sent in the background
+    using the configured backend.
+
+    If `business_key` is given, the email is skipped when the same
+    `template` was already queued to this recipient for that key.
+    """
+    queue_email(
+        subject=subject,
+        message=message,
+        recipient_email=recipient_email,
+        template=template,
+        business_key=business_key,
+        html_message=html_message,
+    )
+
+
+def send_template_email(
+    template,
+    subject,
+    recipient_email,
+    context=None,
+    business_key=None
+):
     """
-    Sends a plain text email using the configured backend.
-    Assumes settings.py controls debug/production behavior.
+    Renders the `template` email for one recipient and queues it.
     """
-    send_mail(
+    message, html_message = render_email(template, context or {}, subject)
+    send_user_email(
         subject=subject,
         message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[recipient_email],
-        fail_silently=False,
+        recipient_email=recipient_email,
+        template=template,
+        business_key=business_key,
+        html_message=html_message,
     )
 
 
+def send_bulk_template_email(template, subject, recipients):
+    """
+    Renders the `template` email for many recipients and queues them with
+    batched inserts. The template is compiled once; each recipient only
+    costs a render.
+
+    Args:
+        recipients (iterable): (recipient_email, context) pairs.
+
+    Returns:
+        int: The number of emails queued.
+    """
+    def rendered():
+        for recipient_email, context in recipients:
+            message, html_message = render_email(template, context, subject)
+            yield {
+                'subject': subject,
+                'message': message,
+                'html_message': html_message,
+                'recipient_email': recipient_email,
+            }
+
+    return queue_emails(rendered())
+
+
 # Registration
 def send_registration_email(user, next_url=None):
     """Send welcome + confirmation email after registration."""
@@ -40,30 +109,22 @@ def send_registration_email(user, next_url=None):
         else base_url
     )
 
-    message = (
-        f"Hi {user.username},\n\n"
-        "Thanks for registering with Hobby Hub!\n\n"
-        "Please confirm your email by clicking the link "
-        f"below:\n\n{confirmation_url}\n\n"
-        "If you did not create this account, you can ignore this message."
-    )
-
-    send_user_email(
+    send_template_email(
+        'registration',
         subject="Confirm your Hobby Hub account",
-        message=message,
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'confirmation_url': confirmation_url}
     )
 
 
 # Account details changed
 def send_account_update_email(user):
     """Send email notification for profile updates."""
-    send_user_email(
+    send_template_email(
+        'account_updated',
         subject="Your account details were updated",
-        message=(
-            f"Hi {user.username}, your profile information was changed."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user}
     )
 
 
@@ -72,41 +133,32 @@ def send_email_change_notifications(user, old_email, new_email):
     """
     Notify both old and new email addresses about the email change.
     """
+    context = {'user': user, 'old_email': old_email, 'new_email': new_email}
+
     # Notify the new email address
-    send_user_email(
+    send_template_email(
+        'email_changed_new',
         subject="Your Hobby Hub account email was changed",
-        message=(
-            f"Hi {user.username},\n\n"
-            "Your email address has been successfully updated "
-            f"to {new_email}.\n\n"
-            "If you did not perform this action, please contact support "
-            "immediately."
-        ),
-        recipient_email=new_email
+        recipient_email=new_email,
+        context=context
     )
 
     # Notify the old email address
-    send_user_email(
+    send_template_email(
+        'email_changed_old',
         subject="Your Hobby Hub account email was changed",
-        message=(
-            f"Hi {user.username},\n\n"
-            "The email address associated with your Hobby Hub account was "
-            f"changed from {old_email} to {new_email}.\n\n"
-            "If you did not perform this action, please contact support "
-            "immediately."
-        ),
-        recipient_email=old_email
+        recipient_email=old_email,
+        context=context
     )
 
 
 # Password changed
 def send_password_change_email(user):
-    send_user_email(
+    send_template_email(
+        'password_changed',
         subject="Your password was changed",
-        message=(
-            f"Hi {user.username}, your password has been successfully changed."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user}
     )
 
 
@@ -134,44 +186,35 @@ def send_password_reset_email(user, domain, protocol='https'):
 
     reset_link = f"{protocol}://{domain}{url_path}"
 
-    message = (
-        f"Hi {user.username},\n\n"
-        "You requested a password reset for your Hobby Hub account.\n\n"
-        f"Click the link below to reset your password:\n\n{reset_link}\n\n"
-        "If you did not request this, ignore this email.\n\n"
-        "Thanks,\n"
-        "The Hobby Hub Team"
-    )
-
-    send_user_email(
+    send_template_email(
+        'password_reset',
         subject="Reset Your Hobby Hub Password",
-        message=message,
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'reset_link': reset_link}
     )
 
 
 # Successful single order
 def send_order_confirmation_email(user, order_id):
-    """Send order confirmation email."""
-    send_user_email(
+    """Send order confirmation email, once per order."""
+    send_template_email(
+        'order_confirmation',
         subject=f"Order Confirmation - Order #{order_id}",
-        message=(
-            f"Thanks for your order #{order_id}, it's now being processed."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'order_id': order_id},
+        business_key=order_id
     )
 
 
 # Gift (Sender)
-def send_gift_confirmation_to_sender(user, recipient_name):
+def send_gift_confirmation_to_sender(user, recipient_name, business_key=None):
     """Send gift confirmation email to sender."""
-    send_user_email(
+    send_template_email(
+        'gift_sender',
         subject="Your gift is on its way!",
-        message=(
-            f"You sent a Hobby Hub box to {recipient_name}. "
-            "We're sure they'll love it."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'recipient_name': recipient_name},
+        business_key=business_key
     )
 
 
@@ -180,103 +223,106 @@ def send_gift_notification_to_recipient(
     recipient_email,
     sender_name,
     gift_message,
-    recipient_name
+    recipient_name,
+    business_key=None
 ):
     """Notify recipient that a gift has been sent."""
-    send_user_email(
+    send_template_email(
+        'gift_recipient',
         subject="You've received a gift from Hobby Hub!",
-        message=(
-            f"Hi {recipient_name},\n\n"
-            f"{sender_name} sent you a Hobby Hub box!\n\n"
-            f"Gift Message:\n{gift_message}"
-        ),
-        recipient_email=recipient_email
+        recipient_email=recipient_email,
+        context={
+            'recipient_name': recipient_name,
+            'sender_name': sender_name,
+            'gift_message': gift_message,
+        },
+        business_key=business_key
     )
 
 
 # Address changed
 def send_address_change_email(user, change_type="updated"):
     """Send notification for shipping address updates."""
-    send_user_email(
+    send_template_email(
+        'address_changed',
         subject=f"Your shipping address was {change_type}",
-        message=(
-            f"Hi {user.username}, your shipping address was {change_type}."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'change_type': change_type}
     )
 
 
 # Account deleted
 def send_account_deletion_email(email):
     """Confirm account deletion."""
-    send_user_email(
+    send_template_email(
+        'account_deleted',
         subject="Account Deleted",
-        message=(
-            "Your Hobby Hub account has been successfully deleted."
-        ),
         recipient_email=email
     )
 
 
 # Subscription started
-def send_subscription_confirmation_email(user, plan_name):
+def send_subscription_confirmation_email(user, plan_name, business_key=None):
     """Confirm subscription signup."""
-    send_user_email(
+    send_template_email(
+        'subscription_confirmation',
         subject="Subscription Confirmed",
-        message=(
-            f"You're now subscribed to the {plan_name} plan. Welcome aboard!"
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'plan_name': plan_name},
+        business_key=business_key
     )
 
 
 # Failed Payment
-def send_payment_failed_email(user):
+def send_payment_failed_email(user, business_key=None):
     """Notify user of failed subscription payment."""
-    send_user_email(
+    send_template_email(
+        'payment_failed',
         subject="Payment Failed",
-        message=(
-            f"Hi {user.username},\n\n"
-            "Unfortunately, your recent payment attempt for your subscription "
-            "failed. "
-            "Please update your payment method to avoid interruptions."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user},
+        business_key=business_key
     )
 
 
 # Upcoming renewal
-def send_upcoming_renewal_email(user, renewal_date):
+def send_upcoming_renewal_email(user, renewal_date, business_key=None):
     """Notify user of upcoming subscription renewal."""
-    send_user_email(
+    send_template_email(
+        'upcoming_renewal',
         subject="Your Hobby Hub renewal is coming up",
-        message=(
-            f"Hi {user.username},\n\n"
-            "Your subscription is set to renew on "
-            f"{renewal_date.strftime('%B %d, %Y')}.\n"
-            "We'll charge your default payment method on file. "
-            "No action is needed unless you'd like to make changes."
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'renewal_date': renewal_date},
+        business_key=business_key
     )
 
 
 # Shipping Confirmation
 def send_shipping_confirmation_email(user, box=None, tracking_number=None):
     """Confirm shipment of box."""
-    box_name = box.name if box else "Hobby Hub"
-    tracking_info = (
-        f"\nTracking Number: {tracking_number}" if tracking_number else ""
+    send_template_email(
+        'shipping_confirmation',
+        subject="Your Hobby Hub box has shipped!",
+        recipient_email=user.email,
+        context={
+            'user': user,
+            'box_name': box.name if box else "Hobby Hub",
+            'tracking_number': tracking_number,
+        }
     )
-    send_user_email(
+
+
+def send_bulk_shipping_confirmation_emails(users, box=None):
+    """Confirm shipment of a box to many users at once."""
+    box_name = box.name if box else "Hobby Hub"
+    return send_bulk_template_email(
+        'shipping_confirmation',
         subject="Your Hobby Hub box has shipped!",
-        message=(
-            f"Hi {user.username},\n\n"
-            f"Your {box_name} box has shipped and is on its way!"
-            f"{tracking_info}\n\n"
-            "Thanks for being part of the Hobby Hub community."
-        ),
-        recipient_email=user.email
+        recipients=(
+            (user.email, {'user': user, 'box_name': box_name})
+            for user in users
+            if user.email
+        )
     )
 
 
@@ -288,16 +334,11 @@ def send_subscription_cancelled_email(user, plan_id, start_date):
     months, label = PLAN_MAP.get(plan_id, (0, "Your plan"))
     end_date = start_date + relativedelta(months=months)
 
-    send_user_email(
+    send_template_email(
+        'subscription_cancelled',
         subject="Subscription Cancelled",
-        message=(
-            f"Hi {user.username},\n\n"
-            f"Your subscription to the {label} has been cancelled.\n"
-            f"You’ll still receive your boxes through "
-            f"{end_date.strftime('%B %Y')}.\n\n"
-            "Thanks for being part of Hobby Hub!"
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'plan_label': label, 'end_date': end_date}
     )
 
 
@@ -306,13 +347,11 @@ def send_auto_archive_notification(box):
     """
     Sends an email notification to the admin when a box is auto-archived.
     """
-    send_mail(
-        'Box Auto-Archived',
-        f'The box "{box.name}" has been auto-archived because '
-        'its date is in the past.',
-        settings.DEFAULT_FROM_EMAIL,
-        ['admin@hobbysub.com'],
-        fail_silently=False,
+    send_template_email(
+        'box_auto_archived',
+        subject='Box Auto-Archived',
+        recipient_email='admin@hobbysub.com',
+        context={'box': box}
     )
 
 
@@ -334,14 +373,9 @@ def send_order_status_update_email(user, order_id, status):
         "Your order status has been updated."
     )
 
-    send_user_email(
+    send_template_email(
+        'order_status_update',
         subject=f"Order Update - Order #{order_id}",
-        message=(
-            f"Hi {user.username},\n\n"
-            f"{status_message}\n\n"
-            "Thank you for choosing Hobby Hub.\n\n"
-            "Best regards,\n"
-            "The Hobby Hub Team"
-        ),
-        recipient_email=user.email
+        recipient_email=user.email,
+        context={'user': user, 'status_message': status_message}
     )
@@ -0,0 +1,74 @@
+"""
+metrics.py
+
+Lightweight counters and gauges for operational metrics.
+
+Values live in the ``hot`` cache under a `metrics:` prefix, so any process
+sharing the cache backend can read them. They are best-effort: losing them
+on a cache flush is acceptable, they are for watching rates, not billing.
+
+With Redis configured, increments are atomic. The database cache used
+otherwise increments with a read followed by a write, so when the web
+process and the workers bump a counter at the same moment some increments
+are lost and counts are approximate (see `counts_are_exact`).
+"""
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+CACHE_ALIAS = 'hot'
+PREFIX = "metrics:"
+
+
+def get_cache():
+    """The cache metrics are stored in."""
+    return caches[CACHE_ALIAS]
+
+
+def counts_are_exact():
+    """
+    Whether concurrent increments are all counted, i.e. the metrics cache
+    is Redis rather than the database cache.
+    """
+    return isinstance(get_cache(), RedisCache)
+
+
+def increment(name, amount=1):
+    """
+    Increment a counter, creating it if needed.
+
+    Atomic on Redis; on other caches concurrent increments may be lost.
+
+    Returns:
+        int: The new counter value.
+    """
+    cache = get_cache()
+    key = PREFIX + name
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # Counter does not exist yet; `add` is a no-op if another process
+        # created it first, in which case incr again.
+        if cache.add(key, amount, timeout=None):
+            return amount
+        return cache.incr(key, amount)
+
+
+def set_gauge(name, value):
+    """Record the current value of a gauge (e.g. a queue depth)."""
+    get_cache().set(PREFIX + name, value, timeout=None)
+
+
+def get_value(name, default=0):
+    """Return the current value of a counter or gauge."""
+    return get_cache().get(PREFIX + name, default)
+
+
+def snapshot(names):
+    """
+    Return the current values of several metrics.
+
+    Returns:
+        dict: Metric name to value.
+    """
+    values = get_cache().get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
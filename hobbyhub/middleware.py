@@ -0,0 +1,76 @@
+"""
+middleware.py
+
+WhiteNoise, extended to serve the pre-rendered archive pages.
+
+Pages built by `boxes.archive` are served at their own URLs, with
+``ARCHIVE_MAX_AGE`` cache headers, before the request reaches Django.
+Files are looked up per request: when the archive version in the hot
+cache has moved on, this process first writes the changed pages to disk.
+Pages are rendered for anonymous visitors, so requests carrying a session
+or flash message cookie skip them and reach the views, which show the
+visitor's own navigation and messages. Responses therefore vary on
+``Cookie``.
+"""
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.urls import reverse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from boxes.archive import get_archive_version, pages_root, sync_archive_files
+
+
+class ArchiveWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also serves the archive pages to visitors
+    without a session.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        # Set before WhiteNoise indexes static files via add_cache_headers
+        self.archive_root = str(pages_root())
+        self.archive_max_age = settings.ARCHIVE_MAX_AGE
+        super().__init__(get_response, settings=settings)
+        self.archive_files = {}
+        self.archive_version = None
+
+    def __call__(self, request):
+        if self.is_archive_request(request):
+            static_file = self.find_archive_file(request.path_info)
+            if static_file is not None:
+                return self.serve(static_file, request)
+        return super().__call__(request)
+
+    def is_archive_request(self, request):
+        """
+        An anonymous GET or HEAD for a page under the past boxes URL.
+        """
+        return (
+            request.method in ('GET', 'HEAD')
+            and request.path_info.startswith(reverse('past_boxes'))
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+        )
+
+    def find_archive_file(self, url):
+        """
+        The StaticFile for an archive page, after syncing the files on disk
+        if the archive changed since this process last looked.
+        """
+        version = get_archive_version()
+        if version != self.archive_version:
+            self.archive_files = {
+                page_url: self.get_static_file(str(path), page_url)
+                for page_url, path in sync_archive_files().items()
+            }
+            self.archive_version = version
+        return self.archive_files.get(url)
+
+    def add_cache_headers(self, headers, path, url):
+        if path.startswith(self.archive_root):
+            headers["Cache-Control"] = (
+                f"max-age={self.archive_max_age}, public"
+            )
+            headers["Vary"] = "Cookie"
+        else:
+            super().add_cache_headers(headers, path, url)
@@ -0,0 +1,424 @@
+"""
+outbox.py
+
+Transactional email outbox.
+
+`hobbyhub.mail.send_user_email` calls `queue_email()` instead of talking to
+SMTP, so request and webhook handlers only pay for a row insert. The row is
+part of the caller's transaction: if that rolls back, the email is never
+sent.
+
+The `send_queued_emails` management command drains the outbox with
+`send_queued_emails()`. Emails are claimed with a lease, so if the
+dispatcher dies mid-send they are picked up again once the lease expires
+rather than lost. Failed sends are retried with bounded exponential backoff
+and marked ``failed`` after ``EMAIL_OUTBOX_MAX_ATTEMPTS``.
+
+Each claimed batch (``EMAIL_OUTBOX_BATCH_SIZE`` emails) is sent over a
+single backend connection, so SMTP pays for one TLS handshake per batch
+rather than per message. If a send fails the connection is reopened and
+the message retried once before it is left for a later retry.
+
+Sending is capped by a shared `EmailSendBudget` (a token bucket plus a
+daily limit) so a shipping run cannot exceed the SMTP provider's quota.
+Emails over budget simply stay queued until tokens are available.
+
+Callers can pass a template name and business key (e.g. a subscription id)
+to `queue_email()`. The first email for that (template, recipient, key) is
+recorded in `EmailSendLedger`; repeats within
+``EMAIL_DEDUP_WINDOW_SECONDS``, such as those from a webhook redelivery,
+are suppressed and counted.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from hobbyhub import metrics
+from users.models import EmailSendBudget, EmailSendLedger, OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+SEND_RATE = "outbox.messages_per_second"
+BUDGET_TOKENS = "outbox.budget.tokens"
+BUDGET_REMAINING_TODAY = "outbox.budget.remaining_today"
+QUEUE_DEPTH = "outbox.queue_depth"
+DEDUP_SUPPRESSED = "outbox.dedup.suppressed"
+
+BUDGET_NAME = 'smtp'
+
+# Rows per INSERT when queueing many emails at once.
+QUEUE_BATCH_SIZE = 500
+
+
+def claim_send(template, recipient_email, business_key):
+    """
+    Record that an email is about to be queued, unless it already was.
+
+    The ledger row is unique per (template, recipient, business key), so
+    concurrent callers cannot both claim it. A claim older than
+    ``EMAIL_DEDUP_WINDOW_SECONDS`` is taken over.
+
+    Returns:
+        bool: True if the email should be queued, False if it is a
+        duplicate.
+    """
+    now = timezone.now()
+    entry, created = EmailSendLedger.objects.get_or_create(
+        template=template,
+        recipient=recipient_email,
+        business_key=str(business_key),
+        defaults={'sent_at': now}
+    )
+    if created:
+        return True
+
+    window = settings.EMAIL_DEDUP_WINDOW_SECONDS
+    if window and EmailSendLedger.objects.filter(
+        id=entry.id,
+        sent_at__lt=now - timedelta(seconds=window)
+    ).update(sent_at=now):
+        return True
+
+    metrics.increment(DEDUP_SUPPRESSED)
+    metrics.increment(f"{DEDUP_SUPPRESSED}.{template}")
+    return False
+
+
+def queue_email(
+    subject,
+    message,
+    recipient_email,
+    from_email=None,
+    template=None,
+    business_key=None,
+    html_message=None
+):
+    """
+    Add an email to the outbox, with an optional HTML alternative.
+
+    When a `business_key` is given, the email is only queued if the same
+    `template` has not gone to this recipient for that key within the
+    dedup window.
+
+    Returns:
+        OutboundEmail | None: The queued email, or None if suppressed.
+    """
+    with transaction.atomic():
+        if business_key is not None and not claim_send(
+            template or subject, recipient_email, business_key
+        ):
+            logger.info(
+                f"[OUTBOX] Suppressed duplicate '{subject}' to "
+                f"{recipient_email} ({business_key})"
+            )
+            return None
+
+        email = OutboundEmail.objects.create(
+            subject=subject,
+            body=message,
+            html_body=html_message or '',
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipient=recipient_email,
+        )
+    logger.info(f"[OUTBOX] Queued '{subject}' to {recipient_email}")
+    return email
+
+
+def queue_emails(emails):
+    """
+    Add many emails to the outbox with batched INSERTs.
+
+    Used for bulk sends such as shipping a whole box, where one
+    `queue_email()` call per recipient would cost a query each. These
+    emails are not deduplicated.
+
+    Args:
+        emails (iterable[dict]): `queue_email` keyword arguments; each needs
+            ``subject``, ``message`` and ``recipient_email``.
+
+    Returns:
+        int: The number of emails queued.
+    """
+    queued = OutboundEmail.objects.bulk_create(
+        [
+            OutboundEmail(
+                subject=email['subject'],
+                body=email['message'],
+                html_body=email.get('html_message') or '',
+                from_email=(
+                    email.get('from_email') or settings.DEFAULT_FROM_EMAIL
+                ),
+                recipient=email['recipient_email'],
+            )
+            for email in emails
+        ],
+        batch_size=QUEUE_BATCH_SIZE
+    )
+    logger.info(f"[OUTBOX] Queued {len(queued)} email(s) in bulk")
+    return len(queued)
+
+
+def due_emails():
+    """
+    Emails ready to be claimed, including ones abandoned mid-send.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+    return OutboundEmail.objects.filter(
+        Q(status='pending', send_after__lte=now)
+        | Q(status='sending', started_at__lt=stale)
+    )
+
+
+def record_budget(budget):
+    """
+    Publish the remaining send budget as gauges.
+    """
+    metrics.set_gauge(BUDGET_TOKENS, budget.tokens)
+    if settings.EMAIL_DAILY_LIMIT:
+        metrics.set_gauge(
+            BUDGET_REMAINING_TODAY,
+            max(settings.EMAIL_DAILY_LIMIT - budget.sent_today, 0)
+        )
+
+
+def take_send_budget(wanted):
+    """
+    Reserve up to `wanted` sends from the shared budget.
+
+    Refills the token bucket for the time since it was last used (at
+    ``EMAIL_RATE_PER_SECOND``, up to ``EMAIL_RATE_BURST``), resets the daily
+    count on a new day, then grants what both limits allow. The row is
+    locked so concurrent dispatchers never overspend.
+
+    Returns:
+        int: The number of emails that may be sent now.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+
+    with transaction.atomic():
+        budget, _ = (
+            EmailSendBudget.objects.select_for_update()
+            .get_or_create(
+                name=BUDGET_NAME,
+                defaults={
+                    'tokens': settings.EMAIL_RATE_BURST,
+                    'refilled_at': now,
+                    'day': today,
+                }
+            )
+        )
+        elapsed = max((now - budget.refilled_at).total_seconds(), 0)
+        budget.tokens = min(
+            settings.EMAIL_RATE_BURST,
+            budget.tokens + elapsed * settings.EMAIL_RATE_PER_SECOND
+        )
+        budget.refilled_at = now
+        if budget.day != today:
+            budget.day = today
+            budget.sent_today = 0
+
+        granted = min(wanted, int(budget.tokens))
+        if settings.EMAIL_DAILY_LIMIT:
+            granted = min(
+                granted,
+                max(settings.EMAIL_DAILY_LIMIT - budget.sent_today, 0)
+            )
+        budget.tokens -= granted
+        budget.sent_today += granted
+        budget.save()
+
+    record_budget(budget)
+    return granted
+
+
+def return_send_budget(unused):
+    """
+    Give back budget reserved for emails that were not claimed after all.
+    """
+    if unused <= 0:
+        return
+    with transaction.atomic():
+        budget = EmailSendBudget.objects.select_for_update().get(
+            name=BUDGET_NAME
+        )
+        budget.tokens = min(
+            settings.EMAIL_RATE_BURST,
+            budget.tokens + unused
+        )
+        budget.sent_today = max(budget.sent_today - unused, 0)
+        budget.save(update_fields=['tokens', 'sent_today'])
+    record_budget(budget)
+
+
+def claim_emails(batch_size=50):
+    """
+    Lock and mark the next batch of due emails as sending.
+
+    Emails left in ``sending`` for longer than
+    ``EMAIL_OUTBOX_LEASE_SECONDS`` are claimed again.
+
+    Returns:
+        list[OutboundEmail]: The claimed emails, oldest first.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        emails = list(
+            due_emails().select_for_update(skip_locked=True)
+            .order_by('created_at', 'id')[:batch_size]
+        )
+        OutboundEmail.objects.filter(
+            id__in=[email.id for email in emails]
+        ).update(
+            status='sending',
+            started_at=now,
+            attempts=F('attempts') + 1
+        )
+
+    for email in emails:
+        email.status = 'sending'
+        email.started_at = now
+        email.attempts += 1
+    return emails
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before retrying an email after `attempts` tries.
+    """
+    delay = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** max(
+        attempts - 1, 0
+    )
+    return min(delay, settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS)
+
+
+def record_failure(email, error):
+    """
+    Schedule a retry for an email that could not be sent, or give up.
+    """
+    email.last_error = str(error) or error.__class__.__name__
+    if email.attempts < settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        delay = retry_delay(email.attempts)
+        email.status = 'pending'
+        email.send_after = timezone.now() + timedelta(seconds=delay)
+        logger.warning(
+            f"[OUTBOX] Sending '{email.subject}' to {email.recipient} "
+            f"failed, retrying in {delay}s: {error}"
+        )
+    else:
+        email.status = 'failed'
+        logger.error(
+            f"[OUTBOX] Giving up on '{email.subject}' to "
+            f"{email.recipient} after {email.attempts} attempt(s): {error}"
+        )
+    email.save(update_fields=['status', 'last_error', 'send_after'])
+
+
+def send_message(connection, message):
+    """
+    Send one message on an open connection, reconnecting once on failure.
+    """
+    try:
+        sent = connection.send_messages([message])
+    except Exception as e:
+        logger.warning(f"[OUTBOX] Send failed ({e}), reconnecting")
+        connection.close()
+        connection.open()
+        sent = connection.send_messages([message])
+    if not sent:
+        raise RuntimeError("The email backend did not accept the message")
+
+
+def send_batch(emails):
+    """
+    Send claimed emails over a single backend connection.
+
+    Messages go one at a time so each email gets its own outcome, but all
+    share the connection. Sent emails are marked in one query.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    connection = get_connection(fail_silently=False)
+    sent_ids = []
+    try:
+        connection.open()
+        for email in emails:
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=[email.recipient],
+                connection=connection,
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, 'text/html')
+            try:
+                send_message(connection, message)
+            except Exception as e:
+                record_failure(email, e)
+            else:
+                sent_ids.append(email.id)
+    except Exception as e:
+        # Could not connect at all; everything not yet sent is retried
+        for email in emails:
+            if email.id not in sent_ids and email.status == 'sending':
+                record_failure(email, e)
+    finally:
+        connection.close()
+
+    if sent_ids:
+        OutboundEmail.objects.filter(id__in=sent_ids).update(
+            status='sent',
+            sent_at=timezone.now(),
+            last_error=''
+        )
+    return len(sent_ids)
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Send claimed batches until no email is due or the budget runs out.
+
+    Records the achieved send rate in the ``outbox.messages_per_second``
+    gauge and the number of emails still waiting in ``outbox.queue_depth``.
+
+    Returns:
+        int: The number of emails attempted.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    attempted = sent = 0
+    started = time.monotonic()
+    while due_emails().exists():
+        granted = take_send_budget(batch_size)
+        if not granted:
+            logger.info("[OUTBOX] Send budget exhausted; deferring the rest")
+            break
+        emails = claim_emails(granted)
+        return_send_budget(granted - len(emails))
+        if not emails:
+            break
+        sent += send_batch(emails)
+        attempted += len(emails)
+
+    metrics.set_gauge(
+        QUEUE_DEPTH,
+        OutboundEmail.objects.filter(status__in=['pending', 'sending']).count()
+    )
+    if sent:
+        elapsed = time.monotonic() - started
+        rate = sent / elapsed if elapsed else float(sent)
+        metrics.set_gauge(SEND_RATE, rate)
+        logger.info(
+            f"[OUTBOX] Sent {sent} of {attempted} email(s) in "
+            f"{elapsed:.2f}s ({rate:.1f}/s)"
+        )
+    return attempted
@@ -48,7 +48,7 @@ INSTALLED_APPS = [
 # === Middleware ===
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'hobbyhub.middleware.ArchiveWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +88,37 @@ DATABASES = {
     )
 }
 
+# === Cache ===
+# Database-backed so every dyno and worker process shares the same metrics
+# and invalidations. Create the table with `manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'hobbyhub_cache',
+    },
+    # Read on every public page view: the box version and what is built
+    # from it (box schedule, cached home page). A table of its own keeps
+    # them clear of the default cache's culling. Also holds hobbyhub.metrics.
+    'hot': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'hobbyhub_hot_cache',
+    },
+}
+
+# Redis, when provisioned, keeps those reads off the database and makes
+# metric increments atomic.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES['hot'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        # Heroku Redis serves TLS with a self-signed certificate
+        'OPTIONS': (
+            {'ssl_cert_reqs': None}
+            if REDIS_URL.startswith('rediss://') else {}
+        ),
+    }
+
 # === Password Validation ===
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},  # noqa: E501
@@ -107,6 +138,12 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Archived box pages are pre-rendered to the database (boxes.archive), then
+# written here by each web process and served by WhiteNoise to visitors
+# without a session (see hobbyhub.middleware).
+ARCHIVE_ROOT = BASE_DIR / 'archive'
+ARCHIVE_MAX_AGE = int(os.getenv("ARCHIVE_MAX_AGE", 24 * 3600))
+
 STORAGES = {
     'default': {
         'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage',
@@ -138,6 +175,55 @@ STRIPE_3MO_PRICE_ID = os.getenv("STRIPE_3MO_PRICE_ID")
 STRIPE_6MO_PRICE_ID = os.getenv("STRIPE_6MO_PRICE_ID")
 STRIPE_12MO_PRICE_ID = os.getenv("STRIPE_12MO_PRICE_ID")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Subscription period and status are stored locally and kept current by
+# customer.subscription.* webhooks. Pages re-fetch a live subscription from
+# Stripe only when its stored copy is older than this many seconds.
+STRIPE_SUBSCRIPTION_SYNC_TTL_SECONDS = int(
+    os.getenv("STRIPE_SUBSCRIPTION_SYNC_TTL_SECONDS", 24 * 3600)
+)
+# Stale subscriptions are fetched in parallel on up to this many threads;
+# any not back within the timeout show as "refreshing" on the page.
+STRIPE_FETCH_MAX_WORKERS = int(os.getenv("STRIPE_FETCH_MAX_WORKERS", 4))
+STRIPE_FETCH_TIMEOUT_SECONDS = float(
+    os.getenv("STRIPE_FETCH_TIMEOUT_SECONDS", 2.0)
+)
+
+# === Webhook Inbox ===
+# Seconds before an event stuck in "processing" is handed to another worker.
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", 300))
+# Backoff for deferred events: base * 2^(attempt - 1), capped at the max.
+WEBHOOK_DEFER_BASE_SECONDS = int(os.getenv("WEBHOOK_DEFER_BASE_SECONDS", 30))
+WEBHOOK_DEFER_MAX_SECONDS = int(os.getenv("WEBHOOK_DEFER_MAX_SECONDS", 1800))
+# After this many attempts the handler runs without deferring.
+WEBHOOK_DEFER_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_DEFER_MAX_ATTEMPTS", 8))
+# Failing events are retried with the same backoff, then dead-lettered.
+WEBHOOK_RETRY_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_RETRY_MAX_ATTEMPTS", 5))
+
+# === Email Outbox ===
+# Seconds before an email stuck in "sending" is picked up again.
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", 300))
+# Retry backoff: base * 2^(attempt - 1), capped at the max.
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(
+    os.getenv("EMAIL_OUTBOX_RETRY_BASE_SECONDS", 60)
+)
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = int(
+    os.getenv("EMAIL_OUTBOX_RETRY_MAX_SECONDS", 3600)
+)
+# After this many failed attempts the email is marked failed.
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+# Emails claimed at once and sent over a single SMTP connection.
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 100))
+# Provider quota, shared by all dispatchers: a token bucket refilled at
+# EMAIL_RATE_PER_SECOND up to EMAIL_RATE_BURST, and a cap per day
+# (0 = no daily cap). Mail over budget waits in the outbox.
+EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", 5))
+EMAIL_RATE_BURST = int(os.getenv("EMAIL_RATE_BURST", 20))
+EMAIL_DAILY_LIMIT = int(os.getenv("EMAIL_DAILY_LIMIT", 2000))
+# The same email (template, recipient, business key) is not queued twice
+# within this many seconds (0 = never again).
+EMAIL_DEDUP_WINDOW_SECONDS = int(
+    os.getenv("EMAIL_DEDUP_WINDOW_SECONDS", 7 * 24 * 3600)
+)
 
 # === Email (always console for now) ===
 if DEBUG:
@@ -7,7 +7,8 @@ Main responsibilities:
 - Create subscriptions and orders based on Stripe session data.
 - Handle invoice payment successes, failures, and upcoming renewals.
 - Send appropriate confirmation or failure emails to users.
-- Sync Stripe customer and subscription data with local database models.
+- Sync Stripe customer and subscription data with local database models,
+  including each subscription's status and current period.
 
 Relies on:
 - Stripe API
@@ -15,13 +16,18 @@ Relies on:
 - HobbyHub custom mailers
 """
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from datetime import timezone as dt_timezone
 
 import stripe
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import IntegrityError, transaction
 from django.utils import timezone
 
+from boxes.schedule import get_shippable_box
+from hobbyhub import metrics
 from hobbyhub.mail import (
     send_gift_confirmation_to_sender,
     send_gift_notification_to_recipient,
@@ -31,15 +37,167 @@ from hobbyhub.mail import (
     send_upcoming_renewal_email
 )
 from hobbyhub.utils import PLAN_MAP
-from orders.models import (Box, Order, Payment, ShippingAddress,
+from orders.models import (Order, Payment, ShippingAddress,
                            StripeSubscriptionMeta)
+from users.models import UserProfile
 
 logger = logging.getLogger(__name__)
 
+# Local customer-to-user lookups that did / did not need Stripe.
+CUSTOMER_INDEX_HIT = "stripe.customer_index.hit"
+CUSTOMER_INDEX_MISS = "stripe.customer_index.miss"
 
-def handle_checkout_session_completed(session):
+# Checkout sessions resolved from the payload alone / needing a Stripe fetch.
+CHECKOUT_PAYLOAD_HIT = "stripe.checkout_payload.hit"
+CHECKOUT_PAYLOAD_FALLBACK = "stripe.checkout_payload.fallback"
+
+# Counts one-off orders parked because no active Box existed yet.
+DEFERRED_NO_BOX = "orders.deferred.no_box"
+
+# Subscriptions shown from their stored Stripe state / re-fetched from Stripe.
+SUBSCRIPTION_STATE_HIT = "stripe.subscription_state.hit"
+SUBSCRIPTION_STATE_REFRESH = "stripe.subscription_state.refresh"
+SUBSCRIPTION_STATE_TIMEOUT = "stripe.subscription_state.timeout"
+
+
+class DeferEvent(Exception):
+    """
+    Raised by a handler when an event cannot be processed yet.
+
+    The webhook worker parks the event and retries it later with
+    exponential backoff instead of blocking while waiting.
+    """
+
+
+def get_user_for_customer(customer_id):
+    """
+    Resolve a Stripe customer ID to a local user.
+
+    Uses the unique `UserProfile.stripe_customer_id` index first. Only on a
+    miss is the customer fetched from Stripe and matched by email; a single
+    match is linked to the profile so the next lookup stays local.
+
+    Args:
+        customer_id (str): The Stripe customer ID.
+
+    Returns:
+        User | None: The matching user, or None if not found or ambiguous.
+    """
+    if not customer_id:
+        return None
+
+    user = User.objects.filter(
+        profile__stripe_customer_id=customer_id
+    ).first()
+    if user:
+        metrics.increment(CUSTOMER_INDEX_HIT)
+        return user
+
+    metrics.increment(CUSTOMER_INDEX_MISS)
+    logger.warning(
+        f"[CUSTOMER INDEX] No local user for {customer_id}, "
+        "falling back to Stripe."
+    )
+
+    customer = stripe.Customer.retrieve(customer_id)
+    email = customer.get('email')
+    if not email:
+        logger.error(f"No email found for Stripe customer {customer_id}")
+        return None
+
+    matches = list(User.objects.filter(email__iexact=email)[:2])
+    if len(matches) != 1:
+        logger.error(
+            f"[CUSTOMER INDEX] {len(matches)} users match {email} "
+            f"for Stripe customer {customer_id}; not linking."
+        )
+        return None
+
+    user = matches[0]
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    linked_id = profile.stripe_customer_id
+    if linked_id and linked_id != customer_id:
+        logger.warning(
+            f"[CUSTOMER INDEX] {user} is linked to "
+            f"{linked_id}, not relinking to {customer_id}."
+        )
+        return user
+
+    try:
+        with transaction.atomic():
+            profile.stripe_customer_id = customer_id
+            profile.save(update_fields=['stripe_customer_id'])
+        logger.info(f"[CUSTOMER INDEX] Linked {customer_id} to {user}")
+    except IntegrityError:
+        logger.warning(
+            f"[CUSTOMER INDEX] {customer_id} is already linked elsewhere"
+        )
+    return user
+
+
+def extract_subscription_details(session):
+    """
+    Get the subscription and price IDs for a subscription checkout.
+
+    Reads the webhook payload first: `subscription` holds the ID (or the
+    expanded object) and checkout metadata carries `price_id`. Stripe is
+    only called when a field is missing, preferring a single
+    Subscription.retrieve over re-fetching the whole session.
+
+    Args:
+        session (dict): The Stripe checkout session from the event.
+
+    Returns:
+        Tuple[str | None, str | None]: (subscription_id, price_id).
+    """
+    subscription = session.get('subscription')
+    metadata = session.get('metadata') or {}
+    price_id = metadata.get('price_id')
+
+    if isinstance(subscription, dict):
+        # Already expanded in the payload
+        sub_id = subscription.get('id')
+        items = (subscription.get('items') or {}).get('data') or []
+        if items and not price_id:
+            price_id = items[0]['price']['id']
+    else:
+        sub_id = subscription
+
+    if sub_id and price_id:
+        metrics.increment(CHECKOUT_PAYLOAD_HIT)
+        return sub_id, price_id
+
+    metrics.increment(CHECKOUT_PAYLOAD_FALLBACK)
+    if sub_id:
+        logger.info(
+            f"[WEBHOOK] No price_id in payload for {sub_id}, "
+            "fetching subscription from Stripe"
+        )
+        sub = stripe.Subscription.retrieve(sub_id)
+    else:
+        logger.info(
+            f"[WEBHOOK] No subscription in payload for {session.get('id')}, "
+            "fetching session from Stripe"
+        )
+        sub = stripe.checkout.Session.retrieve(
+            session['id'],
+            expand=['subscription']
+        ).subscription
+        if not sub:
+            return None, None
+
+    return sub['id'], sub['items']['data'][0]['price']['id']
+
+
+def handle_checkout_session_completed(session, allow_defer=True):
     """
     Handle Stripe Checkout session completion.
+
+    Args:
+        session (dict): The Stripe checkout session object.
+        allow_defer (bool): Raise `DeferEvent` when a one-off order has no
+            active Box to ship in. Once retries are exhausted the worker
+            passes False and the order is created without a Box.
     """
     mode = session.get('mode')
     metadata = session.get('metadata', {})
@@ -97,48 +255,34 @@ def handle_checkout_session_completed(session):
         logger.error(f"User with ID {user_id} not found")
         return
 
-    box = (
-        Box.objects.filter(is_archived=False)
-                   .order_by('-shipping_date')
-                   .first()
-    )
+    # Only one-off orders are created here; subscription orders get their
+    # Box when the first invoice is paid.
+    box = None
+    if mode == 'payment':
+        box = get_shippable_box()
+
+        if not box and allow_defer:
+            metrics.increment(DEFERRED_NO_BOX)
+            logger.warning(
+                "[DEFERRED] No active boxes found for Order creation. "
+                f"Deferring session {session.get('id')} until one exists."
+            )
+            raise DeferEvent("No active box available for order creation")
 
-    if not box:
-        logger.error(
-            "[CRITICAL] No active boxes found for Order creation."
-            "Retrying in 2 seconds."
-        )
-        time.sleep(2)
-        box = (
-            Box.objects.filter(
-                is_archived=False
-            ).order_by(
-                '-shipping_date'
-            ).first()
-        )
         if not box:
             logger.critical(
-                "[CRITICAL] Retry failed."
-                "No active boxes available."
+                "[CRITICAL] Retries exhausted. "
+                "No active boxes available. "
                 "This order will be missing a Box ID and Shipping Date."
             )
 
     if mode == 'subscription':
         try:
-            session = (
-                stripe.checkout.Session.retrieve(
-                    session["id"],
-                    expand=["subscription"]
-                )
-            )
-            sub = session.subscription
-            if not sub:
-                logger.error("No subscription found in expanded session")
+            sub_id, price_id = extract_subscription_details(session)
+            if not sub_id:
+                logger.error("No subscription found for checkout session")
                 return
 
-            sub_id = sub.id
-            price_id = sub["items"]["data"][0]["price"]["id"]
-
             # ADDITIONAL LOGGING HERE
             logger.info(
                 f"Retrieved subscription: {sub_id},"
@@ -176,6 +320,7 @@ def handle_checkout_session_completed(session):
                 else:
                     sub_meta = StripeSubscriptionMeta.objects.create(
                         stripe_subscription_id=sub_id,
+                        stripe_price_id=price_id or '',
                         is_gift=is_gift,
                         shipping_address_id=address_id,
                         user_id=user_id
@@ -185,87 +330,50 @@ def handle_checkout_session_completed(session):
                         f"[CREATED] StripeSubscriptionMeta for {sub_id}"
                     )
 
+            if not created:
+                sub_meta.stripe_price_id = price_id
+                sub_meta.shipping_address = shipping_address
+                sub_meta.is_gift = is_gift
+                sub_meta.save()
+
             # Extract directly from metadata for email only
             recipient_email = metadata.get('recipient_email')
             recipient_name = metadata.get('recipient_name', 'Friend')
             sender_name = metadata.get('sender_name', 'Someone')
             gift_message = metadata.get('gift_message', '')
 
-            # Send the appropriate emails
+            # Send the appropriate emails, once per subscription
             if is_gift and recipient_email:
                 send_gift_notification_to_recipient(
                     recipient_email,
                     sender_name,
                     gift_message,
-                    recipient_name
+                    recipient_name,
+                    business_key=sub_id
+                )
+                send_gift_confirmation_to_sender(
+                    user,
+                    recipient_name,
+                    business_key=sub_id
                 )
-                send_gift_confirmation_to_sender(user, recipient_name)
                 logger.info(
-                    f"[EMAIL] Gift confirmation sent to {recipient_email}"
+                    f"[EMAIL] Gift confirmation queued for {recipient_email}"
                 )
             else:
                 _, plan_name = PLAN_MAP.get(price_id, (None, "Unknown Plan"))
-                send_subscription_confirmation_email(user, plan_name)
+                send_subscription_confirmation_email(
+                    user,
+                    plan_name,
+                    business_key=sub_id
+                )
                 logger.info(
                     "[EMAIL] Subscription confirmation email "
-                    f"sent to {user.email} for {plan_name}"
+                    f"queued for {user.email} for {plan_name}"
                 )
 
-                if created:
-                    logger.info(
-                        f"[CREATED] StripeSubscriptionMeta for {sub_id} "
-                        f"with is_gift={is_gift}"
-                    )
-                else:
-                    logger.warning(
-                        f"[EXISTS] StripeSubscriptionMeta for {sub_id} "
-                        "already exists, skipping creation."
-                    )
-
-            if not created:
-                sub_meta.stripe_price_id = price_id
-                sub_meta.shipping_address = shipping_address
-                sub_meta.is_gift = is_gift
-                sub_meta.save()
-
-            logger.info(
-                f"[CREATED] StripeSubscriptionMeta for {sub_id} "
-                f"with is_gift={is_gift}"
-            )
-            logger.info(f"Created StripeSubscriptionMeta for {sub_id}")
-
-            try:
-                _, plan_name = PLAN_MAP.get(price_id, (None, "Unknown Plan"))
-
-                if is_gift and metadata.get('recipient_email'):
-                    recipient_email = metadata['recipient_email']
-                    recipient_name = metadata.get('recipient_name', 'Friend')
-                    sender_name = metadata.get('sender_name', 'Someone')
-                    gift_message = metadata.get('gift_message', '')
-
-                    send_gift_notification_to_recipient(
-                        recipient_email,
-                        sender_name,
-                        gift_message,
-                        recipient_name
-                    )
-                    send_gift_confirmation_to_sender(user, recipient_name)
-                    logger.info(
-                        f"[EMAIL] Gift confirmation sent to {recipient_email}"
-                    )
-                else:
-                    send_subscription_confirmation_email(user, plan_name)
-                    logger.info(
-                        "[EMAIL] Subscription confirmation email "
-                        f"sent to {user.email} "
-                        f"for {plan_name}"
-                    )
-            except Exception as e:
-                logger.error(f"Error in creating subscription/order: {e}")
-                raise
-
         except Exception as e:
             logger.error(f"Error in creating subscription/order: {e}")
+            raise
 
     elif mode == 'payment':
         try:
@@ -407,9 +515,14 @@ def handle_checkout_session_completed(session):
                         recipient_email,
                         sender_name or "Someone",
                         gift_message or "No message provided.",
-                        recipient_name
+                        recipient_name,
+                        business_key=payment_intent_id
+                    )
+                    send_gift_confirmation_to_sender(
+                        user,
+                        recipient_name,
+                        business_key=payment_intent_id
                     )
-                    send_gift_confirmation_to_sender(user, recipient_name)
                     logger.info(
                         f"[EMAIL] Gift confirmation sent to {recipient_email}"
                     )
@@ -423,9 +536,7 @@ def handle_checkout_session_completed(session):
 
         except Exception as e:
             logger.error(f"Error handling one-off payment: {e}")
-
-        except Exception as e:
-            logger.error(f"Error handling one-off payment: {e}")
+            raise
 
     else:
         logger.error(f"Unhandled checkout mode: {mode}")
@@ -448,18 +559,14 @@ def handle_invoice_payment_succeeded(invoice):
     payment_date = timezone.now()
 
     try:
-        # Fetch the customer from Stripe
-        customer = stripe.Customer.retrieve(customer_id)
-        email = customer.get('email')
-        if not email:
+        user = get_user_for_customer(customer_id)
+        if not user:
             logger.error(
-                f"No email found for Stripe customer {customer.id} "
+                f"No user found for Stripe customer {customer_id} "
                 f"for invoice {invoice.get('id')}"
             )
             return
 
-        user = User.objects.get(email=email)
-
         # Fetch associated subscription metadata
         sub_meta, created = StripeSubscriptionMeta.objects.get_or_create(
             stripe_subscription_id=subscription_id,
@@ -511,11 +618,7 @@ def handle_invoice_payment_succeeded(invoice):
             return
 
         # Find the latest box
-        box = (
-            Box.objects.filter(is_archived=False)
-            .order_by('-shipping_date')
-            .first()
-        )
+        box = get_shippable_box()
 
         # Fetch or create the order
         try:
@@ -567,6 +670,7 @@ def handle_invoice_payment_succeeded(invoice):
                 subscription_id,
                 e
             )
+            raise
 
         if not invoice.get('payment_intent'):
             logger.error(
@@ -606,6 +710,7 @@ def handle_invoice_payment_succeeded(invoice):
         )
     except Exception as e:
         logger.error(f"Invoice payment succeeded error: {e}")
+        raise
 
 
 def handle_invoice_payment_failed(invoice):
@@ -615,15 +720,29 @@ def handle_invoice_payment_failed(invoice):
     Args:
         invoice (dict): The Stripe invoice object.
 
-    - Sends a payment failure notification email to the user.
+    - Sends a payment failure notification email to the user, once per
+      payment attempt.
     - Logs error if user lookup fails.
     """
     try:
-        customer = stripe.Customer.retrieve(invoice.get('customer'))
-        user = User.objects.get(email=customer.get('email'))
-        send_payment_failed_email(user)
+        user = get_user_for_customer(invoice.get('customer'))
+        if not user:
+            logger.error(
+                f"No user found for Stripe customer {invoice.get('customer')}"
+            )
+            return
+        # Stripe retries the charge, so each failed attempt gets one email
+        invoice_id = invoice.get('id')
+        send_payment_failed_email(
+            user,
+            business_key=(
+                f"{invoice_id}:{invoice.get('attempt_count', 1)}"
+                if invoice_id else None
+            )
+        )
     except Exception as e:
         logger.error(f"Invoice payment failed error: {e}")
+        raise
 
 
 def handle_invoice_upcoming(invoice):
@@ -634,7 +753,8 @@ def handle_invoice_upcoming(invoice):
         invoice (dict): The Stripe invoice object.
 
     - Sends a notification to the user reminding them of the upcoming charge.
-    - Only sends if `next_payment_attempt` is available.
+    - Only sends if `next_payment_attempt` is available, and once per
+      renewal date.
     - Logs error if user lookup fails.
     """
     next_renewal_ts = invoice.get('next_payment_attempt')
@@ -658,8 +778,259 @@ def handle_invoice_upcoming(invoice):
         return
 
     try:
-        customer = stripe.Customer.retrieve(invoice.get('customer'))
-        user = User.objects.get(email=customer.get('email'))
-        send_upcoming_renewal_email(user, next_renewal)
+        user = get_user_for_customer(invoice.get('customer'))
+        if not user:
+            logger.error(
+                f"No user found for Stripe customer {invoice.get('customer')}"
+            )
+            return
+        send_upcoming_renewal_email(
+            user,
+            next_renewal,
+            business_key=(
+                f"{invoice.get('subscription') or invoice.get('customer')}"
+                f":{next_renewal_ts}"
+            )
+        )
     except Exception as e:
         logger.error(f"Invoice upcoming email error: {e}")
+        raise
+
+
+def from_stripe_timestamp(value):
+    """Convert a Stripe Unix timestamp to an aware datetime, or None."""
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def subscription_period_end(subscription):
+    """
+    The end of a subscription's current period.
+
+    Newer API versions carry it on each subscription item, older ones on
+    the subscription itself; `billing_cycle_anchor` is the last resort.
+
+    Returns:
+        datetime | None
+    """
+    items = (subscription.get('items') or {}).get('data') or []
+    period_end = (
+        (items[0].get('current_period_end') if items else None)
+        or subscription.get('current_period_end')
+        or subscription.get('billing_cycle_anchor')
+    )
+    return from_stripe_timestamp(period_end)
+
+
+def apply_subscription_state(sub_meta, subscription):
+    """
+    Copy status, current period and cancellation from a Stripe
+    subscription onto its `StripeSubscriptionMeta` and save them.
+
+    A subscription cancelled in Stripe (now or at period end) is marked
+    cancelled locally too, keeping the date Stripe recorded. One resumed
+    in Stripe before its period ended is no longer marked cancelled.
+    """
+    sub_meta.status = subscription.get('status') or ''
+    sub_meta.current_period_end = subscription_period_end(subscription)
+    sub_meta.cancel_at_period_end = bool(
+        subscription.get('cancel_at_period_end')
+    )
+    sub_meta.synced_at = timezone.now()
+    fields = [
+        'status', 'current_period_end', 'cancel_at_period_end', 'synced_at'
+    ]
+
+    cancelled = (
+        sub_meta.status == 'canceled' or sub_meta.cancel_at_period_end
+    )
+    if cancelled and not sub_meta.cancelled_at:
+        sub_meta.cancelled_at = (
+            from_stripe_timestamp(subscription.get('canceled_at'))
+            or timezone.now()
+        )
+        fields.append('cancelled_at')
+    elif not cancelled and sub_meta.cancelled_at:
+        sub_meta.cancelled_at = None
+        fields.append('cancelled_at')
+
+    sub_meta.save(update_fields=fields)
+
+
+def subscription_needs_sync(sub_meta, now=None):
+    """
+    Whether a subscription's stored Stripe state is too old to show.
+
+    Subscriptions Stripe has ended are shown from local data only, so
+    they never need a fetch. All others, including those set to cancel at
+    period end, which can still be resumed, are re-fetched once their copy
+    is older than `STRIPE_SUBSCRIPTION_SYNC_TTL_SECONDS`.
+    """
+    if (
+        sub_meta.status == 'canceled'
+        or not sub_meta.stripe_subscription_id
+    ):
+        return False
+    if not sub_meta.synced_at:
+        return True
+    age = (now or timezone.now()) - sub_meta.synced_at
+    return age.total_seconds() > settings.STRIPE_SUBSCRIPTION_SYNC_TTL_SECONDS
+
+
+def fetch_subscriptions(sub_ids, timeout=None, max_workers=None):
+    """
+    Retrieve subscriptions from Stripe in parallel, waiting at most
+    `timeout` seconds for the lot.
+
+    Calls run on a pool of at most `max_workers` threads. Calls still
+    running at the deadline are abandoned: they finish in the background
+    and their results are dropped, and calls not yet started are cancelled.
+    Only the Stripe requests run on the pool; callers store the results
+    on their own thread and database connection.
+
+    Args:
+        sub_ids (Iterable[str]): Stripe subscription IDs.
+        timeout (float | None): Defaults to STRIPE_FETCH_TIMEOUT_SECONDS.
+        max_workers (int | None): Defaults to STRIPE_FETCH_MAX_WORKERS.
+
+    Returns:
+        tuple[dict, set]: (subscriptions by ID, IDs not fetched in time).
+        IDs whose fetch failed are in neither.
+    """
+    sub_ids = list(dict.fromkeys(sub_ids))
+    if not sub_ids:
+        return {}, set()
+    if timeout is None:
+        timeout = settings.STRIPE_FETCH_TIMEOUT_SECONDS
+    max_workers = min(
+        max_workers or settings.STRIPE_FETCH_MAX_WORKERS,
+        len(sub_ids)
+    )
+
+    pool = ThreadPoolExecutor(
+        max_workers=max_workers,
+        thread_name_prefix='stripe-fetch'
+    )
+    futures = {
+        pool.submit(stripe.Subscription.retrieve, sub_id): sub_id
+        for sub_id in sub_ids
+    }
+    done, not_done = wait(futures, timeout=timeout)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    fetched = {}
+    for future in done:
+        sub_id = futures[future]
+        try:
+            fetched[sub_id] = future.result()
+        except stripe.error.StripeError as e:
+            logger.error(f"Failed to refresh subscription {sub_id}: {e}")
+
+    pending = {futures[future] for future in not_done}
+    if pending:
+        metrics.increment(SUBSCRIPTION_STATE_TIMEOUT, len(pending))
+        logger.warning(
+            f"[SUBSCRIPTION] {len(pending)} of {len(sub_ids)} Stripe "
+            f"fetch(es) missed the {timeout}s deadline"
+        )
+    return fetched, pending
+
+
+def sync_subscription_states(subs, timeout=None):
+    """
+    Fetch several subscriptions from Stripe at once and store their
+    current state.
+
+    Used when webhooks have not refreshed subscriptions within the TTL.
+    Failed or late fetches keep the stored (possibly stale) values.
+
+    Args:
+        subs (list[StripeSubscriptionMeta]): The subscriptions to refresh.
+        timeout (float | None): See `fetch_subscriptions`.
+
+    Returns:
+        set: IDs of the subscriptions still refreshing at the deadline.
+    """
+    metrics.increment(SUBSCRIPTION_STATE_REFRESH, len(subs))
+    by_id = {sub.stripe_subscription_id: sub for sub in subs}
+    fetched, pending = fetch_subscriptions(by_id, timeout=timeout)
+    for sub_id, subscription in fetched.items():
+        apply_subscription_state(by_id[sub_id], subscription)
+    return pending
+
+
+def handle_customer_subscription_updated(subscription):
+    """
+    Handle a Stripe subscription being created, renewed, changed or
+    cancelled.
+
+    Args:
+        subscription (dict): The Stripe subscription object.
+
+    - Stores the new status, current period and cancellation on the
+      matching `StripeSubscriptionMeta`.
+    - Subscriptions not recorded yet are skipped; checkout creates them
+      and the next page view fetches their state.
+    """
+    sub_id = subscription.get('id')
+    with transaction.atomic():
+        sub_meta = (
+            StripeSubscriptionMeta.objects.select_for_update()
+            .filter(stripe_subscription_id=sub_id)
+            .first()
+        )
+        if not sub_meta:
+            logger.info(
+                f"[SUBSCRIPTION] No local record for {sub_id} yet; skipping"
+            )
+            return
+        apply_subscription_state(sub_meta, subscription)
+    logger.info(
+        f"[SUBSCRIPTION] {sub_id} is {sub_meta.status}, period ends "
+        f"{sub_meta.current_period_end}"
+    )
+
+
+# Deleted subscriptions carry their final state; store it the same way.
+handle_customer_subscription_deleted = handle_customer_subscription_updated
+
+
+# Maps Stripe event types to the handler that processes their data object.
+EVENT_HANDLERS = {
+    'checkout.session.completed': handle_checkout_session_completed,
+    'invoice.payment_succeeded': handle_invoice_payment_succeeded,
+    'invoice.payment_failed': handle_invoice_payment_failed,
+    'invoice.upcoming': handle_invoice_upcoming,
+    'customer.subscription.created': handle_customer_subscription_updated,
+    'customer.subscription.updated': handle_customer_subscription_updated,
+    'customer.subscription.deleted': handle_customer_subscription_deleted,
+}
+
+
+# Event types whose handler may raise `DeferEvent`.
+DEFERRABLE_EVENTS = {'checkout.session.completed'}
+
+
+def dispatch_event(event, allow_defer=True):
+    """
+    Route a Stripe event to its handler.
+
+    Args:
+        event (dict): The Stripe event (``type`` and ``data.object``).
+        allow_defer (bool): Passed to handlers that can defer the event.
+
+    Returns:
+        bool: True if a handler ran, False if the event type is ignored.
+    """
+    event_type = event['type']
+    handler = EVENT_HANDLERS.get(event_type)
+    if not handler:
+        logger.info(f"Ignored event type: {event_type}")
+        return False
+
+    if event_type in DEFERRABLE_EVENTS:
+        handler(event['data']['object'], allow_defer=allow_defer)
+    else:
+        handler(event['data']['object'])
+    return True
@@ -1,13 +1,24 @@
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import MagicMock, patch
 
 from django.contrib.messages import get_messages
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.core import mail
-from django.test import RequestFactory, TestCase
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import transaction
+from django.test import RequestFactory, TestCase, override_settings
 from django.utils import timezone
 
+from hobbyhub.email_templates import (
+    InlineCSSLoader,
+    get_email_templates,
+    get_engine,
+    inline_css,
+    render_email
+)
 from hobbyhub.mail import (
     send_gift_confirmation_to_sender,
     send_gift_notification_to_recipient,
@@ -16,13 +27,35 @@ from hobbyhub.mail import (
     send_subscription_confirmation_email,
     send_upcoming_renewal_email
 )
+from hobbyhub import metrics
+from hobbyhub.outbox import (
+    BUDGET_REMAINING_TODAY,
+    BUDGET_TOKENS,
+    DEDUP_SUPPRESSED,
+    QUEUE_DEPTH,
+    SEND_RATE,
+    send_queued_emails,
+    take_send_budget
+)
+from hobbyhub.stripe_handlers import (
+    extract_subscription_details,
+    get_user_for_customer,
+    handle_invoice_payment_failed
+)
 from hobbyhub.utils import (
     alert, build_shipping_details, get_gift_metadata,
     get_subscription_duration_display,
     get_subscription_status,
     get_user_default_shipping_address
 )
-from users.models import ShippingAddress, User
+from users.models import (
+    EmailSendBudget,
+    EmailSendLedger,
+    OutboundEmail,
+    ShippingAddress,
+    User,
+    UserProfile
+)
 
 
 class TestMailFunctions(TestCase):
@@ -34,6 +67,7 @@ class TestMailFunctions(TestCase):
             'Enjoy this!',
             'Recipient Name'
         )
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to, ['test@example.com'])
         self.assertIn('Enjoy this!', mail.outbox[0].body)
@@ -44,6 +78,7 @@ class TestMailFunctions(TestCase):
             email="sender@example.com"
         )
         send_gift_confirmation_to_sender(user, 'Recipient Name')
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to, ['sender@example.com'])
         self.assertIn('Recipient Name', mail.outbox[0].body)
@@ -54,6 +89,7 @@ class TestMailFunctions(TestCase):
             email="user@example.com"
         )
         send_order_confirmation_email(user, 1234)
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Order #1234', mail.outbox[0].subject)
 
@@ -63,6 +99,7 @@ class TestMailFunctions(TestCase):
             email="user@example.com"
         )
         send_subscription_confirmation_email(user, "Monthly Plan")
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Monthly Plan', mail.outbox[0].body)
 
@@ -72,6 +109,7 @@ class TestMailFunctions(TestCase):
             email="user@example.com"
         )
         send_payment_failed_email(user)
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Payment Failed', mail.outbox[0].subject)
 
@@ -81,10 +119,332 @@ class TestMailFunctions(TestCase):
             email="user@example.com"
         )
         send_upcoming_renewal_email(user, timezone.now() + timedelta(days=7))
+        send_queued_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Your subscription is set to renew', mail.outbox[0].body)
 
 
+class TestEmailTemplates(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="templateuser",
+            email="template@example.com"
+        )
+
+    def test_email_is_sent_with_text_and_html(self):
+        send_order_confirmation_email(self.user, 1234)
+        send_queued_emails()
+
+        message = mail.outbox[0]
+        self.assertEqual(
+            message.body,
+            "Thanks for your order #1234, it's now being processed."
+        )
+        html, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('Thanks for your order #1234', html)
+
+    def test_html_has_stylesheet_inlined(self):
+        _, html = render_email(
+            'registration',
+            {'user': self.user, 'confirmation_url': 'https://example.com/c'}
+        )
+
+        self.assertNotIn('<style', html)
+        self.assertIn('class="button"', html)
+        self.assertRegex(html, r'<a class="button"[^>]*style="[^"]*#2e7d32')
+
+    def test_html_escapes_recipient_context(self):
+        text, html = render_email(
+            'gift_recipient',
+            {
+                'recipient_name': 'Sam',
+                'sender_name': 'Alex',
+                'gift_message': '<script>alert(1)</script>',
+            }
+        )
+
+        self.assertIn('<script>alert(1)</script>', text)
+        self.assertNotIn('<script>', html)
+
+    def test_templates_are_compiled_once_per_process(self):
+        get_email_templates.cache_clear()
+        get_engine().template_loaders[0].reset()
+        with patch.object(
+            InlineCSSLoader,
+            'get_contents',
+            autospec=True,
+            side_effect=InlineCSSLoader.get_contents
+        ) as mock_contents:
+            for tracking_number in ('TRK1', 'TRK2', None):
+                render_email('shipping_confirmation', {
+                    'user': self.user,
+                    'box_name': 'October',
+                    'tracking_number': tracking_number,
+                })
+            calls = mock_contents.call_count
+            render_email('shipping_confirmation', {
+                'user': self.user,
+                'box_name': 'November',
+                'tracking_number': None,
+            })
+
+        self.assertGreater(calls, 0)
+        self.assertEqual(mock_contents.call_count, calls)
+
+    def test_inline_css_applies_rules_by_specificity(self):
+        css = "a.button { color: white } a { color: green } p { margin: 0 }"
+        html = inline_css(
+            '<p style="margin: 4px"><a class="button" href="#">Go</a></p>',
+            css
+        )
+
+        self.assertEqual(
+            html,
+            '<p style="margin: 0; margin: 4px">'
+            '<a class="button" href="#" style="color: green; color: white">'
+            'Go</a></p>'
+        )
+
+    def test_benchmark_email_render_command(self):
+        out = StringIO()
+
+        call_command('benchmark_email_render', '--messages', '5', stdout=out)
+
+        self.assertIn('cached templates', out.getvalue())
+        self.assertIn('per 10k', out.getvalue())
+
+
+LOCMEM_SEND = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+
+
+class TestEmailOutbox(TestCase):
+
+    def setUp(self):
+        metrics.get_cache().clear()
+        self.user = User.objects.create(
+            username="outboxuser",
+            email="outbox@example.com"
+        )
+
+    def test_send_user_email_queues_instead_of_sending(self):
+        send_payment_failed_email(self.user)
+
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, 'pending')
+        self.assertEqual(queued.recipient, 'outbox@example.com')
+
+        send_queued_emails()
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'sent')
+        self.assertIsNotNone(queued.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_email_is_dropped_when_transaction_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                send_payment_failed_email(self.user)
+                raise RuntimeError("Order save failed")
+
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    @patch(LOCMEM_SEND, side_effect=OSError("SMTP down"))
+    def test_failed_send_is_retried_later(self, mock_send):
+        send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, 'pending')
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(queued.last_error, 'SMTP down')
+        self.assertGreater(queued.send_after, timezone.now())
+
+        # Not due yet, so a second pass leaves it alone
+        self.assertEqual(send_queued_emails(), 0)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=1)
+    @patch(LOCMEM_SEND, side_effect=OSError("SMTP down"))
+    def test_email_fails_after_max_attempts(self, mock_send):
+        send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        self.assertEqual(OutboundEmail.objects.get().status, 'failed')
+
+    def test_email_abandoned_mid_send_is_reclaimed(self):
+        send_payment_failed_email(self.user)
+        OutboundEmail.objects.update(
+            status='sending',
+            attempts=1,
+            started_at=timezone.now() - timedelta(hours=1)
+        )
+
+        send_queued_emails()
+
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, 'sent')
+        self.assertEqual(queued.attempts, 2)
+
+    def test_email_in_flight_is_not_sent_twice(self):
+        send_payment_failed_email(self.user)
+        OutboundEmail.objects.update(
+            status='sending',
+            started_at=timezone.now()
+        )
+
+        self.assertEqual(send_queued_emails(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @patch('hobbyhub.outbox.get_connection', wraps=get_connection)
+    def test_batch_is_sent_over_one_connection(self, mock_connection):
+        for _ in range(3):
+            send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        mock_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            OutboundEmail.objects.filter(status='sent').count(),
+            3
+        )
+        self.assertGreater(metrics.get_value(SEND_RATE), 0)
+
+    @override_settings(EMAIL_OUTBOX_BATCH_SIZE=2)
+    @patch('hobbyhub.outbox.get_connection', wraps=get_connection)
+    def test_batch_size_limits_messages_per_connection(self, mock_connection):
+        for _ in range(3):
+            send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        self.assertEqual(mock_connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @patch(LOCMEM_SEND, side_effect=[OSError("Server disconnected"), 1])
+    def test_send_reconnects_after_dropped_connection(self, mock_send):
+        send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        self.assertEqual(mock_send.call_count, 2)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, 'sent')
+        self.assertEqual(queued.attempts, 1)
+
+    @override_settings(EMAIL_RATE_BURST=2, EMAIL_RATE_PER_SECOND=0)
+    def test_mail_over_rate_budget_is_deferred(self):
+        for _ in range(3):
+            send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            OutboundEmail.objects.filter(status='pending').count(),
+            1
+        )
+        self.assertEqual(metrics.get_value(BUDGET_TOKENS), 0)
+        self.assertEqual(metrics.get_value(QUEUE_DEPTH), 1)
+
+    @override_settings(EMAIL_RATE_BURST=5, EMAIL_RATE_PER_SECOND=1)
+    def test_rate_budget_refills_over_time(self):
+        EmailSendBudget.objects.create(
+            name='smtp',
+            tokens=0,
+            refilled_at=timezone.now() - timedelta(seconds=3)
+        )
+
+        self.assertEqual(take_send_budget(10), 3)
+
+    @override_settings(EMAIL_DAILY_LIMIT=1)
+    def test_daily_limit_defers_until_next_day(self):
+        send_payment_failed_email(self.user)
+        send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(metrics.get_value(BUDGET_REMAINING_TODAY), 0)
+
+        EmailSendBudget.objects.update(
+            day=timezone.localdate() - timedelta(days=1)
+        )
+        send_queued_emails()
+
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(EMAIL_RATE_BURST=5, EMAIL_RATE_PER_SECOND=0)
+    def test_unclaimed_budget_is_returned(self):
+        send_payment_failed_email(self.user)
+
+        send_queued_emails()
+
+        budget = EmailSendBudget.objects.get()
+        self.assertEqual(budget.tokens, 4)
+        self.assertEqual(budget.sent_today, 1)
+
+    def test_duplicate_email_for_business_key_is_suppressed(self):
+        send_subscription_confirmation_email(
+            self.user, "Monthly Plan", business_key='sub_1'
+        )
+        send_subscription_confirmation_email(
+            self.user, "Monthly Plan", business_key='sub_1'
+        )
+        send_subscription_confirmation_email(
+            self.user, "Monthly Plan", business_key='sub_2'
+        )
+
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertEqual(metrics.get_value(DEDUP_SUPPRESSED), 1)
+        self.assertEqual(
+            metrics.get_value(
+                f"{DEDUP_SUPPRESSED}.subscription_confirmation"
+            ),
+            1
+        )
+
+    def test_emails_without_business_key_are_not_deduplicated(self):
+        send_payment_failed_email(self.user)
+        send_payment_failed_email(self.user)
+
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertFalse(EmailSendLedger.objects.exists())
+
+    @override_settings(EMAIL_DEDUP_WINDOW_SECONDS=60)
+    def test_email_is_sent_again_after_dedup_window(self):
+        send_payment_failed_email(self.user, business_key='in_1:1')
+        EmailSendLedger.objects.update(
+            sent_at=timezone.now() - timedelta(minutes=2)
+        )
+
+        send_payment_failed_email(self.user, business_key='in_1:1')
+
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertEqual(metrics.get_value(DEDUP_SUPPRESSED), 0)
+
+    def test_dedup_claim_rolls_back_with_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                send_order_confirmation_email(self.user, 42)
+                raise RuntimeError("handler failed")
+
+        send_order_confirmation_email(self.user, 42)
+
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_send_queued_emails_command_once(self):
+        send_payment_failed_email(self.user)
+
+        call_command('send_queued_emails', '--once', stdout=StringIO())
+
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+
 class TestUtilsFunctions(TestCase):
 
     def setUp(self):
@@ -198,3 +558,112 @@ class TestUtilsFunctions(TestCase):
 
         # Check the status is what we expect
         self.assertEqual(status, "Active")
+
+
+class TestStripeCustomerLookup(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="customer",
+            email="customer@example.com"
+        )
+        UserProfile.objects.update_or_create(
+            user=self.user,
+            defaults={'stripe_customer_id': 'cus_local'}
+        )
+
+    @patch('stripe.Customer.retrieve')
+    def test_lookup_uses_local_index(self, mock_retrieve):
+        self.assertEqual(get_user_for_customer('cus_local'), self.user)
+        mock_retrieve.assert_not_called()
+
+    @patch('stripe.Customer.retrieve')
+    def test_lookup_falls_back_to_stripe_and_links(self, mock_retrieve):
+        other = User.objects.create(
+            username="unlinked",
+            email="unlinked@example.com"
+        )
+        mock_retrieve.return_value = {'email': 'unlinked@example.com'}
+
+        self.assertEqual(get_user_for_customer('cus_remote'), other)
+        self.assertEqual(
+            UserProfile.objects.get(user=other).stripe_customer_id,
+            'cus_remote'
+        )
+
+        # Second lookup is served locally
+        get_user_for_customer('cus_remote')
+        mock_retrieve.assert_called_once_with('cus_remote')
+
+    @patch('stripe.Customer.retrieve')
+    def test_lookup_refuses_ambiguous_email(self, mock_retrieve):
+        User.objects.create(username="twin1", email="twin@example.com")
+        User.objects.create(username="twin2", email="twin@example.com")
+        mock_retrieve.return_value = {'email': 'twin@example.com'}
+
+        self.assertIsNone(get_user_for_customer('cus_twin'))
+
+    @patch('stripe.Customer.retrieve')
+    def test_invoice_handler_skips_stripe_for_known_customer(
+        self, mock_retrieve
+    ):
+        handle_invoice_payment_failed({'customer': 'cus_local'})
+        send_queued_emails()
+
+        mock_retrieve.assert_not_called()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+
+
+class TestExtractSubscriptionDetails(TestCase):
+
+    @patch('stripe.checkout.Session.retrieve')
+    @patch('stripe.Subscription.retrieve')
+    def test_reads_ids_from_payload(self, mock_sub, mock_session):
+        session = {
+            'id': 'cs_1',
+            'subscription': 'sub_1',
+            'metadata': {'price_id': 'price_m'},
+        }
+
+        self.assertEqual(
+            extract_subscription_details(session),
+            ('sub_1', 'price_m')
+        )
+        mock_sub.assert_not_called()
+        mock_session.assert_not_called()
+
+    @patch('stripe.Subscription.retrieve')
+    def test_reads_price_from_expanded_subscription(self, mock_sub):
+        session = {
+            'id': 'cs_1',
+            'subscription': {
+                'id': 'sub_1',
+                'items': {'data': [{'price': {'id': 'price_3'}}]},
+            },
+            'metadata': {},
+        }
+
+        self.assertEqual(
+            extract_subscription_details(session),
+            ('sub_1', 'price_3')
+        )
+        mock_sub.assert_not_called()
+
+    @patch('stripe.checkout.Session.retrieve')
+    @patch('stripe.Subscription.retrieve')
+    def test_fetches_subscription_when_price_missing(
+        self, mock_sub, mock_session
+    ):
+        mock_sub.return_value = {
+            'id': 'sub_1',
+            'items': {'data': [{'price': {'id': 'price_6'}}]},
+        }
+        session = {'id': 'cs_1', 'subscription': 'sub_1', 'metadata': {}}
+
+        self.assertEqual(
+            extract_subscription_details(session),
+            ('sub_1', 'price_6')
+        )
+        mock_sub.assert_called_once_with('sub_1')
+        mock_session.assert_not_called()
@@ -8,6 +8,7 @@ Includes helpers for:
 - Collecting metadata for gifts
 - Display Sub Duration
 - Display Sub Status
+- Parsing yes/no filters
 
 Import and use these anywhere you need a reusable function that keeps views
 clean and DRY.
@@ -31,6 +32,9 @@ PLAN_MAP = {
     settings.STRIPE_12MO_PRICE_ID: (12, "12-month plan"),
 }
 
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
 
 def alert(request, level, msg):
     """
@@ -173,3 +177,27 @@ def get_subscription_status(sub):
     if sub.cancelled_at:
         return f"Cancelled on {sub.cancelled_at.strftime('%d %b %Y')}"
     return "Active"
+
+
+def parse_yes_no(value, name="filter"):
+    """
+    Read a yes/no filter from a query string or command option.
+
+    Args:
+        value (str | None): The raw value, e.g. ``'yes'`` or ``'0'``.
+        name (str): Used in the error message.
+
+    Returns:
+        bool | None: None when blank, otherwise the parsed value.
+
+    Raises:
+        ValueError: If the value is not a recognised yes/no.
+    """
+    value = (value or '').strip().lower()
+    if not value:
+        return None
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"Invalid {name} filter: {value!r}")
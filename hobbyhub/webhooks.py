@@ -0,0 +1,546 @@
+"""
+webhooks.py
+
+Durable inbox for Stripe webhook events.
+
+The webhook view only verifies the signature and calls `enqueue_event()`,
+so Stripe gets its 200 in a few milliseconds. The `process_webhooks`
+management command then drains the inbox with `drain()`, running each
+event through the existing handlers in `hobbyhub.stripe_handlers`.
+
+Each event records its status, number of attempts, last error and how long
+the handler took, so slow or failing events can be spotted in the admin.
+
+Handlers that cannot finish yet (e.g. no Box exists for a one-off order)
+raise `DeferEvent`; the event is parked with a `retry_after` time using
+bounded exponential backoff rather than blocking the worker. Handler
+errors are retried the same way; once retries run out the event is copied
+to `DeadLetterEvent`, where staff can inspect and replay it.
+
+The inbox doubles as an idempotency ledger: `stripe_event_id` is unique, so
+a Stripe redelivery costs a single failed insert and never reaches the
+handlers. Hits and misses are counted in `hobbyhub.metrics`.
+
+To keep up with renewal spikes the inbox can be drained by several workers
+at once (`drain_parallel()`). Events are split by a hash of the Stripe
+customer they belong to, so one subscriber's events are always handled in
+order by a single worker while unrelated subscribers run concurrently.
+"""
+import logging
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from hobbyhub import metrics
+from hobbyhub.stripe_handlers import DeferEvent, dispatch_event
+from orders.models import DeadLetterEvent, DeadLetterReplay, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+LEDGER_HIT = "webhook.ledger.hit"
+LEDGER_MISS = "webhook.ledger.miss"
+PARTITION_LAG = "webhook.partition.{}.lag_seconds"
+DEAD_LETTERED = "webhook.dead_lettered"
+
+# Statuses that hold back later events for the same customer
+BLOCKING_STATUSES = ['processing', 'deferred']
+
+
+def partition_key_for(event):
+    """
+    Return the Stripe customer (or subscription) an event belongs to.
+
+    Events without either, e.g. a guest one-off checkout, return an empty
+    string and have no ordering requirement.
+    """
+    obj = (event.get('data') or {}).get('object') or {}
+    key = obj.get('customer') or obj.get('subscription') or ''
+    if isinstance(key, dict):
+        # Expanded object rather than an id
+        key = key.get('id', '')
+    return key
+
+
+def partition_hash_for(key, event_id):
+    """
+    Stable 31-bit hash used to assign an event to a worker.
+
+    Unkeyed events hash on their own id so they spread across workers.
+    """
+    return zlib.crc32((key or event_id).encode()) & 0x7fffffff
+
+
+def enqueue_event(event):
+    """
+    Store a verified Stripe event in the inbox unless already seen.
+
+    Relies on the unique constraint on `stripe_event_id` rather than a
+    lookup first, so a redelivery is a single indexed insert.
+
+    Args:
+        event (dict): The decoded Stripe event payload.
+
+    Returns:
+        Tuple[WebhookEvent | None, bool]: The stored row and True, or
+        (None, False) if the event id was already in the ledger.
+    """
+    partition_key = partition_key_for(event)
+    try:
+        with transaction.atomic():
+            webhook_event = WebhookEvent.objects.create(
+                stripe_event_id=event['id'],
+                event_type=event['type'],
+                payload=event,
+                partition_key=partition_key,
+                partition_hash=partition_hash_for(partition_key, event['id']),
+            )
+    except IntegrityError:
+        metrics.increment(LEDGER_HIT)
+        logger.info(
+            f"[WEBHOOK] Duplicate delivery of {event['type']} "
+            f"({event['id']}) ignored"
+        )
+        return None, False
+
+    metrics.increment(LEDGER_MISS)
+    logger.info(
+        f"[WEBHOOK] Queued {webhook_event.event_type} "
+        f"({webhook_event.stripe_event_id})"
+    )
+    return webhook_event, True
+
+
+def enqueue_events(events):
+    """
+    Store a batch of Stripe events in the inbox, skipping known ids.
+
+    Used by `sync_stripe_events` to catch up on missed deliveries. Events
+    already in the ledger are filtered out with one lookup and the rest are
+    bulk inserted in the order given.
+
+    Args:
+        events (list[dict]): Decoded Stripe event payloads, oldest first.
+
+    Returns:
+        int: The number of events newly queued.
+    """
+    ids = [event['id'] for event in events]
+    known = set(
+        WebhookEvent.objects.filter(stripe_event_id__in=ids)
+        .values_list('stripe_event_id', flat=True)
+    )
+
+    new_events = []
+    for event in events:
+        if event['id'] in known:
+            continue
+        # Guard against the same event appearing twice in one batch
+        known.add(event['id'])
+        partition_key = partition_key_for(event)
+        new_events.append(WebhookEvent(
+            stripe_event_id=event['id'],
+            event_type=event['type'],
+            payload=event,
+            partition_key=partition_key,
+            partition_hash=partition_hash_for(partition_key, event['id']),
+        ))
+
+    # ignore_conflicts covers a webhook landing between lookup and insert
+    WebhookEvent.objects.bulk_create(
+        new_events,
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+    if len(events) > len(new_events):
+        metrics.increment(LEDGER_HIT, len(events) - len(new_events))
+    if new_events:
+        metrics.increment(LEDGER_MISS, len(new_events))
+    return len(new_events)
+
+
+def ledger_stats():
+    """
+    Report how often Stripe redelivers events we have already stored.
+
+    Without Redis the counters can miss increments made at the same moment
+    by different processes, so the counts are approximate.
+
+    Returns:
+        dict: Hit and miss counts, the redelivery rate (0-1) and whether
+        the counts are ``approximate``.
+    """
+    counts = metrics.snapshot([LEDGER_HIT, LEDGER_MISS])
+    hits, misses = counts[LEDGER_HIT], counts[LEDGER_MISS]
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'redelivery_rate': hits / total if total else 0.0,
+        'approximate': not metrics.counts_are_exact(),
+    }
+
+
+def claim_events(batch_size=50, partition=None, id_prefix=None):
+    """
+    Lock and mark the next batch of events as processing.
+
+    Deferred events are included once their `retry_after` has passed.
+    Events left in ``processing`` for longer than
+    ``WEBHOOK_LEASE_SECONDS`` (e.g. the worker was killed mid-batch) are
+    picked up again. An event is skipped while an earlier event for the
+    same customer is still in flight or deferred, so per-customer order
+    holds across batches.
+
+    Args:
+        batch_size (int): Maximum number of events to claim.
+        partition (tuple[int, int] | None): ``(index, count)`` to only claim
+            events whose partition hash falls in this worker's share.
+        id_prefix (str | None): Only claim events whose Stripe event id
+            starts with this, e.g. the benchmark's synthetic events.
+
+    Returns:
+        list[WebhookEvent]: The claimed events, oldest first.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+
+    earlier_blocking = WebhookEvent.objects.filter(
+        partition_key=OuterRef('partition_key'),
+        status__in=BLOCKING_STATUSES,
+        received_at__lt=OuterRef('received_at'),
+    ).exclude(partition_key='')
+
+    queryset = WebhookEvent.objects.filter(
+        Q(status='pending')
+        | Q(status='deferred', retry_after__lte=now)
+        | Q(status='processing', started_at__lt=stale)
+    ).exclude(Exists(earlier_blocking))
+
+    if id_prefix:
+        queryset = queryset.filter(stripe_event_id__startswith=id_prefix)
+
+    if partition:
+        index, count = partition
+        queryset = queryset.annotate(
+            partition=Mod('partition_hash', count)
+        ).filter(partition=index)
+
+    with transaction.atomic():
+        events = list(
+            queryset.select_for_update(skip_locked=True)
+            .order_by('received_at', 'id')[:batch_size]
+        )
+        WebhookEvent.objects.filter(
+            id__in=[event.id for event in events]
+        ).update(
+            status='processing',
+            started_at=now,
+            attempts=F('attempts') + 1
+        )
+
+    for event in events:
+        event.status = 'processing'
+        event.started_at = now
+        event.attempts += 1
+
+    if partition:
+        lag = (now - events[0].received_at).total_seconds() if events else 0
+        metrics.set_gauge(PARTITION_LAG.format(partition[0]), lag)
+    return events
+
+
+def release_event(webhook_event):
+    """
+    Hand a claimed event back to the inbox without running it.
+
+    Used when an earlier event for the same customer in the batch was
+    deferred, so this one must wait its turn.
+    """
+    WebhookEvent.objects.filter(id=webhook_event.id).update(
+        status='pending',
+        attempts=F('attempts') - 1
+    )
+
+
+def partition_lag(count):
+    """
+    Report the backlog of each partition for `count` workers.
+
+    Returns:
+        dict: Partition index to ``{'depth', 'lag_seconds'}``, where lag is
+        the age of the oldest event waiting to be processed.
+    """
+    now = timezone.now()
+    rows = (
+        WebhookEvent.objects
+        .filter(status__in=['pending', 'processing'])
+        .annotate(partition=Mod('partition_hash', count))
+        .values('partition')
+        .annotate(depth=Count('id'), oldest=Min('received_at'))
+    )
+    lag = {
+        index: {'depth': 0, 'lag_seconds': 0.0} for index in range(count)
+    }
+    for row in rows:
+        lag[row['partition']] = {
+            'depth': row['depth'],
+            'lag_seconds': (now - row['oldest']).total_seconds(),
+        }
+    return lag
+
+
+def backoff_delay(attempts):
+    """
+    Seconds to wait before retrying an event after `attempts` tries.
+
+    Doubles from ``WEBHOOK_DEFER_BASE_SECONDS`` and is capped at
+    ``WEBHOOK_DEFER_MAX_SECONDS``.
+    """
+    delay = settings.WEBHOOK_DEFER_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.WEBHOOK_DEFER_MAX_SECONDS)
+
+
+def retry_later(webhook_event, reason):
+    """
+    Park an event as deferred with a backoff delay before its next try.
+    """
+    delay = backoff_delay(webhook_event.attempts)
+    webhook_event.status = 'deferred'
+    webhook_event.last_error = reason
+    webhook_event.retry_after = timezone.now() + timedelta(seconds=delay)
+    logger.warning(
+        f"[WEBHOOK] Retrying {webhook_event.event_type} "
+        f"({webhook_event.stripe_event_id}) in {delay}s: {reason}"
+    )
+
+
+def dead_letter(webhook_event, error, tb, duration_ms):
+    """
+    Record an event whose handler has failed for the last time.
+
+    A failed replay reopens the existing dead letter with the new error.
+    """
+    now = timezone.now()
+    existing = DeadLetterEvent.objects.filter(
+        webhook_event=webhook_event
+    ).first()
+    replayed = existing is not None and existing.status == 'replaying'
+
+    DeadLetterEvent.objects.update_or_create(
+        webhook_event=webhook_event,
+        defaults={
+            'event_type': webhook_event.event_type,
+            'error': error,
+            'traceback': tb,
+            'attempts': webhook_event.attempts,
+            'status': 'open',
+            'failed_at': now,
+            'replayed_at': now if replayed else None,
+            'replay_duration_ms': duration_ms if replayed else None,
+        }
+    )
+    metrics.increment(DEAD_LETTERED)
+    logger.error(
+        f"[WEBHOOK] Dead-lettered {webhook_event.event_type} "
+        f"({webhook_event.stripe_event_id}) after "
+        f"{webhook_event.attempts} attempt(s): {error}"
+    )
+
+
+def process_event(webhook_event):
+    """
+    Run a single inbox event through its Stripe handler.
+
+    Marks the event as processed, deferred or failed and records timings.
+    Handler errors are retried with backoff up to
+    ``WEBHOOK_RETRY_MAX_ATTEMPTS`` times, then the event is marked failed
+    and copied to the dead-letter table. A replayed dead letter gets a
+    single attempt.
+    """
+    started = time.monotonic()
+    event = stripe.Event.construct_from(
+        webhook_event.payload,
+        stripe.api_key
+    )
+    allow_defer = (
+        webhook_event.attempts < settings.WEBHOOK_DEFER_MAX_ATTEMPTS
+    )
+    failure = None
+
+    try:
+        dispatch_event(event, allow_defer=allow_defer)
+    except DeferEvent as e:
+        retry_later(webhook_event, str(e))
+    except Exception as e:
+        logger.error(
+            f"[WEBHOOK] Failed to process {webhook_event.event_type} "
+            f"({webhook_event.stripe_event_id}): {e}",
+            exc_info=True
+        )
+        error = str(e) or e.__class__.__name__
+        replaying = DeadLetterEvent.objects.filter(
+            webhook_event=webhook_event,
+            status='replaying'
+        ).exists()
+        if (
+            not replaying
+            and webhook_event.attempts < settings.WEBHOOK_RETRY_MAX_ATTEMPTS
+        ):
+            retry_later(webhook_event, error)
+        else:
+            webhook_event.status = 'failed'
+            webhook_event.last_error = error
+            failure = (error, traceback.format_exc())
+    else:
+        if webhook_event.last_error:
+            # Only events that failed before can be a dead-letter replay
+            DeadLetterEvent.objects.filter(
+                webhook_event=webhook_event,
+                status='replaying'
+            ).update(
+                status='resolved',
+                replayed_at=timezone.now(),
+                replay_duration_ms=int((time.monotonic() - started) * 1000)
+            )
+        webhook_event.status = 'processed'
+        webhook_event.last_error = ''
+
+    webhook_event.processed_at = timezone.now()
+    webhook_event.duration_ms = int((time.monotonic() - started) * 1000)
+    webhook_event.save(update_fields=[
+        'status',
+        'last_error',
+        'retry_after',
+        'processed_at',
+        'duration_ms',
+    ])
+    if failure:
+        dead_letter(webhook_event, *failure, webhook_event.duration_ms)
+
+    logger.info(
+        f"[WEBHOOK] {webhook_event.event_type} "
+        f"({webhook_event.stripe_event_id}) {webhook_event.status} "
+        f"in {webhook_event.duration_ms}ms "
+        f"(attempt {webhook_event.attempts})"
+    )
+    return webhook_event
+
+
+def replay_dead_letters(dead_letters, requested_by=None):
+    """
+    Queue open dead letters to be run again by the webhook worker.
+
+    Their inbox events go back to ``pending`` with the attempt count reset,
+    and are grouped under a `DeadLetterReplay` so the dashboard can follow
+    the outcome.
+
+    Args:
+        dead_letters (QuerySet): The dead letters to replay; any that are
+            not open are skipped.
+        requested_by (User | None): The staff member asking for the replay.
+
+    Returns:
+        DeadLetterReplay | None: The replay, or None if nothing was open.
+    """
+    with transaction.atomic():
+        selected = list(
+            dead_letters.select_for_update()
+            .filter(status='open')
+            .values_list('id', 'webhook_event_id')
+        )
+        if not selected:
+            return None
+
+        dead_letter_ids, event_ids = zip(*selected)
+        replay = DeadLetterReplay.objects.create(
+            requested_by=requested_by,
+            total=len(selected)
+        )
+        DeadLetterEvent.objects.filter(id__in=dead_letter_ids).update(
+            status='replaying',
+            replay=replay,
+            replayed_at=None,
+            replay_duration_ms=None
+        )
+        WebhookEvent.objects.filter(id__in=event_ids).update(
+            status='pending',
+            attempts=0,
+            retry_after=None
+        )
+
+    logger.info(
+        f"[WEBHOOK] Queued {replay.total} dead-lettered event(s) for replay "
+        f"(replay {replay.id})"
+    )
+    return replay
+
+
+def drain(batch_size=50, partition=None, id_prefix=None):
+    """
+    Process claimed batches until the inbox (or partition) is empty.
+    `id_prefix` limits it to events whose Stripe id starts with it.
+
+    Events within a batch run in order. Once an event for a customer is
+    deferred, that customer's later events in the batch are released
+    rather than run ahead of it.
+
+    Returns:
+        int: The number of events processed.
+    """
+    processed = 0
+    while True:
+        events = claim_events(batch_size, partition, id_prefix)
+        if not events:
+            return processed
+        blocked = set()
+        for webhook_event in events:
+            key = webhook_event.partition_key
+            if key and key in blocked:
+                release_event(webhook_event)
+                continue
+            process_event(webhook_event)
+            processed += 1
+            if key and webhook_event.status == 'deferred':
+                blocked.add(key)
+
+
+def drain_partition(index, count, batch_size=50, id_prefix=None):
+    """
+    Drain one partition in a worker thread, closing its DB connection.
+    """
+    try:
+        return drain(batch_size, partition=(index, count), id_prefix=id_prefix)
+    finally:
+        connections.close_all()
+
+
+def drain_parallel(workers, batch_size=50, id_prefix=None):
+    """
+    Drain the inbox with `workers` threads, one partition each.
+    `id_prefix` is passed through to `claim_events`.
+
+    Returns:
+        int: The number of events processed across all workers.
+    """
+    if workers <= 1:
+        return drain(batch_size, id_prefix=id_prefix)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(
+            drain_partition,
+            range(workers),
+            [workers] * workers,
+            [batch_size] * workers,
+            [id_prefix] * workers,
+        )
+        return sum(counts)
@@ -1,8 +1,14 @@
+from datetime import date, timedelta
+
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import Client
 from django.urls import reverse
 
+from boxes.models import Box, BoxProduct
+from home.views import CSRF_PLACEHOLDER
+
 
 @pytest.mark.django_db
 def test_register_form_required_fields():
@@ -83,3 +89,105 @@ def test_register_form_success():
     })
     assert response.status_code == 302  # Should redirect on success
     assert User.objects.filter(username='ValidUsername').exists()
+
+
+@pytest.fixture
+def shipped_box():
+    """
+    A box that has shipped, with one product.
+    """
+    cache.clear()
+    box = Box.objects.create(
+        name="Spring Box",
+        slug="spring-box",
+        description="Paints and brushes.",
+        shipping_date=date.today() - timedelta(days=3)
+    )
+    BoxProduct.objects.create(box=box, name="Paint Set", quantity=1)
+    return box
+
+
+@pytest.mark.django_db
+def test_home_page_is_cached_for_anonymous_visitors(
+    shipped_box, django_assert_max_num_queries
+):
+    """
+    A repeat anonymous visit is served from memory after one read of the
+    box version, with the visitor's own CSRF token.
+    """
+    client = Client()
+    first = client.get(reverse('home'))
+    assert "Paint Set" in first.content.decode()
+
+    with django_assert_max_num_queries(1):
+        second = client.get(reverse('home'))
+
+    content = second.content.decode()
+    assert "Paint Set" in content
+    assert CSRF_PLACEHOLDER not in content
+    assert second['ETag'] == first['ETag']
+    assert 'private' in second['Cache-Control']
+
+
+@pytest.mark.django_db
+def test_home_page_etag_answers_not_modified(shipped_box):
+    """
+    A visitor sending back the ETag gets 304 until a box product changes.
+    """
+    client = Client()
+    etag = client.get(reverse('home'))['ETag']
+
+    response = client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    BoxProduct.objects.create(box=shipped_box, name="Brush", quantity=1)
+    response = client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert "Brush" in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_home_page_refreshes_when_box_changes(shipped_box):
+    client = Client()
+    client.get(reverse('home'))
+
+    shipped_box.name = "Summer Box"
+    shipped_box.save()
+
+    assert "Summer Box" in client.get(reverse('home')).content.decode()
+
+
+@pytest.mark.django_db
+def test_home_page_not_cached_for_signed_in_users(shipped_box):
+    """
+    Signed-in users get the personalised call to action and no ETag.
+    """
+    user = User.objects.create_user(username="member", password="pass")
+    Client().get(reverse('home'))
+    client = Client()
+    client.force_login(user)
+
+    response = client.get(reverse('home'))
+
+    assert 'ETag' not in response
+    assert "?gift=false" in response.content.decode()
+    assert reverse('register') not in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_home_page_shows_pending_messages(shipped_box):
+    """
+    A visitor redirected home with a flash message sees it, not the
+    cached page.
+    """
+    client = Client()
+    client.get(reverse('home'))
+
+    response = client.get(
+        reverse('confirm_email', args=['bad-token']), follow=True
+    )
+
+    assert "Invalid or expired confirmation link." in (
+        response.content.decode()
+    )
+    assert 'ETag' not in response
@@ -5,16 +5,27 @@ Contains view logic for public-facing pages:
  - About and Contact pages
 """
 
+import hashlib
 import logging
 from datetime import date
 
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.core.signing import BadSignature, Signer
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import redirect, render
-from django.utils.http import url_has_allowed_host_and_scheme
-from boxes.models import Box
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag, url_has_allowed_host_and_scheme
+from boxes.schedule import (
+    CACHE_ALIAS,
+    get_box_schedule,
+    get_box_version,
+    memoize_for_version,
+)
 from hobbyhub.mail import send_registration_email
 
 from .forms import Register
@@ -22,44 +33,91 @@ from .forms import Register
 logger = logging.getLogger(__name__)
 signer = Signer()
 
+# Safety net only; box changes move the box version straight away.
+HOME_PAGE_TIMEOUT = 24 * 3600
 
-def home(request):
+# Stands in for the CSRF token in the cached home page
+CSRF_PLACEHOLDER = "__home_page_csrf_token__"
+
+
+def home_context():
     """
-    Renders the homepage with:
-    - The most recently shipped box (if available)
-    - Its contents
-    - The next upcoming box (based on month/year)
+    Context for the home page: the current box, its contents and the box
+    shipping next month, from the cached box schedule.
     """
-    today = date.today()
+    schedule = get_box_schedule()
+    box = schedule['current']
+    return {
+        'box': box,
+        'box_contents': box.products.all() if box else [],
+        'next_box': schedule['next'],
+    }
 
-    # Current box if it has already shipped
-    box = Box.objects.filter(
-        is_archived=False,
-        shipping_date__lte=today
-    ).order_by('-shipping_date').first()
 
-    box_contents = box.products.all() if box else []
+def home_page_key(today, version):
+    return f"home_page:{today.isoformat()}:{version}"
 
-    # Determine the next month and year
-    if today.month == 12:
-        next_month = 1
-        next_year = today.year + 1
-    else:
-        next_month = today.month + 1
-        next_year = today.year
 
-    # Upcoming box (next month's box)
-    next_box = Box.objects.filter(
-        is_archived=False,
-        shipping_date__year=next_year,
-        shipping_date__month=next_month
-    ).first()
+def load_home_page(request, key):
+    """
+    The anonymous home page from the hot cache, rendered with a
+    placeholder CSRF token and stored there on a miss.
 
-    return render(request, 'home/index.html', {
-        'box': box,
-        'box_contents': box_contents,
-        'next_box': next_box
-    })
+    Returns:
+        dict: ``content`` and its ``digest``.
+    """
+    page = caches[CACHE_ALIAS].get(key)
+    if page is None:
+        content = render_to_string(
+            'home/index.html',
+            {**home_context(), 'csrf_token': CSRF_PLACEHOLDER},
+            request=request
+        )
+        page = {
+            'content': content,
+            'digest': hashlib.md5(content.encode()).hexdigest(),
+        }
+        caches[CACHE_ALIAS].set(key, page, HOME_PAGE_TIMEOUT)
+    return page
+
+
+def home(request):
+    """
+    Renders the homepage with:
+    - The most recently shipped box (if available)
+    - Its contents
+    - The next upcoming box (shipping next month)
+
+    Anonymous visitors get a page rendered once per day and box version
+    and cached whole, with their own CSRF token swapped in. Each process
+    also keeps it in memory, so serving it costs one read of the box
+    version. It carries an ETag so repeat visits can be answered with 304
+    Not Modified. Signed-in users, and visitors with flash messages
+    waiting, get a fresh render.
+    """
+    if request.user.is_authenticated or len(messages.get_messages(request)):
+        return render(request, 'home/index.html', home_context())
+
+    key = home_page_key(date.today(), get_box_version())
+    page = memoize_for_version(
+        'home_page', key, lambda: load_home_page(request, key)
+    )
+
+    token = get_token(request)
+    # The CSRF secret is part of the ETag, so a browser whose token has
+    # been rotated is not told to reuse a page carrying the old one
+    secret = request.META.get('CSRF_COOKIE', '')
+    etag = quote_etag(
+        f"{page['digest']}-{hashlib.md5(secret.encode()).hexdigest()[:8]}"
+    )
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(
+            page['content'].replace(CSRF_PLACEHOLDER, token)
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 def subscribe_options(request):
@@ -1,7 +1,37 @@
 from django.contrib import admin
 
-from .models import Order, Payment, StripeSubscriptionMeta
+from .models import (DeadLetterEvent, DeadLetterReplay, Order, Payment,
+                     StripeEventCursor, StripeSubscriptionMeta, WebhookEvent)
 
 admin.site.register(Order)
 admin.site.register(StripeSubscriptionMeta)
 admin.site.register(Payment)
+admin.site.register(StripeEventCursor)
+admin.site.register(DeadLetterReplay)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'stripe_event_id',
+        'event_type',
+        'status',
+        'attempts',
+        'received_at',
+        'duration_ms',
+    )
+    list_filter = ('status', 'event_type')
+    search_fields = ('stripe_event_id', 'partition_key')
+
+
+@admin.register(DeadLetterEvent)
+class DeadLetterEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'webhook_event',
+        'event_type',
+        'status',
+        'attempts',
+        'failed_at',
+    )
+    list_filter = ('status', 'event_type')
+    search_fields = ('webhook_event__stripe_event_id', 'error')
@@ -0,0 +1,108 @@
+"""
+exports.py
+
+Fulfilment export of orders with their shipping addresses.
+
+Rows are read with `QuerySet.iterator(chunk_size=EXPORT_CHUNK_SIZE)` (a
+server-side cursor on Postgres) and written one line at a time. Memory
+therefore stays flat however many orders match. Used by the dashboard
+`export_orders` view, which streams the file, and by the `export_orders`
+management command.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Order
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (column, Order lookup) in export order
+EXPORT_COLUMNS = [
+    ('order_id', 'id'),
+    ('status', 'status'),
+    ('is_gift', 'is_gift'),
+    ('order_date', 'order_date'),
+    ('scheduled_shipping_date', 'scheduled_shipping_date'),
+    ('box', 'box__name'),
+    ('username', 'user__username'),
+    ('email', 'user__email'),
+    ('recipient_first_name', 'shipping_address__recipient_f_name'),
+    ('recipient_last_name', 'shipping_address__recipient_l_name'),
+    ('address_line_1', 'shipping_address__address_line_1'),
+    ('address_line_2', 'shipping_address__address_line_2'),
+    ('town_or_city', 'shipping_address__town_or_city'),
+    ('county', 'shipping_address__county'),
+    ('postcode', 'shipping_address__postcode'),
+    ('country', 'shipping_address__country'),
+    ('phone_number', 'shipping_address__phone_number'),
+]
+
+
+def filter_orders(box=None, status=None, country=None, gift=None):
+    """
+    Orders matching the export filters; blank filters are ignored.
+
+    Args:
+        box (int | str | None): Box id.
+        status (str | None): Order status.
+        country (str | None): Shipping address country code, e.g. ``GB``.
+        gift (bool | None): Only gift or only non-gift orders.
+
+    Returns:
+        QuerySet: The matching orders, oldest first.
+    """
+    orders = Order.objects.all()
+    if box:
+        orders = orders.filter(box_id=int(box))
+    if status:
+        orders = orders.filter(status=status)
+    if country:
+        orders = orders.filter(shipping_address__country=country.upper())
+    if gift is not None:
+        orders = orders.filter(is_gift=gift)
+    return orders.order_by('id')
+
+
+def export_rows(orders):
+    """
+    Yield one tuple of column values per order, read in chunks.
+    """
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return orders.values_list(*lookups).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+
+class Echo:
+    """
+    A file-like object whose write() returns the value, so `csv.writer`
+    can produce lines for a generator instead of a buffer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(orders):
+    """Yield the export as CSV lines, header first."""
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    for row in export_rows(orders):
+        yield writer.writerow(row)
+
+
+def stream_jsonl(orders):
+    """Yield the export as one JSON object per line."""
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in export_rows(orders):
+        line = json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder)
+        yield line + '\n'
+
+
+# format name -> (content type, file extension, writer)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv', stream_csv),
+    'jsonl': ('application/x-ndjson', 'jsonl', stream_jsonl),
+}
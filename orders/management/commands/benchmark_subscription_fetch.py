@@ -0,0 +1,133 @@
+"""
+Measures live subscription fetches against a fake Stripe.
+
+Replaces `stripe.Subscription.retrieve` with a stub that sleeps for
+``--latency`` seconds (plus up to ``--jitter``), with ``--slow`` of the
+calls taking ``--slow-latency`` instead. It then fetches ``--subscriptions``
+IDs one after another, as order_history used to, and through
+`fetch_subscriptions` for each worker count. For each run it reports the
+time taken, how many fetches came back, and how many were left refreshing.
+
+Nothing is written to the database.
+
+Usage:
+    python manage.py benchmark_subscription_fetch
+    python manage.py benchmark_subscription_fetch --subscriptions 8 \\
+        --latency 0.4 --slow 1 --timeout 1.5 --workers 1 4 8
+"""
+import random
+import time
+from unittest import mock
+
+import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hobbyhub.stripe_handlers import fetch_subscriptions
+
+SUB_PREFIX = "sub_bench_"
+
+
+class Command(BaseCommand):
+    help = "Benchmark sequential and pooled Stripe subscription fetches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=5,
+            help="Subscriptions fetched per run (default 5)."
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.3,
+            help="Seconds the fake Stripe call takes (default 0.3)."
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.1,
+            help="Extra random latency of up to this many seconds."
+        )
+        parser.add_argument(
+            '--slow',
+            type=int,
+            default=1,
+            help="Calls that take --slow-latency instead (default 1)."
+        )
+        parser.add_argument(
+            '--slow-latency',
+            type=float,
+            default=5.0,
+            help="Seconds a slow call takes (default 5)."
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=None,
+            help="Deadline for pooled fetches "
+                 "(default STRIPE_FETCH_TIMEOUT_SECONDS)."
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[settings.STRIPE_FETCH_MAX_WORKERS],
+            help="Pool sizes to benchmark "
+                 "(default STRIPE_FETCH_MAX_WORKERS)."
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help="Random seed for the injected jitter."
+        )
+
+    def handle(self, *args, **options):
+        count = options['subscriptions']
+        timeout = options['timeout']
+        if timeout is None:
+            timeout = settings.STRIPE_FETCH_TIMEOUT_SECONDS
+        rng = random.Random(options['seed'])
+
+        sub_ids = [f"{SUB_PREFIX}{i}" for i in range(count)]
+        latency = {
+            sub_id: (
+                options['slow_latency'] if i < options['slow']
+                else options['latency'] + rng.uniform(0, options['jitter'])
+            )
+            for i, sub_id in enumerate(sub_ids)
+        }
+
+        def fake_retrieve(sub_id, **params):
+            time.sleep(latency[sub_id])
+            return {'id': sub_id, 'status': 'active'}
+
+        self.stdout.write(
+            f"Fetching {count} subscription(s), {options['slow']} slow "
+            f"({options['slow_latency']}s), others "
+            f"{options['latency']}s + up to {options['jitter']}s"
+        )
+        with mock.patch.object(stripe.Subscription, 'retrieve',
+                               side_effect=fake_retrieve):
+            started = time.perf_counter()
+            for sub_id in sub_ids:
+                stripe.Subscription.retrieve(sub_id)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {'sequential, no deadline':<28} {elapsed:7.2f}s, "
+                f"{count} fetched, 0 refreshing"
+            )
+
+            for workers in options['workers']:
+                started = time.perf_counter()
+                fetched, pending = fetch_subscriptions(
+                    sub_ids, timeout=timeout, max_workers=workers
+                )
+                elapsed = time.perf_counter() - started
+                label = f"{workers} worker(s), {timeout}s deadline"
+                self.stdout.write(
+                    f"  {label:<28} {elapsed:7.2f}s, "
+                    f"{len(fetched)} fetched, {len(pending)} refreshing"
+                )
@@ -0,0 +1,148 @@
+"""
+Measures webhook worker throughput against a fake Stripe.
+
+Queues synthetic events spread over a number of customers, then drains
+them with each requested worker count. Handlers are replaced by a stub
+that sleeps for ``--latency`` seconds to stand in for Stripe and email
+round trips, and checks that each customer's events arrive in order.
+
+Workers only claim the benchmark's own ``evt_bench_`` events, so a real
+event arriving mid-run is left for the webhook workers and never reaches
+the stub. The benchmark still refuses to start while real events are
+waiting, as they would compete for the same database.
+
+Usage:
+    python manage.py benchmark_webhooks --events 400 --workers 1 2 4 8
+"""
+import threading
+import time
+from collections import defaultdict
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hobbyhub import webhooks
+from orders.models import WebhookEvent
+
+EVENT_PREFIX = "evt_bench_"
+
+
+class Command(BaseCommand):
+    help = "Benchmark webhook processing throughput by worker count."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=200,
+            help="Number of events to queue per run."
+        )
+        parser.add_argument(
+            '--customers',
+            type=int,
+            default=50,
+            help="Number of distinct customers the events belong to."
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.05,
+            help="Seconds the fake Stripe call takes per event."
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4, 8],
+            help="Worker counts to benchmark."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help="Number of events each worker claims per batch."
+        )
+
+    def handle(self, *args, **options):
+        waiting = WebhookEvent.objects.filter(
+            status__in=['pending', 'processing', 'deferred']
+        ).exclude(stripe_event_id__startswith=EVENT_PREFIX)
+        if waiting.exists():
+            raise CommandError(
+                "The webhook inbox has events waiting; drain it before "
+                "benchmarking."
+            )
+
+        benchmark_events = WebhookEvent.objects.filter(
+            stripe_event_id__startswith=EVENT_PREFIX
+        )
+        baseline = None
+        for workers in options['workers']:
+            benchmark_events.delete()
+            self.queue_events(options['events'], options['customers'])
+            try:
+                elapsed, violations = self.run(
+                    workers,
+                    options['batch_size'],
+                    options['latency']
+                )
+            finally:
+                benchmark_events.delete()
+
+            throughput = options['events'] / elapsed
+            baseline = baseline or throughput
+            self.stdout.write(
+                f"{workers} worker(s): {throughput:.1f} events/s "
+                f"({throughput / baseline:.1f}x), "
+                f"{elapsed:.2f}s, {violations} ordering violation(s)"
+            )
+
+    def queue_events(self, count, customers):
+        """
+        Insert synthetic invoice events round-robin across customers.
+        """
+        events = []
+        for seq in range(count):
+            event_id = f"{EVENT_PREFIX}{seq}"
+            customer = f"cus_bench_{seq % customers}"
+            events.append(WebhookEvent(
+                stripe_event_id=event_id,
+                event_type='invoice.upcoming',
+                payload={
+                    'id': event_id,
+                    'type': 'invoice.upcoming',
+                    'data': {'object': {'customer': customer, 'seq': seq}},
+                },
+                partition_key=customer,
+                partition_hash=webhooks.partition_hash_for(customer, event_id),
+            ))
+        WebhookEvent.objects.bulk_create(events)
+
+    def run(self, workers, batch_size, latency):
+        """
+        Drain the queued events with the handlers stubbed out.
+
+        Returns:
+            Tuple[float, int]: Elapsed seconds and the number of events
+            that ran before an earlier event for the same customer.
+        """
+        lock = threading.Lock()
+        last_seen = defaultdict(lambda: -1)
+        violations = 0
+
+        def fake_dispatch(event, allow_defer=True):
+            nonlocal violations
+            obj = event['data']['object']
+            time.sleep(latency)
+            with lock:
+                if obj['seq'] < last_seen[obj['customer']]:
+                    violations += 1
+                last_seen[obj['customer']] = obj['seq']
+            return True
+
+        started = time.monotonic()
+        with mock.patch.object(webhooks, 'dispatch_event', fake_dispatch):
+            webhooks.drain_parallel(
+                workers, batch_size, id_prefix=EVENT_PREFIX
+            )
+        return time.monotonic() - started, violations
@@ -0,0 +1,70 @@
+"""
+Exports orders with their shipping addresses for fulfilment.
+
+Usage:
+    python manage.py export_orders --box 12 > october.csv
+    python manage.py export_orders --status processing --country GB
+    python manage.py export_orders --gift yes --format jsonl -o gifts.jsonl
+
+Rows are streamed from the database in chunks, so memory use does not
+grow with the number of orders.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from hobbyhub.utils import parse_yes_no
+from orders.exports import EXPORT_FORMATS, filter_orders
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Export orders with shipping addresses as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--box', type=int, help="Only this box id.")
+        parser.add_argument(
+            '--status',
+            choices=[value for value, _ in Order.STATUS_CHOICES],
+            help="Only orders with this status."
+        )
+        parser.add_argument(
+            '--country',
+            help="Only addresses in this country code, e.g. GB."
+        )
+        parser.add_argument(
+            '--gift',
+            help="yes for gift orders only, no to leave gifts out."
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_FORMATS),
+            default='csv',
+            help="Output format (default csv)."
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help="File to write to (default stdout)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            gift = parse_yes_no(options['gift'], 'gift')
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        orders = filter_orders(
+            box=options['box'],
+            status=options['status'],
+            country=options['country'],
+            gift=gift,
+        )
+        _, _, writer = EXPORT_FORMATS[options['format']]
+
+        if options['output']:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as fp:
+                for chunk in writer(orders):
+                    fp.write(chunk)
+            self.stdout.write(f"Exported orders to {options['output']}")
+        else:
+            for chunk in writer(orders):
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,111 @@
+"""
+Drains the Stripe webhook inbox.
+
+Usage:
+    python manage.py process_webhooks            # run forever
+    python manage.py process_webhooks --once     # drain and exit
+    python manage.py process_webhooks --workers 4
+
+With ``--workers`` the inbox is split by Stripe customer across that many
+threads; each customer's events stay in order on a single worker.
+"""
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from hobbyhub.webhooks import (drain, drain_parallel, ledger_stats,
+                               partition_lag)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Process queued Stripe webhook events."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the inbox once and exit instead of polling."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help="Number of events to claim per batch."
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when the inbox is empty."
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Number of worker threads, each owning a partition."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = max(options['workers'], 1)
+
+        if options['once']:
+            processed = drain_parallel(workers, batch_size)
+            stats = ledger_stats()
+            self.stdout.write(
+                f"Processed {processed} webhook event(s). "
+                f"Ledger: {stats['hits']} duplicate(s) / "
+                f"{stats['misses']} new "
+                f"({stats['redelivery_rate']:.1%} redelivered"
+                f"{', approximate' if stats['approximate'] else ''})."
+            )
+            if workers > 1:
+                for index, lag in partition_lag(workers).items():
+                    self.stdout.write(
+                        f"Partition {index}: {lag['depth']} waiting, "
+                        f"lag {lag['lag_seconds']:.1f}s"
+                    )
+            return
+
+        logger.info(f"[WEBHOOK] Worker started with {workers} thread(s)")
+        if workers == 1:
+            self.poll(None, batch_size, options['sleep'])
+            return
+
+        threads = [
+            threading.Thread(
+                target=self.poll,
+                args=((index, workers), batch_size, options['sleep']),
+                name=f"webhook-worker-{index}",
+                daemon=True,
+            )
+            for index in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def poll(self, partition, batch_size, sleep):
+        """
+        Drain the inbox (or one partition of it) forever.
+        """
+        label = f"partition {partition[0]}" if partition else "inbox"
+        try:
+            while True:
+                close_old_connections()
+                processed = drain(batch_size, partition)
+                if processed:
+                    logger.info(
+                        f"[WEBHOOK] Worker processed {processed} event(s) "
+                        f"from {label}"
+                    )
+                else:
+                    time.sleep(sleep)
+        finally:
+            connections.close_all()
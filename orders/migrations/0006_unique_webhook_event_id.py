@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='stripe_event_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
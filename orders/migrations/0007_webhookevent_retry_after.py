@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_unique_webhook_event_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, help_text='Deferred events are not retried before this time.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('deferred', 'Deferred'), ('processed', 'Processed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['status', 'retry_after'], name='orders_webh_status_4f43c9_idx'),
+        ),
+    ]
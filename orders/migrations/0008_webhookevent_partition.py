@@ -0,0 +1,56 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:20
+
+import zlib
+
+from django.db import migrations, models
+
+
+def partition_queued_events(apps, schema_editor):
+    """
+    Assign partitions to events still waiting in the inbox.
+
+    Mirrors `hobbyhub.webhooks.partition_key_for` so queued events keep
+    their per-customer ordering once several workers are running.
+    """
+    WebhookEvent = apps.get_model('orders', 'WebhookEvent')
+    queued = WebhookEvent.objects.filter(
+        status__in=['pending', 'processing', 'deferred']
+    )
+    for event in queued.iterator():
+        obj = (event.payload.get('data') or {}).get('object') or {}
+        key = obj.get('customer') or obj.get('subscription') or ''
+        if isinstance(key, dict):
+            key = key.get('id', '')
+        event.partition_key = key
+        event.partition_hash = (
+            zlib.crc32((key or event.stripe_event_id).encode()) & 0x7fffffff
+        )
+        event.save(update_fields=['partition_key', 'partition_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_webhookevent_retry_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='partition_hash',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='partition_key',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(fields=['partition_key', 'status'], name='orders_webh_partiti_af89da_idx'),
+        ),
+        migrations.RunPython(
+            partition_queued_events,
+            migrations.RunPython.noop
+        ),
+    ]
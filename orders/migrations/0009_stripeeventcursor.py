@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_webhookevent_partition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEventCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('synced_until', models.DateTimeField()),
+                ('last_event_id', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
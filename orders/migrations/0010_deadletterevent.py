@@ -0,0 +1,49 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0009_stripeeventcursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetterReplay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-requested_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeadLetterEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=100)),
+                ('error', models.TextField()),
+                ('traceback', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('replaying', 'Replaying'), ('resolved', 'Resolved')], default='open', max_length=20)),
+                ('failed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('replayed_at', models.DateTimeField(blank=True, null=True)),
+                ('replay_duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('replay', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='orders.deadletterreplay')),
+                ('webhook_event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letter', to='orders.webhookevent')),
+            ],
+            options={
+                'ordering': ['-failed_at'],
+                'indexes': [models.Index(fields=['status', 'failed_at'], name='orders_dead_status_4d7017_idx')],
+            },
+        ),
+    ]
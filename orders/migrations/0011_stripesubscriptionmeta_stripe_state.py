@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_deadletterevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripesubscriptionmeta',
+            name='cancel_at_period_end',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='stripesubscriptionmeta',
+            name='current_period_end',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stripesubscriptionmeta',
+            name='status',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='stripesubscriptionmeta',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, help_text='When the Stripe status and period were last copied.', null=True),
+        ),
+    ]
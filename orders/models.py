@@ -7,6 +7,8 @@ Includes models for subscription metadata, individual orders, and payments.
 
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Count, Max, Q
+from django.utils import timezone
 
 from boxes.models import Box
 from users.models import ShippingAddress
@@ -38,6 +40,15 @@ class StripeSubscriptionMeta(models.Model):
     is_gift = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
+    # Copied from Stripe by webhooks and `sync_subscription_states`
+    status = models.CharField(max_length=30, blank=True)
+    current_period_end = models.DateTimeField(null=True, blank=True)
+    cancel_at_period_end = models.BooleanField(default=False)
+    synced_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the Stripe status and period were last copied."
+    )
 
     def __str__(self):
         return (
@@ -119,3 +130,176 @@ class Payment(models.Model):
         if self.order:
             return f"Payment for Order #{self.order.id} - {self.status}"
         return f"Payment #{self.id} - {self.status}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of verified Stripe webhook events.
+
+    The webhook view stores each event here and returns straight away; the
+    ``process_webhooks`` management command drains the inbox using the
+    handlers in ``hobbyhub.stripe_handlers`` and records the outcome.
+    The unique event id also makes this the idempotency ledger for
+    redelivered events.
+
+    ``partition_key`` is the Stripe customer (or subscription) the event
+    belongs to. Workers split the inbox on ``partition_hash`` so each
+    subscriber's events are handled in order by a single worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('deferred', 'Deferred'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    stripe_event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    partition_key = models.CharField(max_length=255, blank=True)
+    partition_hash = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    retry_after = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Deferred events are not retried before this time."
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['status', 'retry_after']),
+            models.Index(fields=['partition_key', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.stripe_event_id}) - {self.status}"
+
+
+class StripeEventCursor(models.Model):
+    """
+    How far ``sync_stripe_events`` has pulled Stripe's event log.
+
+    Events up to ``synced_until`` are in the webhook inbox, so an
+    interrupted catch-up resumes from here rather than starting again.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    synced_until = models.DateTimeField()
+    last_event_id = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} synced until {self.synced_until}"
+
+
+class DeadLetterReplay(models.Model):
+    """
+    A bulk replay of dead-lettered webhook events requested from the
+    dashboard. The events themselves are re-run by the webhook worker.
+    """
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    requested_at = models.DateTimeField(auto_now_add=True)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-requested_at']
+
+    def __str__(self):
+        return f"Replay of {self.total} event(s) at {self.requested_at}"
+
+    def stats(self):
+        """
+        Summarise the outcome of the replay so far.
+
+        Returns:
+            dict: Counts of resolved, failed and waiting events, and the
+            replay throughput in events per second once any have finished.
+        """
+        summary = self.events.aggregate(
+            resolved=Count('id', filter=Q(status='resolved')),
+            failed=Count('id', filter=Q(status='open')),
+            waiting=Count('id', filter=Q(status='replaying')),
+            last_finished=Max('replayed_at'),
+        )
+        done = summary['resolved'] + summary['failed']
+        last_finished = summary.pop('last_finished')
+        elapsed = (
+            (last_finished - self.requested_at).total_seconds()
+            if last_finished else 0
+        )
+        summary['elapsed_seconds'] = elapsed
+        summary['throughput'] = done / elapsed if elapsed > 0 else None
+        return summary
+
+
+class DeadLetterEvent(models.Model):
+    """
+    A webhook event whose handler kept failing after all its retries.
+
+    Holds the error, traceback and attempt count alongside the inbox event
+    (and so its payload) so it can be inspected and replayed from the
+    dashboard instead of being lost in the logs.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('replaying', 'Replaying'),
+        ('resolved', 'Resolved'),
+    ]
+
+    webhook_event = models.OneToOneField(
+        WebhookEvent,
+        on_delete=models.CASCADE,
+        related_name='dead_letter'
+    )
+    event_type = models.CharField(max_length=100)
+    error = models.TextField()
+    traceback = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='open'
+    )
+    failed_at = models.DateTimeField(default=timezone.now)
+    replay = models.ForeignKey(
+        DeadLetterReplay,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='events'
+    )
+    replayed_at = models.DateTimeField(null=True, blank=True)
+    replay_duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-failed_at']
+        indexes = [
+            models.Index(fields=['status', 'failed_at']),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.event_type} ({self.webhook_event.stripe_event_id}) "
+            f"- {self.status}"
+        )
+
+    @property
+    def payload(self):
+        return self.webhook_event.payload
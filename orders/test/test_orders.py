@@ -1,10 +1,15 @@
+import json
+from io import StringIO
+
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.shortcuts import reverse
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
 from orders.models import Box, Order, Payment, StripeSubscriptionMeta
 from orders.views import create_subscription_checkout
 from users.models import ShippingAddress
@@ -257,6 +262,112 @@ def test_order_history_view(client, admin_user):
     assert "Order History" in response.content.decode()
 
 
+@pytest.mark.django_db
+def test_order_history_uses_stored_subscription_state(client, admin_user):
+    """
+    Fresh and cancelled subscriptions render without calling Stripe.
+    """
+    period_end = timezone.now() + timezone.timedelta(days=20)
+    for sub_id, cancelled_at in (('sub_live', None),
+                                 ('sub_old', timezone.now())):
+        StripeSubscriptionMeta.objects.create(
+            user=admin_user, stripe_subscription_id=sub_id,
+            stripe_price_id='price_x', status='active',
+            current_period_end=period_end, synced_at=timezone.now(),
+            cancelled_at=cancelled_at
+        )
+        Order.objects.create(user=admin_user, stripe_subscription_id=sub_id)
+    client.force_login(admin_user)
+
+    with patch('stripe.Subscription.retrieve') as mock_retrieve:
+        response = client.get(reverse('order_history'))
+
+    mock_retrieve.assert_not_called()
+    sub_info = response.context['sub_map']['sub_live']
+    assert sub_info['current_period_end'] == period_end
+    assert period_end.strftime('%B') in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_order_history_refreshes_stale_subscription(client, admin_user):
+    """
+    A live subscription not synced within the TTL is fetched once and
+    stored, so the next view needs no Stripe call.
+    """
+    sub = StripeSubscriptionMeta.objects.create(
+        user=admin_user, stripe_subscription_id='sub_stale',
+        stripe_price_id='price_x'
+    )
+    client.force_login(admin_user)
+    stripe_sub = {
+        'id': 'sub_stale',
+        'status': 'active',
+        'cancel_at_period_end': False,
+        'items': {'data': [{'current_period_end': 1767225600}]},
+    }
+
+    with patch('stripe.Subscription.retrieve',
+               return_value=stripe_sub) as mock_retrieve:
+        client.get(reverse('order_history'))
+        client.get(reverse('order_history'))
+
+    mock_retrieve.assert_called_once_with('sub_stale')
+    sub.refresh_from_db()
+    assert sub.status == 'active'
+    assert sub.current_period_end.year == 2026
+
+
+def fake_retrieve(latency_by_id):
+    """
+    A stand-in for `stripe.Subscription.retrieve` that sleeps per ID.
+    """
+    def retrieve(sub_id):
+        time.sleep(latency_by_id.get(sub_id, 0))
+        return {
+            'id': sub_id,
+            'status': 'active',
+            'cancel_at_period_end': False,
+            'items': {'data': [{'current_period_end': 1767225600}]},
+        }
+    return retrieve
+
+
+@pytest.mark.django_db
+@override_settings(STRIPE_FETCH_TIMEOUT_SECONDS=0.5)
+def test_order_history_fetches_stale_subscriptions_in_parallel(
+    client, admin_user
+):
+    """
+    Stale subscriptions are fetched together; one that misses the
+    deadline renders as refreshing instead of holding up the page.
+    """
+    latency = {'sub_a': 0.2, 'sub_b': 0.2, 'sub_c': 0.2, 'sub_slow': 2}
+    for sub_id in latency:
+        StripeSubscriptionMeta.objects.create(
+            user=admin_user, stripe_subscription_id=sub_id,
+            stripe_price_id='price_x'
+        )
+        Order.objects.create(user=admin_user, stripe_subscription_id=sub_id)
+    client.force_login(admin_user)
+
+    with patch('stripe.Subscription.retrieve', fake_retrieve(latency)):
+        started = time.monotonic()
+        response = client.get(reverse('order_history'))
+        elapsed = time.monotonic() - started
+
+    # Sequential fetches would take 2.6s
+    assert elapsed < 1.5
+    sub_map = response.context['sub_map']
+    assert not sub_map['sub_a']['refreshing']
+    assert sub_map['sub_a']['current_period_end'].year == 2026
+    assert sub_map['sub_slow']['refreshing']
+    assert sub_map['sub_slow']['current_period_end'] is None
+    assert "Refreshing…" in response.content.decode()
+    assert StripeSubscriptionMeta.objects.filter(
+        synced_at__isnull=False
+    ).count() == 3
+
+
 @pytest.mark.django_db
 def test_choose_shipping_address_view(client, admin_user):
     """
@@ -559,7 +670,8 @@ def test_concurrent_subscription_creation(mock_stripe):
         'metadata': {
             'user_id': user.id,
             'shipping_address_id': address.id,
-            'gift': 'false'
+            'gift': 'false',
+            'price_id': 'price_m'
         },
         'subscription': 'sub_1RQC23AGhmEWZKnhSZzbpKYf',
     }
@@ -605,3 +717,23 @@ def test_concurrent_subscription_creation(mock_stripe):
         f"Multiple StripeSubscriptionMeta entries were created! "
         f"Count: {count}"
     )
+
+
+@pytest.mark.django_db
+def test_export_orders_command_writes_jsonl(tmp_path):
+    user = User.objects.create(username="exporter", email="ex@example.com")
+    Order.objects.create(user=user, status='processing', is_gift=True)
+    Order.objects.create(user=user, status='shipped')
+    output = tmp_path / 'orders.jsonl'
+
+    call_command(
+        'export_orders',
+        '--status', 'processing',
+        '--format', 'jsonl',
+        '--output', str(output),
+        stdout=StringIO()
+    )
+
+    lines = output.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['email'] == 'ex@example.com'
@@ -0,0 +1,1025 @@
+"""
+Tests for the Stripe webhook inbox:
+- The webhook view queues verified events without running handlers
+- The worker drains the inbox through the existing handlers
+- Status, attempts and timings are recorded per event
+- Partitioned workers keep each customer's events in order
+- sync_stripe_events replays missed events from a JSONL fixture
+- Failing events are retried, dead-lettered and can be replayed
+- Redelivered events do not queue the same email twice
+- Subscription events keep the stored status and period current
+"""
+
+import json
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import stripe
+from django.conf import settings
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from boxes.models import Box
+from hobbyhub import metrics
+from hobbyhub.outbox import DEDUP_SUPPRESSED, send_queued_emails
+from hobbyhub.stripe_handlers import (
+    DEFERRED_NO_BOX,
+    DeferEvent,
+    subscription_needs_sync
+)
+from hobbyhub.webhooks import (
+    PARTITION_LAG,
+    backoff_delay,
+    claim_events,
+    drain,
+    enqueue_event,
+    enqueue_events,
+    ledger_stats,
+    partition_hash_for,
+    partition_lag,
+    replay_dead_letters
+)
+from orders.models import (
+    DeadLetterEvent,
+    Order,
+    StripeEventCursor,
+    StripeSubscriptionMeta,
+    WebhookEvent
+)
+from users.models import OutboundEmail, ShippingAddress, User, UserProfile
+
+EVENTS_FIXTURE = str(
+    Path(__file__).parent / 'fixtures' / 'stripe_events.jsonl'
+)
+
+
+def make_checkout_event(user, address, event_id='evt_checkout'):
+    """
+    Builds a one-off checkout.session.completed event.
+    """
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': 'checkout.session.completed',
+        'data': {
+            'object': {
+                'object': 'checkout.session',
+                'id': 'cs_123',
+                'mode': 'payment',
+                'payment_intent': 'pi_123',
+                'metadata': {
+                    'user_id': str(user.id),
+                    'shipping_address_id': str(address.id),
+                },
+            }
+        },
+    }
+
+
+def make_event(
+    event_id='evt_123',
+    event_type='invoice.payment_failed',
+    customer='cus_123'
+):
+    """
+    Builds a minimal Stripe event payload.
+    """
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {
+            'object': {
+                'object': 'invoice',
+                'id': 'in_123',
+                'customer': customer,
+            }
+        },
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    """
+    Metrics live in the cache, so reset them between tests.
+    """
+    metrics.get_cache().clear()
+
+
+def stripe_intent():
+    """
+    A PaymentIntent-like object with shipping details.
+    """
+    return stripe.PaymentIntent.construct_from({
+        'id': 'pi_123',
+        'amount_received': 2500,
+        'shipping': {'address': {'line1': '123 Test Street'}},
+    }, 'sk_test')
+
+
+# ============================
+# WEBHOOK VIEW
+# ============================
+
+@pytest.mark.django_db
+@patch('hobbyhub.stripe_handlers.handle_invoice_payment_failed')
+@patch('stripe.Webhook.construct_event')
+def test_webhook_view_queues_event(mock_construct, mock_handler, client):
+    """
+    A verified webhook is stored and acknowledged without running handlers.
+    """
+    event = make_event()
+    mock_construct.return_value = event
+
+    response = client.post(
+        reverse('stripe_webhook'),
+        data=json.dumps(event),
+        content_type='application/json',
+        HTTP_STRIPE_SIGNATURE='sig'
+    )
+
+    assert response.status_code == 200
+    queued = WebhookEvent.objects.get(stripe_event_id='evt_123')
+    assert queued.status == 'pending'
+    assert queued.event_type == 'invoice.payment_failed'
+    assert queued.payload['data']['object']['id'] == 'in_123'
+    mock_handler.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch('stripe.Webhook.construct_event', side_effect=ValueError('bad'))
+def test_webhook_view_rejects_invalid_payload(mock_construct, client):
+    """
+    Events failing signature verification are not queued.
+    """
+    response = client.post(
+        reverse('stripe_webhook'),
+        data='not json',
+        content_type='application/json',
+        HTTP_STRIPE_SIGNATURE='sig'
+    )
+
+    assert response.status_code == 400
+    assert not WebhookEvent.objects.exists()
+
+
+@pytest.mark.django_db
+@patch('stripe.Customer.retrieve')
+@patch('stripe.Webhook.construct_event')
+def test_webhook_view_ignores_redelivery(
+    mock_construct, mock_customer, client
+):
+    """
+    A redelivered event id is acknowledged without being queued again.
+    """
+    event = make_event()
+    mock_construct.return_value = event
+
+    for _ in range(3):
+        response = client.post(
+            reverse('stripe_webhook'),
+            data=json.dumps(event),
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='sig'
+        )
+        assert response.status_code == 200
+
+    assert WebhookEvent.objects.filter(stripe_event_id='evt_123').count() == 1
+    mock_customer.assert_not_called()
+
+
+# ============================
+# IDEMPOTENCY LEDGER
+# ============================
+
+@pytest.mark.django_db
+def test_enqueue_event_deduplicates_on_event_id():
+    """
+    Only the first delivery of an event id is stored.
+    """
+    first, created = enqueue_event(make_event())
+    duplicate, duplicate_created = enqueue_event(make_event())
+
+    assert created
+    assert first.pk
+    assert duplicate is None
+    assert not duplicate_created
+    assert WebhookEvent.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_ledger_counts_hits_and_misses():
+    """
+    Hit/miss counters expose the redelivery rate.
+    """
+    enqueue_event(make_event('evt_1'))
+    enqueue_event(make_event('evt_2'))
+    enqueue_event(make_event('evt_1'))
+    enqueue_event(make_event('evt_1'))
+
+    stats = ledger_stats()
+
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['redelivery_rate'] == 0.5
+    # The test settings use the database cache, whose increments can race
+    assert stats['approximate']
+
+
+@pytest.mark.django_db
+def test_duplicate_of_processed_event_is_not_reprocessed():
+    """
+    Redelivery after processing does not run the handler again.
+    """
+    received = []
+    enqueue_event(make_event())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': received.append}
+    ):
+        drain()
+        enqueue_event(make_event())
+        drain()
+
+    assert len(received) == 1
+
+
+# ============================
+# WORKER
+# ============================
+
+@pytest.mark.django_db
+def test_drain_processes_events_with_handlers():
+    """
+    Draining runs the handler and records status, attempts and timings.
+    """
+    enqueue_event(make_event())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': lambda data: None}
+    ):
+        assert drain() == 1
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_123')
+    assert event.status == 'processed'
+    assert event.attempts == 1
+    assert event.processed_at is not None
+    assert event.duration_ms is not None
+
+
+@pytest.mark.django_db
+def test_drain_passes_data_object_to_handler():
+    """
+    The handler receives the event's data object, as the view used to do.
+    """
+    received = []
+    enqueue_event(make_event())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': received.append}
+    ):
+        drain()
+
+    assert len(received) == 1
+    assert received[0]['customer'] == 'cus_123'
+
+
+def explode(data):
+    raise RuntimeError("Stripe is down")
+
+
+@pytest.mark.django_db
+def test_drain_retries_handler_failure_with_backoff():
+    """
+    An exception from a handler parks the event for a later retry.
+    """
+    enqueue_event(make_event())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': explode}
+    ):
+        drain()
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_123')
+    assert event.status == 'deferred'
+    assert 'Stripe is down' in event.last_error
+    assert event.retry_after > timezone.now()
+    assert not DeadLetterEvent.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(WEBHOOK_RETRY_MAX_ATTEMPTS=1)
+def test_drain_dead_letters_after_max_attempts():
+    """
+    Once retries run out the event is failed and dead-lettered with the
+    error, traceback and attempt count.
+    """
+    enqueue_event(make_event())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': explode}
+    ):
+        drain()
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_123')
+    assert event.status == 'failed'
+    dead_letter = event.dead_letter
+    assert dead_letter.status == 'open'
+    assert dead_letter.error == 'Stripe is down'
+    assert 'RuntimeError' in dead_letter.traceback
+    assert dead_letter.attempts == 1
+    assert dead_letter.payload['id'] == 'evt_123'
+
+
+@pytest.mark.django_db
+@override_settings(WEBHOOK_RETRY_MAX_ATTEMPTS=1)
+@patch('hobbyhub.stripe_handlers.send_payment_failed_email')
+def test_handler_errors_are_no_longer_swallowed(mock_send):
+    """
+    A failing Stripe handler surfaces its error instead of only logging.
+    """
+    mock_send.side_effect = RuntimeError("SMTP unavailable")
+    user = User.objects.create(username="payer", email="payer@example.com")
+    UserProfile.objects.update_or_create(
+        user=user,
+        defaults={'stripe_customer_id': 'cus_123'}
+    )
+    enqueue_event(make_event())
+
+    drain()
+
+    dead_letter = DeadLetterEvent.objects.get()
+    assert dead_letter.error == 'SMTP unavailable'
+
+
+@pytest.mark.django_db
+def test_ignored_event_types_are_marked_processed():
+    """
+    Unknown event types are acknowledged and not retried.
+    """
+    enqueue_event(make_event(event_type='customer.created'))
+
+    drain()
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_123')
+    assert event.status == 'processed'
+
+
+@pytest.mark.django_db
+def test_claim_reclaims_stale_processing_events():
+    """
+    Events abandoned mid-processing are picked up again after the lease.
+    """
+    event, _ = enqueue_event(make_event())
+    WebhookEvent.objects.filter(id=event.id).update(
+        status='processing',
+        attempts=1,
+        started_at=timezone.now() - timedelta(hours=1)
+    )
+
+    claimed = claim_events()
+
+    assert [e.id for e in claimed] == [event.id]
+    assert claimed[0].attempts == 2
+
+
+@pytest.mark.django_db
+def test_claim_skips_in_flight_events():
+    """
+    Events currently being processed by another worker are not claimed.
+    """
+    event, _ = enqueue_event(make_event())
+    WebhookEvent.objects.filter(id=event.id).update(
+        status='processing',
+        started_at=timezone.now()
+    )
+
+    assert claim_events() == []
+
+
+@pytest.mark.django_db
+def test_process_webhooks_command_once():
+    """
+    The management command drains the inbox and exits with --once.
+    """
+    enqueue_event(make_event(event_type='customer.created'))
+
+    call_command('process_webhooks', '--once')
+
+    assert WebhookEvent.objects.get().status == 'processed'
+
+
+# ============================
+# DEAD LETTERS
+# ============================
+
+@pytest.fixture
+def dead_lettered():
+    """
+    An event that has been dead-lettered after failing.
+    """
+    enqueue_event(make_event())
+    with override_settings(WEBHOOK_RETRY_MAX_ATTEMPTS=1), patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': explode}
+    ):
+        drain()
+    return DeadLetterEvent.objects.get()
+
+
+@pytest.mark.django_db
+def test_replayed_dead_letter_is_resolved_on_success(dead_lettered):
+    """
+    A replay re-runs the event through the worker and records the outcome.
+    """
+    replay = replay_dead_letters(DeadLetterEvent.objects.all())
+
+    event = WebhookEvent.objects.get()
+    assert event.status == 'pending'
+    assert event.attempts == 0
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': lambda data: None}
+    ):
+        assert drain() == 1
+
+    dead_lettered.refresh_from_db()
+    assert dead_lettered.status == 'resolved'
+    assert dead_lettered.replayed_at is not None
+    assert WebhookEvent.objects.get().status == 'processed'
+    stats = replay.stats()
+    assert stats['resolved'] == 1
+    assert stats['waiting'] == 0
+
+
+@pytest.mark.django_db
+def test_failed_replay_reopens_dead_letter_without_retries(dead_lettered):
+    """
+    A replay gets one attempt; failing again puts it straight back.
+    """
+    replay = replay_dead_letters(DeadLetterEvent.objects.all())
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': explode}
+    ):
+        drain()
+
+    dead_lettered.refresh_from_db()
+    assert dead_lettered.status == 'open'
+    assert dead_lettered.replay == replay
+    assert dead_lettered.replayed_at is not None
+    assert WebhookEvent.objects.get().status == 'failed'
+    assert replay.stats()['failed'] == 1
+
+
+@pytest.mark.django_db
+def test_replay_skips_dead_letters_already_replaying(dead_lettered):
+    """
+    Only open dead letters are queued, so a replay is not doubled up.
+    """
+    assert replay_dead_letters(DeadLetterEvent.objects.all()) is not None
+    assert replay_dead_letters(DeadLetterEvent.objects.all()) is None
+
+
+# ============================
+# PARTITIONED WORKERS
+# ============================
+
+def customers_in_partitions(count):
+    """
+    Returns one customer id per partition for `count` workers.
+    """
+    customers = {}
+    n = 0
+    while len(customers) < count:
+        customer = f"cus_{n}"
+        index = partition_hash_for(customer, '') % count
+        customers.setdefault(index, customer)
+        n += 1
+    return [customers[index] for index in range(count)]
+
+
+@pytest.mark.django_db
+def test_enqueue_event_records_partition():
+    """
+    Events are keyed on their Stripe customer.
+    """
+    event, _ = enqueue_event(make_event())
+
+    assert event.partition_key == 'cus_123'
+    assert event.partition_hash == partition_hash_for('cus_123', 'evt_123')
+
+
+@pytest.mark.django_db
+def test_claim_only_takes_own_partition():
+    """
+    Each worker only claims events hashed to its partition.
+    """
+    first, second = customers_in_partitions(2)
+    enqueue_event(make_event('evt_1', customer=first))
+    enqueue_event(make_event('evt_2', customer=second))
+
+    claimed = claim_events(partition=(1, 2))
+
+    assert [e.stripe_event_id for e in claimed] == ['evt_2']
+    assert WebhookEvent.objects.get(stripe_event_id='evt_1').status == (
+        'pending'
+    )
+
+
+@pytest.mark.django_db
+def test_claim_with_id_prefix_leaves_other_events():
+    """
+    The benchmark's workers only claim its synthetic events, so a real
+    event arriving mid-run is left for the real handlers.
+    """
+    enqueue_event(make_event('evt_bench_1', customer='cus_bench'))
+    enqueue_event(make_event('evt_real', customer='cus_real'))
+
+    claimed = claim_events(id_prefix='evt_bench_')
+
+    assert [e.stripe_event_id for e in claimed] == ['evt_bench_1']
+    assert WebhookEvent.objects.get(stripe_event_id='evt_real').status == (
+        'pending'
+    )
+
+
+@pytest.mark.django_db
+def test_claim_holds_back_events_behind_deferred_event():
+    """
+    A customer's later events wait while an earlier one is deferred.
+    """
+    deferred, _ = enqueue_event(make_event('evt_1'))
+    WebhookEvent.objects.filter(id=deferred.id).update(
+        status='deferred',
+        retry_after=timezone.now() + timedelta(minutes=5)
+    )
+    enqueue_event(make_event('evt_2'))
+    enqueue_event(make_event('evt_3', customer='cus_other'))
+
+    claimed = claim_events()
+
+    assert [e.stripe_event_id for e in claimed] == ['evt_3']
+
+
+@pytest.mark.django_db
+def test_drain_releases_batch_events_after_deferral():
+    """
+    If an event defers mid-batch, that customer's later events are
+    released instead of running ahead of it.
+    """
+    handled = []
+
+    def handler(data):
+        handled.append(data['id'])
+        if not handled[1:]:
+            raise DeferEvent("Not yet")
+
+    enqueue_event(make_event('evt_1'))
+    enqueue_event(make_event('evt_2'))
+
+    with patch.dict(
+        'hobbyhub.stripe_handlers.EVENT_HANDLERS',
+        {'invoice.payment_failed': handler}
+    ):
+        assert drain() == 1
+
+    assert handled == ['in_123']
+    later = WebhookEvent.objects.get(stripe_event_id='evt_2')
+    assert later.status == 'pending'
+    assert later.attempts == 0
+
+
+@pytest.mark.django_db
+def test_partition_lag_reports_depth_and_gauge():
+    """
+    Per-partition backlog is reported and claims record a lag gauge.
+    """
+    first, second = customers_in_partitions(2)
+    enqueue_event(make_event('evt_1', customer=first))
+    enqueue_event(make_event('evt_2', customer=first))
+
+    lag = partition_lag(2)
+
+    assert lag[0]['depth'] == 2
+    assert lag[1] == {'depth': 0, 'lag_seconds': 0.0}
+
+    claim_events(partition=(0, 2))
+    assert metrics.get_value(PARTITION_LAG.format(0), None) is not None
+
+
+# ============================
+# CATCH-UP SYNC
+# ============================
+
+@pytest.fixture
+def sync_customer(django_user_model):
+    """
+    The user the fixture events belong to.
+    """
+    user = django_user_model.objects.create(
+        username="synced",
+        email="synced@example.com"
+    )
+    UserProfile.objects.update_or_create(
+        user=user,
+        defaults={'stripe_customer_id': 'cus_sync'}
+    )
+    return user
+
+
+def sync_from_fixture(*args):
+    call_command(
+        'sync_stripe_events',
+        '--from-file', EVENTS_FIXTURE,
+        *args
+    )
+
+
+@pytest.mark.django_db
+def test_enqueue_events_skips_known_ids():
+    """
+    Bulk enqueue only inserts events not already in the ledger.
+    """
+    enqueue_event(make_event('evt_1'))
+
+    queued = enqueue_events([
+        make_event('evt_1'),
+        make_event('evt_2'),
+        make_event('evt_2'),
+    ])
+
+    assert queued == 1
+    assert WebhookEvent.objects.count() == 2
+    assert ledger_stats()['hits'] == 2
+
+
+@pytest.mark.django_db
+def test_sync_replays_events_through_handlers(sync_customer):
+    """
+    Fixture events are queued and handled as if delivered by webhook.
+    """
+    sync_from_fixture('--since', '2025-05-01')
+    send_queued_emails()
+
+    assert WebhookEvent.objects.count() == 4
+    assert set(
+        WebhookEvent.objects.values_list('status', flat=True)
+    ) == {'processed'}
+    # Two renewal reminders and one payment failure
+    assert len(mail.outbox) == 3
+    assert all(m.to == ['synced@example.com'] for m in mail.outbox)
+
+
+@pytest.mark.django_db
+def test_sync_skips_already_processed_events(sync_customer):
+    """
+    Events already received by webhook are not handled again.
+    """
+    with open(EVENTS_FIXTURE) as f:
+        enqueue_event(json.loads(f.readline()))
+    WebhookEvent.objects.update(status='processed')
+
+    sync_from_fixture('--since', '2025-05-01')
+    send_queued_emails()
+
+    assert WebhookEvent.objects.count() == 4
+    assert len(mail.outbox) == 2
+
+
+@pytest.mark.django_db
+def test_sync_resumes_from_saved_cursor(sync_customer, capsys):
+    """
+    The cursor is saved, and a run without --since resumes from it.
+    """
+    sync_from_fixture('--since', '2025-05-01', '--window', '86400')
+
+    cursor = StripeEventCursor.objects.get()
+    assert cursor.last_event_id == 'evt_sync_4'
+    assert cursor.synced_until.timestamp() == 1746200001
+
+    mail.outbox.clear()
+    OutboundEmail.objects.all().delete()
+    sync_from_fixture()
+    send_queued_emails()
+
+    assert "queued 0 new" in capsys.readouterr().out
+    assert mail.outbox == []
+
+
+@pytest.mark.django_db
+def test_sync_from_since_only_takes_newer_events(sync_customer):
+    """
+    Events created before --since are not replayed.
+    """
+    sync_from_fixture('--since', '2025-05-02T12:00:00')
+
+    assert set(
+        WebhookEvent.objects.values_list('stripe_event_id', flat=True)
+    ) == {'evt_sync_3', 'evt_sync_4'}
+
+
+@pytest.mark.django_db
+def test_sync_requires_since_on_first_run():
+    """
+    Without a cursor there is nowhere to resume from.
+    """
+    with pytest.raises(CommandError):
+        sync_from_fixture()
+
+
+@pytest.mark.django_db
+@patch('stripe.Event.list')
+def test_sync_pages_stripe_api_by_window(mock_list, sync_customer):
+    """
+    Without --from-file each window is fetched from Stripe's event list.
+    """
+    mock_list.return_value.auto_paging_iter.return_value = []
+
+    call_command('sync_stripe_events', '--since', '3h', '--window', '3600')
+
+    assert mock_list.call_count == 3
+    first = mock_list.call_args_list[0].kwargs['created']
+    assert first['lt'] - first['gte'] == 3600
+
+
+# ============================
+# DEFERRED RETRIES
+# ============================
+
+@pytest.fixture
+def checkout_user(django_user_model):
+    """
+    A user with a shipping address, ready to check out.
+    """
+    user = django_user_model.objects.create(
+        username="buyer",
+        email="buyer@example.com"
+    )
+    address = ShippingAddress.objects.create(
+        user=user,
+        address_line_1="123 Test Street",
+        town_or_city="Test City",
+        postcode="TE57 1NG",
+        country="GB"
+    )
+    return user, address
+
+
+@pytest.mark.django_db
+@override_settings(
+    WEBHOOK_DEFER_BASE_SECONDS=30,
+    WEBHOOK_DEFER_MAX_SECONDS=300
+)
+def test_backoff_delay_is_exponential_and_bounded():
+    """
+    Backoff doubles per attempt and never exceeds the configured cap.
+    """
+    assert backoff_delay(1) == 30
+    assert backoff_delay(2) == 60
+    assert backoff_delay(3) == 120
+    assert backoff_delay(10) == 300
+
+
+@pytest.mark.django_db
+@patch('stripe.PaymentIntent.retrieve')
+def test_checkout_without_box_is_deferred(mock_intent, checkout_user):
+    """
+    A one-off checkout with no active box is parked instead of sleeping.
+    """
+    user, address = checkout_user
+    enqueue_event(make_checkout_event(user, address))
+
+    drain()
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_checkout')
+    assert event.status == 'deferred'
+    assert event.retry_after > timezone.now()
+    assert not Order.objects.exists()
+    assert metrics.get_value(DEFERRED_NO_BOX) == 1
+    mock_intent.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch('stripe.PaymentIntent.retrieve')
+def test_deferred_checkout_retries_once_box_exists(
+    mock_intent, checkout_user
+):
+    """
+    Once the retry time passes and a box exists, the order is created.
+    """
+    mock_intent.return_value = stripe_intent()
+    user, address = checkout_user
+    enqueue_event(make_checkout_event(user, address))
+    drain()
+
+    box = Box.objects.create(
+        name="October Box",
+        slug="october-box",
+        shipping_date=timezone.now().date()
+    )
+    WebhookEvent.objects.update(retry_after=timezone.now())
+    drain()
+
+    event = WebhookEvent.objects.get(stripe_event_id='evt_checkout')
+    assert event.status == 'processed'
+    assert event.attempts == 2
+    assert Order.objects.get(stripe_payment_intent_id='pi_123').box == box
+
+
+@pytest.mark.django_db
+@override_settings(WEBHOOK_DEFER_MAX_ATTEMPTS=1)
+@patch('stripe.PaymentIntent.retrieve')
+def test_checkout_created_without_box_after_max_attempts(
+    mock_intent, checkout_user
+):
+    """
+    When retries are exhausted the order is created without a box.
+    """
+    mock_intent.return_value = stripe_intent()
+    user, address = checkout_user
+    enqueue_event(make_checkout_event(user, address))
+
+    drain()
+
+    assert WebhookEvent.objects.get().status == 'processed'
+    assert Order.objects.get(stripe_payment_intent_id='pi_123').box is None
+
+
+# ============================
+# EMAIL DEDUPLICATION
+# ============================
+
+@pytest.mark.django_db
+def test_redelivered_subscription_checkout_emails_once(checkout_user):
+    """
+    A checkout redelivered under a new event id queues one confirmation.
+    """
+    user, address = checkout_user
+    session = {
+        'object': 'checkout.session',
+        'id': 'cs_sub',
+        'mode': 'subscription',
+        'subscription': 'sub_dedup',
+        'metadata': {
+            'user_id': str(user.id),
+            'shipping_address_id': str(address.id),
+            'price_id': 'price_m',
+        },
+    }
+    for event_id in ('evt_sub_1', 'evt_sub_2'):
+        enqueue_event({
+            'id': event_id,
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': session},
+        })
+
+    drain()
+
+    assert WebhookEvent.objects.filter(status='processed').count() == 2
+    emails = OutboundEmail.objects.filter(subject="Subscription Confirmed")
+    assert emails.count() == 1
+    assert metrics.get_value(DEDUP_SUPPRESSED) == 1
+
+
+# ============================
+# SUBSCRIPTION STATE
+# ============================
+
+def make_subscription_event(event_id, event_type, sub_id, **fields):
+    """
+    Builds a customer.subscription.* event for `sub_id`.
+    """
+    subscription = {
+        'object': 'subscription',
+        'id': sub_id,
+        'customer': 'cus_state',
+        'status': 'active',
+        'cancel_at_period_end': False,
+        'items': {'data': [{'current_period_end': 1767225600}]},
+    }
+    subscription.update(fields)
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {'object': subscription},
+    }
+
+
+@pytest.fixture
+def subscription_meta(checkout_user):
+    user, address = checkout_user
+    return StripeSubscriptionMeta.objects.create(
+        user=user,
+        stripe_subscription_id='sub_state',
+        stripe_price_id='price_m',
+        shipping_address=address
+    )
+
+
+@pytest.mark.django_db
+def test_subscription_updated_stores_period_and_status(subscription_meta):
+    """
+    An updated subscription's status and period end are stored locally.
+    """
+    enqueue_event(make_subscription_event(
+        'evt_sub_up', 'customer.subscription.updated', 'sub_state',
+        status='past_due'
+    ))
+    drain()
+
+    subscription_meta.refresh_from_db()
+    assert subscription_meta.status == 'past_due'
+    assert subscription_meta.current_period_end == datetime(
+        2026, 1, 1, tzinfo=dt_timezone.utc
+    )
+    assert subscription_meta.cancel_at_period_end is False
+    assert subscription_meta.synced_at is not None
+    assert subscription_meta.cancelled_at is None
+
+
+@pytest.mark.django_db
+def test_subscription_cancelled_in_stripe_is_marked_cancelled(
+    subscription_meta
+):
+    """
+    Cancelling at period end, then deletion, mark the subscription
+    cancelled with the date Stripe recorded.
+    """
+    enqueue_event(make_subscription_event(
+        'evt_sub_cancel', 'customer.subscription.updated', 'sub_state',
+        cancel_at_period_end=True, canceled_at=1764547200
+    ))
+    enqueue_event(make_subscription_event(
+        'evt_sub_del', 'customer.subscription.deleted', 'sub_state',
+        status='canceled', canceled_at=1764547200
+    ))
+    drain()
+
+    subscription_meta.refresh_from_db()
+    assert subscription_meta.status == 'canceled'
+    assert subscription_meta.cancelled_at == datetime(
+        2025, 12, 1, tzinfo=dt_timezone.utc
+    )
+
+
+@pytest.mark.django_db
+def test_subscription_event_for_unknown_subscription_is_skipped():
+    """
+    Events for subscriptions checkout has not recorded yet are processed
+    without creating anything.
+    """
+    enqueue_event(make_subscription_event(
+        'evt_sub_new', 'customer.subscription.created', 'sub_unknown'
+    ))
+    drain()
+
+    assert WebhookEvent.objects.get().status == 'processed'
+    assert not StripeSubscriptionMeta.objects.exists()
+
+
+@pytest.mark.django_db
+def test_subscription_resumed_in_stripe_is_no_longer_cancelled(
+    subscription_meta
+):
+    """
+    A subscription set to cancel at period end, then resumed, is live
+    again and keeps being refreshed from Stripe.
+    """
+    enqueue_event(make_subscription_event(
+        'evt_sub_cancel', 'customer.subscription.updated', 'sub_state',
+        cancel_at_period_end=True, canceled_at=1764547200
+    ))
+    drain()
+    subscription_meta.refresh_from_db()
+    assert subscription_meta.cancelled_at is not None
+
+    enqueue_event(make_subscription_event(
+        'evt_sub_resume', 'customer.subscription.updated', 'sub_state',
+        cancel_at_period_end=False, canceled_at=None
+    ))
+    drain()
+
+    subscription_meta.refresh_from_db()
+    assert subscription_meta.status == 'active'
+    assert subscription_meta.cancel_at_period_end is False
+    assert subscription_meta.cancelled_at is None
+    later = subscription_meta.synced_at + timedelta(
+        seconds=settings.STRIPE_SUBSCRIPTION_SYNC_TTL_SECONDS + 1
+    )
+    assert subscription_needs_sync(subscription_meta, now=later)
@@ -20,8 +20,11 @@ from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from datetime import datetime
+from hobbyhub import metrics
 from hobbyhub.mail import send_subscription_cancelled_email
+from hobbyhub.stripe_handlers import (SUBSCRIPTION_STATE_HIT,
+                                      subscription_needs_sync,
+                                      sync_subscription_states)
 from hobbyhub.utils import (alert, build_shipping_details, get_gift_metadata,
                             get_subscription_duration_display,
                             get_subscription_status,
@@ -165,6 +168,7 @@ def gift_message(request, plan):
                 # Hardcode is_gift to true if the session holds it
                 is_gift = request.session.get('is_gift', False)
                 gift_metadata['gift'] = 'true' if is_gift else 'false'
+                gift_metadata['price_id'] = price_id
 
                 logger.info(
                     "[STRIPE CHECKOUT] Metadata before submission: "
@@ -339,7 +343,9 @@ def create_subscription_checkout(request, price_id):
         'recipient_name': recipient_name,
         'recipient_email': recipient_email,
         'sender_name': sender_name,
-        'gift_message': gift_message
+        'gift_message': gift_message,
+        # Lets the webhook skip fetching the subscription for its price
+        'price_id': price_id,
     }
 
     # Add debug log after metadata is complete
@@ -455,78 +461,43 @@ def order_cancel(request):
 
 @login_required
 def order_history(request):
+    """
+    Shows the user's subscription and one-off orders.
+
+    Renewal dates come from the subscription state stored locally, which
+    webhooks keep current. Stripe is only asked about live subscriptions
+    whose stored copy is older than the sync TTL, all at once and within
+    a deadline, so a slow Stripe cannot hold up the page.
+    """
     all_orders = list(Order.objects.select_related("shipping_address").filter(
         user=request.user
     ).order_by('-order_date', '-id'))
 
     payments = Payment.objects.filter(order__in=all_orders)
-    subscriptions = StripeSubscriptionMeta.objects.filter(user=request.user)
+    subscriptions = list(
+        StripeSubscriptionMeta.objects.filter(user=request.user)
+    )
+
+    # Stale subscriptions are fetched together; any that miss the deadline
+    # show their stored values marked as refreshing
+    stale = [sub for sub in subscriptions if subscription_needs_sync(sub)]
+    refreshing = sync_subscription_states(stale) if stale else set()
+    if len(subscriptions) > len(stale):
+        metrics.increment(
+            SUBSCRIPTION_STATE_HIT, len(subscriptions) - len(stale)
+        )
 
     sub_map = {}
 
     for sub in subscriptions:
-        try:
-            stripe_subscription = stripe.Subscription.retrieve(
-                sub.stripe_subscription_id,
-                expand=["latest_invoice"]
-            )
-
-            logger.info(
-                "[SUBSCRIPTION DEBUG] Full Stripe subscription object: "
-                f"{stripe_subscription}")
-
-            # Attempt to retrieve `current_period_end`
-            current_period_end = None
-
-            # First, try to get it from the subscription items
-            if "items" in stripe_subscription and len(
-                stripe_subscription["items"]["data"]
-            ) > 0:
-                current_period_end = (
-                    stripe_subscription["items"]["data"][0]
-                    .get("current_period_end")
-                )
-
-            # If it wasn't found, fallback to `billing_cycle_anchor`
-            if not current_period_end:
-                current_period_end = stripe_subscription.get(
-                    "billing_cycle_anchor"
-                )
-
-            if current_period_end:
-                current_period_end = datetime.fromtimestamp(current_period_end)
-                logger.info(
-                    "[SUBSCRIPTION DEBUG] Found current_period_end for "
-                    f"{sub.stripe_subscription_id}: {current_period_end}"
-                )
-            else:
-                current_period_end = "Not Available"
-                logger.warning(
-                    "[SUBSCRIPTION DEBUG] No current_period_end found for "
-                    f"{sub.stripe_subscription_id}"
-                )
-
-            # Populate the sub_map with additional data
-            sub_map[sub.stripe_subscription_id] = {
-                'sub': sub,
-                'label': get_subscription_duration_display(sub),
-                'status': get_subscription_status(sub),
-                'is_gift': sub.is_gift,
-                'current_period_end': current_period_end
-            }
-
-        except Exception as e:
-            logger.error(
-                "Failed to retrieve subscription "
-                f"{sub.stripe_subscription_id}: {e}"
-            )
-            sub_map[sub.stripe_subscription_id] = {
-                'sub': sub,
-                'label': get_subscription_duration_display(sub),
-                'status': get_subscription_status(sub),
-                'is_gift': sub.is_gift,
-                'current_period_end': None  # Set to None if fetch fails
-            }
+        sub_map[sub.stripe_subscription_id] = {
+            'sub': sub,
+            'label': get_subscription_duration_display(sub),
+            'status': get_subscription_status(sub),
+            'is_gift': sub.is_gift,
+            'current_period_end': sub.current_period_end,
+            'refreshing': sub.stripe_subscription_id in refreshing,
+        }
 
     payments_by_order = {p.order_id: p for p in payments}
 
@@ -577,6 +548,7 @@ def secure_cancel_subscription(request):
             )
 
             sub.cancelled_at = timezone.now()
+            sub.cancel_at_period_end = True
             sub.save()
 
             send_subscription_cancelled_email(
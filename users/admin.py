@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ShippingAddress
+from .models import EmailSendLedger, OutboundEmail, ShippingAddress
 
 
 @admin.register(ShippingAddress)
@@ -27,3 +27,24 @@ class ShippingAddressAdmin(admin.ModelAdmin):
             obj.user, 'profile'
         ) else 'N/A'
     get_stripe_customer_id.short_description = 'Stripe Customer ID'
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = (
+        'subject',
+        'recipient',
+        'status',
+        'attempts',
+        'created_at',
+        'sent_at',
+    )
+    list_filter = ('status',)
+    search_fields = ('recipient', 'subject')
+
+
+@admin.register(EmailSendLedger)
+class EmailSendLedgerAdmin(admin.ModelAdmin):
+    list_display = ('template', 'recipient', 'business_key', 'sent_at')
+    list_filter = ('template',)
+    search_fields = ('recipient', 'business_key')
@@ -0,0 +1,83 @@
+"""
+Links existing users to their Stripe customers.
+
+Webhook handlers resolve invoices to users through
+`UserProfile.stripe_customer_id`. This fills in profiles that are missing
+or have no customer ID by looking the user's email up in Stripe, so those
+lookups no longer need a network round trip.
+
+Usage:
+    python manage.py backfill_stripe_customers [--dry-run]
+"""
+import logging
+
+import stripe
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from users.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Populate UserProfile.stripe_customer_id from Stripe by email."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be linked without saving."
+        )
+
+    def handle(self, *args, **options):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        dry_run = options['dry_run']
+
+        users = (
+            User.objects
+            .filter(
+                Q(profile__isnull=True)
+                | Q(profile__stripe_customer_id__isnull=True)
+            )
+            .exclude(email='')
+            .order_by('id')
+        )
+
+        linked = skipped = 0
+        for user in users.iterator():
+            customers = stripe.Customer.list(email=user.email, limit=1)
+            if not customers.data:
+                skipped += 1
+                logger.info(f"No Stripe customer for {user.email}")
+                continue
+
+            customer_id = customers.data[0].id
+            if dry_run:
+                self.stdout.write(f"Would link {user} -> {customer_id}")
+                linked += 1
+                continue
+
+            try:
+                with transaction.atomic():
+                    profile, _ = UserProfile.objects.get_or_create(user=user)
+                    profile.stripe_customer_id = customer_id
+                    profile.save(update_fields=['stripe_customer_id'])
+            except IntegrityError:
+                skipped += 1
+                logger.warning(
+                    f"Stripe customer {customer_id} is already linked to "
+                    f"another user; skipping {user}"
+                )
+                continue
+
+            linked += 1
+            logger.info(f"Linked {user} to Stripe customer {customer_id}")
+
+        self.stdout.write(
+            f"{'Would link' if dry_run else 'Linked'} {linked} user(s), "
+            f"skipped {skipped}."
+        )
@@ -0,0 +1,107 @@
+"""
+Compares the cost of building email bodies.
+
+Renders the shipping confirmation for many recipients three ways:
+the old hand-built f-string (text only), the templates loaded and
+compiled on every send, and `render_email` with its per-process cache.
+
+Usage:
+    python manage.py benchmark_email_render
+    python manage.py benchmark_email_render --messages 50000
+"""
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine, TemplateDoesNotExist
+
+from hobbyhub.email_templates import LAYOUT, get_email_templates, render_email
+
+TEMPLATE = 'shipping_confirmation'
+
+
+def fstring_body(user, box_name, tracking_number):
+    """
+    The shipping confirmation as it was built before templates.
+    """
+    tracking_info = (
+        f"\nTracking Number: {tracking_number}" if tracking_number else ""
+    )
+    return (
+        f"Hi {user.username},\n\n"
+        f"Your {box_name} box has shipped and is on its way!"
+        f"{tracking_info}\n\n"
+        "Thanks for being part of the Hobby Hub community."
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmark email rendering against the old f-string bodies."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=10000,
+            help="Messages rendered per approach (default 10000)."
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        contexts = [
+            {
+                'user': SimpleNamespace(username=f"member{i}"),
+                'box_name': "October",
+                'tracking_number': f"TRK{i:08d}" if i % 2 else None,
+            }
+            for i in range(count)
+        ]
+        uncached = Engine(
+            dirs=[settings.BASE_DIR / 'templates' / 'emails'],
+            loaders=['hobbyhub.email_templates.InlineCSSLoader'],
+        )
+
+        def fstrings():
+            for context in contexts:
+                fstring_body(**context)
+
+        def compiled_per_send():
+            for context in contexts:
+                text = uncached.get_template(f'{TEMPLATE}.txt').render(
+                    Context(context, autoescape=False)
+                ).strip()
+                try:
+                    html_template = uncached.get_template(f'{TEMPLATE}.html')
+                except TemplateDoesNotExist:
+                    html_template = uncached.get_template(LAYOUT)
+                html_template.render(Context({**context, 'body': text}))
+
+        def cached():
+            for context in contexts:
+                render_email(TEMPLATE, context)
+
+        # First render compiles and inlines; time it on its own
+        get_email_templates.cache_clear()
+        started = time.perf_counter()
+        get_email_templates(TEMPLATE)
+        warmup = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Rendering {count} '{TEMPLATE}' email(s) per approach "
+            f"(first compile took {warmup * 1000:.1f}ms)"
+        )
+        for label, run in (
+            ("f-string, text only", fstrings),
+            ("templates compiled per send", compiled_per_send),
+            ("cached templates, text + HTML", cached),
+        ):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            per_10k = elapsed / count * 10000 if count else 0
+            self.stdout.write(
+                f"  {label:<32} {elapsed:8.3f}s total, "
+                f"{per_10k:8.3f}s per 10k, "
+                f"{elapsed / count * 1e6 if count else 0:8.1f}us each"
+            )
@@ -0,0 +1,71 @@
+"""
+Sends emails queued in the transactional outbox.
+
+Usage:
+    python manage.py send_queued_emails            # run forever
+    python manage.py send_queued_emails --once     # drain and exit
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from hobbyhub import metrics
+from hobbyhub.outbox import (BUDGET_REMAINING_TODAY, BUDGET_TOKENS,
+                             send_queued_emails)
+from users.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Send queued transactional emails."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the outbox once and exit instead of polling."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help="Emails sent per connection "
+                 "(default EMAIL_OUTBOX_BATCH_SIZE)."
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when nothing is due."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.EMAIL_OUTBOX_BATCH_SIZE
+
+        if options['once']:
+            started = time.monotonic()
+            attempted = send_queued_emails(batch_size)
+            elapsed = time.monotonic() - started
+            waiting = OutboundEmail.objects.filter(status='pending').count()
+            rate = attempted / elapsed if elapsed else 0
+            budget = metrics.snapshot([BUDGET_TOKENS, BUDGET_REMAINING_TODAY])
+            self.stdout.write(
+                f"Attempted {attempted} email(s) in {elapsed:.2f}s "
+                f"({rate:.1f}/s); {waiting} waiting to retry or send. "
+                f"Budget: {budget[BUDGET_TOKENS]:.0f} token(s), "
+                f"{budget[BUDGET_REMAINING_TODAY]} left today."
+            )
+            return
+
+        logger.info("[OUTBOX] Dispatcher started")
+        while True:
+            close_old_connections()
+            attempted = send_queued_emails(batch_size)
+            if attempted:
+                logger.info(f"[OUTBOX] Dispatcher attempted {attempted}")
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:16
+
+from django.db import migrations, models
+
+
+def clear_blank_and_duplicate_ids(apps, schema_editor):
+    """
+    Make existing customer IDs unique-safe before adding the constraint.
+
+    Blank IDs become NULL. If two profiles share an ID, the oldest keeps it
+    and the rest are cleared so `backfill_stripe_customers` can relink them.
+    """
+    UserProfile = apps.get_model('users', 'UserProfile')
+    UserProfile.objects.filter(stripe_customer_id='').update(
+        stripe_customer_id=None
+    )
+
+    seen = set()
+    duplicates = []
+    profiles = (
+        UserProfile.objects
+        .exclude(stripe_customer_id__isnull=True)
+        .order_by('id')
+        .values_list('id', 'stripe_customer_id')
+    )
+    for profile_id, customer_id in profiles:
+        if customer_id in seen:
+            duplicates.append(profile_id)
+        seen.add(customer_id)
+
+    UserProfile.objects.filter(id__in=duplicates).update(
+        stripe_customer_id=None
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            clear_blank_and_duplicate_ids,
+            migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSendBudget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('tokens', models.FloatField(default=0)),
+                ('refilled_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('day', models.DateField(default=django.utils.timezone.localdate)),
+                ('sent_today', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
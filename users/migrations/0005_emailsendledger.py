@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_emailsendbudget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSendLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template', models.CharField(max_length=100)),
+                ('recipient', models.EmailField(max_length=254)),
+                ('business_key', models.CharField(max_length=255)),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='emailsendledger',
+            constraint=models.UniqueConstraint(fields=('template', 'recipient', 'business_key'), name='unique_email_per_business_key'),
+        ),
+    ]
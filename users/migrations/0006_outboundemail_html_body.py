@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-17 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_emailsendledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='html_body',
+            field=models.TextField(blank=True, help_text='Optional HTML alternative to the text body.'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.20 on 2026-10-17 20:05
+
+from django.db import migrations
+
+# (index name, indexed expression) for the user admin prefix search
+SEARCH_INDEXES = [
+    ('auth_user_username_upper_like',
+     'UPPER("username"::text) text_pattern_ops'),
+    ('auth_user_email_upper_like',
+     'UPPER("email"::text) text_pattern_ops'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Index the expressions `username__istartswith` and `email__istartswith`
+    compile to on Postgres, so the user admin search is an index range scan.
+
+    Other databases have no equivalent expression index and are skipped.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, expression in SEARCH_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" '
+            f'ON "auth_user" ({expression})'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_outboundemail_html_body'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
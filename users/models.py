@@ -2,11 +2,13 @@
 users/models.py
 
 Defines the ShippingAddress model, which stores user-associated delivery
-addresses for orders and subscriptions.
+addresses for orders and subscriptions, the UserProfile, the outbox of
+transactional emails and the shared email send budget.
 """
 
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from django_countries.fields import CountryField
 
 
@@ -117,12 +119,124 @@ class ShippingAddress(models.Model):
 
 
 class UserProfile(models.Model):
+    """
+    Extra per-user data, currently the linked Stripe customer.
+
+    `stripe_customer_id` is unique so webhook handlers can resolve a Stripe
+    customer to exactly one user with a single indexed lookup.
+    """
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
         related_name='profile'
     )
-    stripe_customer_id = models.CharField(max_length=50, null=True, blank=True)
+    stripe_customer_id = models.CharField(
+        max_length=50,
+        null=True,
+        blank=True,
+        unique=True
+    )
+
+    def save(self, *args, **kwargs):
+        """Store a blank customer ID as NULL so it stays unique-safe."""
+        if not self.stripe_customer_id:
+            self.stripe_customer_id = None
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
+
+
+class OutboundEmail(models.Model):
+    """
+    A transactional email queued by ``hobbyhub.mail.send_user_email``.
+
+    Rows are written in the caller's transaction, so an email is only sent
+    if the change it describes was committed. The ``send_queued_emails``
+    command sends them in the background, retrying failures with backoff
+    until ``sent`` or ``failed``.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(
+        blank=True,
+        help_text="Optional HTML alternative to the text body."
+    )
+    from_email = models.CharField(max_length=254)
+    recipient = models.EmailField()
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    send_after = models.DateTimeField(
+        default=timezone.now,
+        help_text="Not sent (or retried) before this time."
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'send_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient} - {self.status}"
+
+
+class EmailSendLedger(models.Model):
+    """
+    Records which deduplicated emails have been queued.
+
+    Keyed on (template, recipient, business key), e.g. the subscription
+    confirmation for ``sub_123`` to one address. ``hobbyhub.outbox``
+    claims a row before queueing, so a webhook redelivery cannot send the
+    same email again within ``EMAIL_DEDUP_WINDOW_SECONDS``.
+    """
+    template = models.CharField(max_length=100)
+    recipient = models.EmailField()
+    business_key = models.CharField(max_length=255)
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['template', 'recipient', 'business_key'],
+                name='unique_email_per_business_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.template} to {self.recipient} ({self.business_key})"
+
+
+class EmailSendBudget(models.Model):
+    """
+    Shared token bucket and daily counter for outbound email.
+
+    One row per provider, locked while dispatchers take from it, so every
+    process sending mail draws from the same per-second and per-day quota.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField(default=timezone.now)
+    day = models.DateField(default=timezone.localdate)
+    sent_today = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.tokens:.1f} token(s), "
+            f"{self.sent_today} sent on {self.day}"
+        )
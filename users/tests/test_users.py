@@ -1,12 +1,14 @@
 import json
+from unittest.mock import MagicMock, patch
 
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.management import call_command
 from django.test import RequestFactory, TestCase
 from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
-from users.models import ShippingAddress
+from users.models import ShippingAddress, UserProfile
 from orders.models import Order, StripeSubscriptionMeta
 
 
@@ -168,3 +170,36 @@ class ShippingAddressTest(TestCase):
         )
 
         self.assertFalse(address.can_be_deleted())
+
+
+class BackfillStripeCustomersTest(TestCase):
+
+    @patch('stripe.Customer.list')
+    def test_backfill_links_users_by_email(self, mock_list):
+        linked = User.objects.create(username="linked", email="a@example.com")
+        missing = User.objects.create(
+            username="missing",
+            email="b@example.com"
+        )
+        UserProfile.objects.update_or_create(
+            user=linked,
+            defaults={'stripe_customer_id': 'cus_existing'}
+        )
+        mock_list.return_value = MagicMock(data=[MagicMock(id='cus_new')])
+
+        call_command('backfill_stripe_customers')
+
+        self.assertEqual(
+            UserProfile.objects.get(user=missing).stripe_customer_id,
+            'cus_new'
+        )
+        mock_list.assert_called_once_with(email='b@example.com', limit=1)
+
+    def test_blank_customer_id_is_stored_as_null(self):
+        user = User.objects.create(username="blank", email="c@example.com")
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        profile.stripe_customer_id = ''
+        profile.save()
+
+        profile.refresh_from_db()
+        self.assertIsNone(profile.stripe_customer_id)
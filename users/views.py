@@ -43,14 +43,8 @@ from hobbyhub.mail import (
     send_password_reset_email
 )
 
-from hobbyhub.stripe_handlers import (
-    handle_checkout_session_completed,
-    handle_invoice_payment_failed,
-    handle_invoice_payment_succeeded,
-    handle_invoice_upcoming
-)
-
 from hobbyhub.utils import alert
+from hobbyhub.webhooks import enqueue_event
 
 from .forms import (
     AddAddressForm,
@@ -486,6 +480,9 @@ def secure_delete_address(request, address_id):
 
 @csrf_exempt
 def stripe_webhook(request):
+    """
+    Verifies a Stripe webhook and queues it for background processing.
+    """
     logger.info("Stripe webhook received")
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -501,18 +498,10 @@ def stripe_webhook(request):
         logger.warning("Invalid webhook signature or payload")
         return HttpResponse(status=400)
 
-    event_type = event['type']
-    data = event['data']['object']
-
-    if event_type == 'checkout.session.completed':
-        handle_checkout_session_completed(data)
-    elif event_type == 'invoice.payment_succeeded':
-        handle_invoice_payment_succeeded(data)
-    elif event_type == 'invoice.payment_failed':
-        handle_invoice_payment_failed(data)
-    elif event_type == 'invoice.upcoming':
-        handle_invoice_upcoming(data)
-    else:
-        logger.info(f"Ignored event type: {event_type}")
+    # Hand off to the inbox; `process_webhooks` runs the handlers.
+    # Redeliveries of an event already in the ledger are dropped here.
+    _, created = enqueue_event(json.loads(payload))
+    if created:
+        logger.info(f"Stripe webhook queued: {event['type']}")
 
     return JsonResponse({'status': 'success'})